@@ -130,15 +130,14 @@ def flash_via_mcp(workspace: str, hex_file: str, esp32_host: str = "192.168.4.1"
             print(f"✗ Hex file not found: {hex_path}")
             return False
         
-        with open(hex_path, 'r') as f:
-            hex_content = f.read()
-        print(f"✓ Loaded {len(hex_content)} bytes of hex data")
+        from stm32_mcp.image import load_image
+        image, _, _ = load_image(hex_path)
+        print(f"✓ Loaded {image.size} bytes in {len(image)} segment(s) at 0x{image.start:08X}")
         print()
         
         # Convert to binary
         print("Step 4: Converting Intel HEX to binary...")
-        from mcp_flash.stm32_flash_server import _convert_hex_to_bin
-        binary = _convert_hex_to_bin(hex_content)
+        binary = image.to_bin()
         print(f"✓ Converted to {len(binary)} bytes of binary")
         print()
         
@@ -0,0 +1,129 @@
+"""Benchmark the GCC log parser on a synthetic build log.
+
+Compares :class:`stm32_mcp.gcc_parse.LogParser` (fed in 64 KB chunks, as
+from a live stream) with the previous parser, which tried four parser
+functions per line on uncompiled patterns.  A frozen copy of that parser
+is kept below as the baseline.
+
+Usage::
+
+    python benchmarks/bench_gcc_parse.py [--lines 1000000] [--seed 1]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from stm32_mcp.gcc_parse import LogParser  # noqa: E402
+
+
+# ── previous implementation (baseline) ──────────────────────
+
+def _legacy_parse_line(line):
+    line = line.strip()
+    if not line:
+        return None
+    match = re.match(r'^(.*?):(\d+):(\d+):\s*(fatal error|error|warning|note):\s*(.+)$', line)
+    if match:
+        return ("compiler", match.group(4), match.group(1), int(match.group(2)),
+                int(match.group(3)), match.group(5).strip())
+    for pattern in (r"undefined reference to [`'](\w+)'", r"multiple definition of [`'](\w+)'",
+                    r"cannot find -(\w+)", r"section [`'](\w+)' will not fit in region [`'](\w+)'"):
+        if re.search(pattern, line):
+            return ("linker", re.search(pattern, line).group(1))
+    if "error" in line.lower() or "undefined" in line.lower():
+        return ("linker", line)
+    for pattern in (r"make:\s*\*\*\*\s*\[(.*?)\]\s*Error\s*(\d+)",
+                    r"make:\s*\*\*\*\s*No rule to make target ['\"](.+?)['\"]"):
+        if re.search(pattern, line):
+            return ("make", re.search(pattern, line).group(1))
+    if "command not found" in line:
+        return ("toolchain", line)
+    if re.search(r"arm-none-eabi-(gcc|g\+\+|ld|as):\s*error:\s*(.+)", line):
+        return ("toolchain", line)
+    return None
+
+
+def legacy_parse_build_log(log_content):
+    return [e for e in map(_legacy_parse_line, log_content.splitlines()) if e]
+
+
+# ── synthetic log ───────────────────────────────────────────
+
+_FLAGS = ("-mcpu=cortex-m4 -std=gnu11 -g3 -DDEBUG -DUSE_HAL_DRIVER -DSTM32F407xx "
+          "-ICore/Inc -IDrivers/STM32F4xx_HAL_Driver/Inc -IDrivers/CMSIS/Include "
+          "-O0 -ffunction-sections -fdata-sections -Wall -fstack-usage "
+          "-mfpu=fpv4-sp-d16 -mfloat-abi=hard -mthumb")
+
+
+def synthetic_log(lines: int, seed: int) -> str:
+    """A CubeIDE-style verbose build: mostly command echoes and warnings."""
+    rng = random.Random(seed)
+    out = []
+    while len(out) < lines:
+        src = f"Core/Src/module_{rng.randrange(400)}.c"
+        roll = rng.random()
+        out.append(f'arm-none-eabi-gcc "../{src}" {_FLAGS} -c -MMD -MP -o "{src[:-2]}.o"')
+        if roll < 0.25:
+            n = rng.randrange(1, 500)
+            out += [
+                f"../{src}: In function 'task_{n}':",
+                f"../{src}:{n}:{rng.randrange(1, 40)}: warning: unused variable 'tmp{n}' [-Wunused-variable]",
+                f"  {n} |   uint32_t tmp{n};",
+                "      |            ^~~~",
+            ]
+        elif roll < 0.27:
+            n = rng.randrange(1, 500)
+            out += [
+                f"../{src}:{n}:5: error: 'hal_{n}' undeclared (first use in this function)",
+                f"../{src}:{n}:5: note: each undeclared identifier is reported only once",
+            ]
+        elif roll < 0.28:
+            out.append(f"main.c:(.text.main+0x{rng.randrange(4096):x}): undefined reference to `init_{rng.randrange(50)}'")
+        elif roll < 0.5:
+            out.append(f"Finished building: ../{src}")
+            out.append(" ")
+    out += [
+        "arm-none-eabi-size  firmware.elf",
+        "   text    data     bss     dec     hex filename",
+        "  24512     120    3096   27728    6c50 firmware.elf",
+        "make: *** [makefile:64: firmware.elf] Error 1",
+    ]
+    return "\n".join(out[:lines]) + "\n"
+
+
+def _bench(label, lines, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:8.3f} s  {lines / elapsed:12,.0f} lines/s  {len(result):7} diagnostics")
+    return elapsed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--lines", type=int, default=1_000_000)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    log = synthetic_log(args.lines, args.seed)
+    print(f"synthetic log: {args.lines:,} lines, {len(log) / 1e6:.1f} MB")
+
+    def streamed():
+        parser = LogParser()
+        for i in range(0, len(log), 65536):
+            parser.feed(log[i:i + 65536])
+        return parser.finish()
+
+    old = _bench("legacy (4 parsers)", args.lines, lambda: legacy_parse_build_log(log))
+    new = _bench("LogParser.feed", args.lines, streamed)
+    print(f"speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
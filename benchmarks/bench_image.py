@@ -0,0 +1,98 @@
+"""Benchmark the firmware image reader on multi-megabyte Intel HEX files.
+
+Compares :func:`stm32_mcp.image.read_image` with a typical per-byte
+parser (hex pairs decoded one at a time into an address -> byte dict, then
+flattened to a binary), and reports the cost of ``to_bin``, ``write_hex``
+and a cached :func:`stm32_mcp.image.load_image` call.
+
+Usage::
+
+    python benchmarks/bench_image.py [--size-mb 4] [--gaps 8] [--seed 1]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from stm32_mcp.image import load_image, read_image, write_hex  # noqa: E402
+
+
+# ── per-byte parser (baseline) ──────────────────────────────
+
+def per_byte_hex_to_bin(text):
+    memory = {}
+    base = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith(":"):
+            continue
+        count = int(line[1:3], 16)
+        offset = int(line[3:7], 16)
+        kind = int(line[7:9], 16)
+        if kind == 0:
+            for i in range(count):
+                memory[base + offset + i] = int(line[9 + 2 * i:11 + 2 * i], 16)
+        elif kind == 1:
+            break
+        elif kind == 4:
+            base = int(line[9:13], 16) << 16
+    start, end = min(memory), max(memory) + 1
+    return bytes(memory.get(address, 0xFF) for address in range(start, end))
+
+
+# ── synthetic image ─────────────────────────────────────────
+
+def synthetic_segments(size: int, gaps: int, seed: int):
+    """*size* bytes of random firmware split into *gaps* + 1 segments."""
+    rng = random.Random(seed)
+    data = rng.randbytes(size)
+    cuts = sorted(rng.sample(range(1, size), gaps))
+    segments, address, previous = [], 0x08000000, 0
+    for cut in cuts + [size]:
+        segments.append((address, data[previous:cut]))
+        address += cut - previous + rng.randrange(4, 4096)
+        previous = cut
+    return segments
+
+
+def _bench(label, size, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.3f} s  {size / elapsed / 1e6:9.1f} MB/s")
+    return elapsed, result
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--size-mb", type=float, default=4)
+    ap.add_argument("--gaps", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    segments = synthetic_segments(size, args.gaps, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "firmware.hex"
+        _bench("write_hex", size, lambda: write_hex(segments, path))
+        print(f"synthetic image: {size / 1e6:.1f} MB in {len(segments)} segments, "
+              f"{os.path.getsize(path) / 1e6:.1f} MB of HEX")
+        text = path.read_text()
+
+        old, expected = _bench("per-byte parser", size, lambda: per_byte_hex_to_bin(text))
+        new, image = _bench("read_image", size, lambda: read_image(path))
+        _, binary = _bench("to_bin", size, image.to_bin)
+        assert binary == expected, "images differ"
+        load_image(path)
+        _bench("load_image (cached)", size, lambda: load_image(path))
+    print(f"speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,26 @@
 #
 # Runs INSIDE the Docker container.  Responsibilities:
 #   1. Copy source from read-only /src to writable /work
+#      (or, with INCREMENTAL=1, sync only changed files into a persistent
+#      /work so make's dependency tracking can skip up-to-date objects).
+#      With SYNC_LIST, only the files in that NUL-separated list (written
+#      by the host after applying the ignore rules) are copied.
+#      With WORK_MODE=overlay nothing is copied: /work/project is an
+#      overlayfs with /src as the read-only lower layer (needs
+#      CAP_SYS_ADMIN; falls back to copying if the mount fails).
 #   2. Auto-fix Makefile (Windows paths, incompatible GCC flags)
-#   3. Compile
+#   3. Compile (optionally through ccache, CCACHE=1, with per-file
+#      compile timing, PROFILE=1, and with GCC's JSON diagnostics,
+#      DIAG_FORMAT=json)
 #   4. Collect artifacts to /out
+#
+# Phase timings go to /out/phases.tsv, per-file compile timings (PROFILE=1)
+# to /out/tu-times.tsv, copy statistics to /out/.stm32mcp/sync-stats and
+# the work mode actually used to /out/.stm32mcp/work-mode.  With
+# DIAG_FORMAT=json, each compiler call with diagnostics appends one
+# {"tu": …, "diagnostics": [GCC JSON]} line to
+# /out/.stm32mcp/diagnostics.jsonl (the file exists only when the mode is
+# active); a one-line text rendering still goes to the build log.
 
 set -euo pipefail
 
@@ -17,12 +34,39 @@ PROJECT_SUBDIR="${PROJECT_SUBDIR:-}"
 MAKE_TARGET="${MAKE_TARGET:-all}"
 JOBS="${JOBS:-}"
 CLEAN="${CLEAN:-0}"
+INCREMENTAL="${INCREMENTAL:-0}"
+CCACHE="${CCACHE:-0}"
+CCACHE_DIR="${CCACHE_DIR:-/ccache}"
+CCACHE_MAXSIZE="${CCACHE_MAXSIZE:-2G}"
+PROFILE="${PROFILE:-0}"
+DIAG_FORMAT="${DIAG_FORMAT:-}"
+DIAG_FILE="${OUT_DIR}/.stm32mcp/diagnostics.jsonl"
+SYNC_LIST="${SYNC_LIST:-}"
+SYNC_STATS="${OUT_DIR}/.stm32mcp/sync-stats"
+WORK_MODE="${WORK_MODE:-copy}"
+OVERLAY_DIR="${WORK_DIR}/overlay"
+DEST="${WORK_DIR}/project"
+EFFECTIVE_MODE=copy
+WRAP_DIR="/tmp/stm32-mcp-bin"
+PHASES_FILE="${OUT_DIR}/phases.tsv"
+TU_TIMES="${OUT_DIR}/tu-times.tsv"
 
 # ── Helpers ──────────────────────────────────────────────────
 log() { echo "[$(date '+%Y-%m-%d %H:%M:%S')] $*"; }
 
+# phase_begin NAME … phase_end  →  "NAME<TAB>start<TAB>end" in PHASES_FILE
+phase_begin() { PHASE_NAME="$1"; PHASE_T0="${EPOCHREALTIME:-$(date +%s.%N)}"; }
+phase_end() {
+    printf '%s\t%s\t%s\n' "$PHASE_NAME" "$PHASE_T0" "${EPOCHREALTIME:-$(date +%s.%N)}" \
+        >> "$PHASES_FILE"
+}
+
 cleanup() {
     local ec=$?
+    if [[ "$EFFECTIVE_MODE" == "overlay" ]]; then
+        cd /
+        umount "$DEST" 2>/dev/null || true
+    fi
     log "Build script exiting with code $ec"
     exit $ec
 }
@@ -33,7 +77,7 @@ log "========================================"
 log "STM32 MCP Build Server v2.0 – start"
 log "========================================"
 log "SRC=$SRC_DIR  WORK=$WORK_DIR  OUT=$OUT_DIR"
-log "SUBDIR=$PROJECT_SUBDIR  TARGET=$MAKE_TARGET  JOBS=$JOBS  CLEAN=$CLEAN"
+log "SUBDIR=$PROJECT_SUBDIR  TARGET=$MAKE_TARGET  JOBS=$JOBS  CLEAN=$CLEAN  INCREMENTAL=$INCREMENTAL  CCACHE=$CCACHE  PROFILE=$PROFILE  DIAG_FORMAT=${DIAG_FORMAT:-text}  WORK_MODE=$WORK_MODE"
 
 if [[ ! -d "$SRC_DIR" ]]; then
     log "ERROR: source directory does not exist: $SRC_DIR"
@@ -41,12 +85,96 @@ if [[ ! -d "$SRC_DIR" ]]; then
 fi
 
 # ── 2. Prepare writable workspace ───────────────────────────
-log "Copying source to writable workspace …"
-rm -rf "${WORK_DIR}/project"
-mkdir -p "${WORK_DIR}/project"
-mkdir -p "${OUT_DIR}/artifacts"
-cp -a "${SRC_DIR}/." "${WORK_DIR}/project/"
-log "Copy complete"
+# images of a previous build (other target / subdir) must not survive
+rm -rf "${OUT_DIR}/artifacts"
+mkdir -p "${OUT_DIR}/artifacts" "${OUT_DIR}/.stm32mcp"
+rm -f "$PHASES_FILE" "$TU_TIMES" "$SYNC_STATS" "$DIAG_FILE"
+phase_begin sync
+SYNC_MANIFEST="${WORK_DIR}/.synced-files"
+FILES_COPIED=0
+BYTES_COPIED=0
+
+# NUL-separated source-relative paths of the build inputs
+list_sources() {
+    if [[ -n "$SYNC_LIST" && -f "$SYNC_LIST" ]]; then
+        cat "$SYNC_LIST"
+    else
+        find "$SRC_DIR" \( -type f -o -type l \) -printf '%P\0'
+    fi
+}
+
+# An overlay left mounted by an earlier build in this (pooled) container
+if grep -qs " ${DEST} overlay " /proc/mounts; then
+    umount "$DEST" 2>/dev/null || true
+fi
+
+if [[ "$WORK_MODE" == "overlay" ]]; then
+    # Without INCREMENTAL the upper layer (objects, fixed Makefile) starts
+    # empty; with it, objects survive and make rebuilds what changed.
+    if [[ "$INCREMENTAL" != "1" ]]; then
+        rm -rf "$OVERLAY_DIR"
+    fi
+    mkdir -p "${OVERLAY_DIR}/upper" "${OVERLAY_DIR}/work" "$DEST"
+    # A copied-up, auto-fixed Makefile would hide edits to the source one
+    rm -f "${OVERLAY_DIR}/upper/${PROJECT_SUBDIR:+${PROJECT_SUBDIR}/}Makefile"
+    if mount -t overlay overlay \
+        -o "lowerdir=${SRC_DIR},upperdir=${OVERLAY_DIR}/upper,workdir=${OVERLAY_DIR}/work" \
+        "$DEST" 2>/dev/null; then
+        EFFECTIVE_MODE=overlay
+        log "Overlay work tree mounted (upper=${OVERLAY_DIR}/upper) – nothing copied"
+    else
+        log "WARNING: overlay mount failed (needs CAP_SYS_ADMIN) – copying instead"
+    fi
+fi
+
+if [[ "$EFFECTIVE_MODE" == "overlay" ]]; then
+    :
+elif [[ "$INCREMENTAL" == "1" && -d "$DEST" ]]; then
+    log "Syncing changed files into persistent workspace …"
+    # Files that disappeared from the input list since the last sync must
+    # go too, but build outputs (never listed) have to survive.
+    list_sources | tr '\0' '\n' | LC_ALL=C sort > "${SYNC_MANIFEST}.new"
+    if [[ -f "$SYNC_MANIFEST" ]]; then
+        LC_ALL=C comm -23 "$SYNC_MANIFEST" "${SYNC_MANIFEST}.new" \
+            | while IFS= read -r gone; do
+                rm -f "${DEST}/${gone}"
+            done
+    fi
+    if command -v rsync >/dev/null 2>&1; then
+        # size + mtime quick check; -a keeps source mtimes for make
+        RSYNC_STATS="$(list_sources | rsync -a --from0 --files-from=- --stats "${SRC_DIR}/" "${DEST}/")"
+        FILES_COPIED=$(awk -F': ' '/^Number of regular files transferred/ {gsub(/,/, "", $2); print $2}' <<<"$RSYNC_STATS")
+        BYTES_COPIED=$(awk -F': ' '/^Total transferred file size/ {gsub(/[^0-9]/, "", $2); print $2}' <<<"$RSYNC_STATS")
+    else
+        # fallback: only copies files newer than the work tree's copy
+        while IFS= read -r -d '' f; do
+            if [[ ! -e "${DEST}/${f}" || "${SRC_DIR}/${f}" -nt "${DEST}/${f}" ]]; then
+                mkdir -p "$(dirname "${DEST}/${f}")"
+                cp -a "${SRC_DIR}/${f}" "${DEST}/${f}"
+                FILES_COPIED=$((FILES_COPIED + 1))
+                BYTES_COPIED=$((BYTES_COPIED + $(stat -c %s "${DEST}/${f}")))
+            fi
+        done < <(list_sources)
+    fi
+    mv "${SYNC_MANIFEST}.new" "$SYNC_MANIFEST"
+    log "Sync complete"
+else
+    log "Copying source to writable workspace …"
+    rm -rf "$DEST"
+    mkdir -p "$DEST"
+    (cd "$SRC_DIR" && list_sources | xargs -0 -r cp -a --parents -t "${DEST}/")
+    read -r FILES_COPIED BYTES_COPIED < <(
+        find "$DEST" \( -type f -o -type l \) -printf '%s\n' | awk '{n++; b+=$1} END {print n+0, b+0}'
+    )
+    if [[ "$INCREMENTAL" == "1" ]]; then
+        list_sources | tr '\0' '\n' | LC_ALL=C sort > "$SYNC_MANIFEST"
+    fi
+    log "Copy complete"
+fi
+printf 'files_copied\t%s\nbytes_copied\t%s\n' "${FILES_COPIED:-0}" "${BYTES_COPIED:-0}" > "$SYNC_STATS"
+echo "$EFFECTIVE_MODE" > "${OUT_DIR}/.stm32mcp/work-mode"
+log "Copied ${FILES_COPIED:-0} file(s), ${BYTES_COPIED:-0} bytes"
+phase_end
 
 # ── 3. Resolve project path ─────────────────────────────────
 PROJECT_PATH="${WORK_DIR}/project"
@@ -65,6 +193,7 @@ log "Working in $(pwd)"
 # ── 4. Auto-fix Makefile ────────────────────────────────────
 MAKEFILE="${PROJECT_PATH}/Makefile"
 if [[ -f "$MAKEFILE" ]]; then
+    phase_begin makefile_fix
     log "Auto-fixing Makefile compatibility issues …"
 
     # 4a. Replace Windows absolute paths with basenames
@@ -77,7 +206,12 @@ if [[ -f "$MAKEFILE" ]]; then
     sed -i 's/-fcyclomatic-complexity//g' "$MAKEFILE"
     sed -i 's/-fstack-usage//g' "$MAKEFILE"
 
+    # 4c. Keep the source mtime: objects depend on the Makefile, so a
+    #     fresh mtime on every build would defeat incremental builds.
+    touch -r "${SRC_DIR}/${PROJECT_SUBDIR:+${PROJECT_SUBDIR}/}Makefile" "$MAKEFILE"
+
     log "Makefile auto-fix complete"
+    phase_end
 else
     log "ERROR: Makefile not found"
     exit 1
@@ -85,10 +219,147 @@ fi
 
 # ── 5. Optional clean ───────────────────────────────────────
 if [[ "$CLEAN" == "1" ]]; then
+    phase_begin clean
     log "Running make clean …"
     make clean 2>&1 | tee -a "${OUT_DIR}/build.log" || true
+    phase_end
 fi
 
+# ── 5b. Compiler wrappers (ccache / profiling / JSON diagnostics) ──
+# Wrapper scripts named like the cross compilers are put first on PATH, so
+# Makefiles using $(PREFIX)gcc go through them without being edited.
+phase_begin toolchain_setup
+LAUNCHER=""
+CCACHE_ACTIVE=0
+rm -f "${OUT_DIR}/ccache-stats.before" "${OUT_DIR}/ccache-stats.after"
+if [[ "$CCACHE" == "1" ]]; then
+    if command -v ccache >/dev/null 2>&1; then
+        export CCACHE_DIR CCACHE_MAXSIZE
+        export CCACHE_BASEDIR="${WORK_DIR}/project"
+        mkdir -p "$CCACHE_DIR"
+        ccache --max-size="$CCACHE_MAXSIZE" >/dev/null
+        ccache --print-stats > "${OUT_DIR}/ccache-stats.before" 2>/dev/null || true
+        LAUNCHER="ccache"
+        CCACHE_ACTIVE=1
+        log "ccache enabled (dir=$CCACHE_DIR, max=$CCACHE_MAXSIZE)"
+    else
+        log "WARNING: ccache not found in image – building without cache"
+    fi
+fi
+if [[ "$PROFILE" == "1" ]]; then
+    log "Per-file compile profiling enabled"
+fi
+DIAG_ACTIVE=0
+DIAG_FLAG=""
+if [[ "$DIAG_FORMAT" == "json" ]]; then
+    # GCC 13+ spells it json-stderr; GCC 10-12 only know plain "json" (also stderr)
+    for flag in -fdiagnostics-format=json-stderr -fdiagnostics-format=json; do
+        if echo 'int x;' | arm-none-eabi-gcc -x c -fsyntax-only "$flag" - >/dev/null 2>&1; then
+            DIAG_FLAG="$flag"
+            break
+        fi
+    done
+    if ! command -v python3 >/dev/null 2>&1; then
+        log "WARNING: python3 not found in image – using text diagnostics"
+    elif [[ -z "$DIAG_FLAG" ]]; then
+        log "WARNING: arm-none-eabi-gcc has no JSON diagnostics – using text diagnostics"
+    else
+        DIAG_ACTIVE=1
+        : > "$DIAG_FILE"
+        log "JSON diagnostics enabled ($DIAG_FLAG)"
+    fi
+fi
+
+if [[ -n "$LAUNCHER" || "$PROFILE" == "1" || $DIAG_ACTIVE -eq 1 ]]; then
+    mkdir -p "$WRAP_DIR"
+    if [[ $DIAG_ACTIVE -eq 1 ]]; then
+        # Collects one compiler call's JSON stderr into DIAG_FILE (under an
+        # exclusive lock: records can exceed PIPE_BUF under make -j) and
+        # prints "file:line:col: kind: message" lines for the build log.
+        cat > "${WRAP_DIR}/stm32mcp-diagnostics.py" <<'PY'
+import fcntl, json, sys
+
+tu, tmp, dest = sys.argv[1:4]
+diagnostics = []
+with open(tmp, encoding="utf-8", errors="replace") as f:
+    for line in f:
+        if line.startswith("["):
+            try:
+                diagnostics += json.loads(line)
+                continue
+            except ValueError:
+                pass
+        sys.stderr.write(line)
+if diagnostics:
+    with open(dest, "a", encoding="utf-8") as out:
+        fcntl.flock(out, fcntl.LOCK_EX)
+        out.write(json.dumps({"tu": tu, "diagnostics": diagnostics}) + "\n")
+
+def show(d):
+    caret = ((d.get("locations") or [{}])[0]).get("caret") or {}
+    where = "%s:%s:%s: " % (caret["file"], caret["line"], caret["column"]) if caret.get("file") else ""
+    option = " [%s]" % d["option"] if d.get("option") else ""
+    sys.stderr.write("%s%s: %s%s\n" % (where, d.get("kind", "error"), d.get("message", ""), option))
+    for child in d.get("children", []):
+        show(child)
+
+for d in diagnostics:
+    show(d)
+PY
+    fi
+    for tool in arm-none-eabi-gcc arm-none-eabi-g++; do
+        real="$(command -v "$tool" || true)"
+        [[ -n "$real" ]] || continue
+        if [[ "$PROFILE" == "1" || $DIAG_ACTIVE -eq 1 ]]; then
+            PRE=""
+            RUN="$LAUNCHER $real \"\$@\""
+            if [[ $DIAG_ACTIVE -eq 1 ]]; then
+                PRE="diag_tmp=\$(mktemp)"
+                RUN="$LAUNCHER $real $DIAG_FLAG \"\$@\" 2>\"\$diag_tmp\""
+            fi
+            cat > "${WRAP_DIR}/${tool}" <<EOF
+#!/usr/bin/env bash
+kind=link; src=""; out=""; prev=""
+for a in "\$@"; do
+    case "\$a" in
+        -c) kind=compile ;;
+        *.c|*.cc|*.cpp|*.cxx|*.s|*.S) src="\$a" ;;
+    esac
+    [[ "\$prev" == "-o" ]] && out="\$a"
+    prev="\$a"
+done
+$PRE
+t0=\${EPOCHREALTIME:-\$(date +%s.%N)}
+$RUN
+ec=\$?
+t1=\${EPOCHREALTIME:-\$(date +%s.%N)}
+EOF
+            if [[ "$PROFILE" == "1" ]]; then
+                # one "kind<TAB>file<TAB>start<TAB>end<TAB>exit" line per call;
+                # short O_APPEND writes stay whole under make -j
+                cat >> "${WRAP_DIR}/${tool}" <<EOF
+printf '%s\t%s\t%s\t%s\t%s\n' "\$kind" "\${src:-\$out}" "\$t0" "\$t1" "\$ec" >> "$TU_TIMES"
+EOF
+            fi
+            if [[ $DIAG_ACTIVE -eq 1 ]]; then
+                # "[]" (no diagnostics) is the common case: skip python
+                cat >> "${WRAP_DIR}/${tool}" <<EOF
+if [[ -s "\$diag_tmp" && "\$(<"\$diag_tmp")" != "[]" ]]; then
+    python3 "${WRAP_DIR}/stm32mcp-diagnostics.py" "\${src:-\$out}" "\$diag_tmp" "$DIAG_FILE"
+fi
+rm -f "\$diag_tmp"
+EOF
+            fi
+            echo "exit \$ec" >> "${WRAP_DIR}/${tool}"
+        else
+            printf '#!/bin/sh\nexec %s %s "$@"\n' "$LAUNCHER" "$real" > "${WRAP_DIR}/${tool}"
+        fi
+        chmod +x "${WRAP_DIR}/${tool}"
+    done
+    export PATH="${WRAP_DIR}:${PATH}"
+fi
+phase_end
+
 # ── 6. Compile ──────────────────────────────────────────────
 log "========================================"
 log "Compiling …"
@@ -101,7 +372,13 @@ fi
 
 log "Executing: $MAKE_CMD"
 BUILD_EXIT=0
+phase_begin make
 $MAKE_CMD 2>&1 | tee "${OUT_DIR}/build.log" || BUILD_EXIT=${PIPESTATUS[0]}
+phase_end
+
+if [[ $CCACHE_ACTIVE -eq 1 ]]; then
+    ccache --print-stats > "${OUT_DIR}/ccache-stats.after" 2>/dev/null || true
+fi
 
 if [[ $BUILD_EXIT -eq 0 ]]; then
     log "✓ Build succeeded"
@@ -110,8 +387,10 @@ else
 fi
 
 # ── 7. Collect artifacts ────────────────────────────────────
+phase_begin collect
 log "Collecting build artifacts …"
-find "${WORK_DIR}/project" -maxdepth 3 -type f \( \
+# out/ is the host's output directory seen through /src (overlay mode)
+find "$DEST" -maxdepth 3 -path "${DEST}/out" -prune -o -type f \( \
     -name "*.elf" -o \
     -name "*.hex" -o \
     -name "*.bin" -o \
@@ -123,6 +402,7 @@ done
 
 ARTIFACT_COUNT=$(find "${OUT_DIR}/artifacts" -type f | wc -l)
 log "Collected $ARTIFACT_COUNT artifact(s)"
+phase_end
 
 # ── Done ─────────────────────────────────────────────────────
 log "========================================"
@@ -0,0 +1,227 @@
+"""Content-addressed cache of finished builds.
+
+A build is identified by a hash of
+
+* every build input in the workspace (path + content), as selected by the
+  :mod:`source_filter` ignore rules,
+* the build parameters that change the output (``make_target``,
+  ``project_subdir``, extra ``ignore`` patterns),
+* the toolchain image digest.
+
+On a hit, ``out/artifacts``, ``build.log`` and the parsed errors are
+restored from the cache without touching Docker.  Only successful builds are
+stored, so a transient infrastructure failure is never replayed.
+
+Entries live under ``$STM32_MCP_CACHE_DIR/results`` (default
+``~/.cache/stm32-mcp/results``) and are evicted least-recently-used once the
+total size exceeds ``STM32_MCP_RESULT_CACHE_MB`` (default 512).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .source_filter import IgnoreRules, iter_input_files
+
+
+def cache_root() -> Path:
+    """Return the base directory for on-disk stm32-mcp caches."""
+    env = os.environ.get("STM32_MCP_CACHE_DIR")
+    if env:
+        return Path(env)
+    xdg = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg) if xdg else Path.home() / ".cache"
+    return base / "stm32-mcp"
+
+
+# ── Source hashing ───────────────────────────────────────────
+
+# path -> (size, mtime_ns, sha256); unchanged files are never re-read
+_digest_memo: Dict[str, Tuple[int, int, str]] = {}
+_digest_lock = threading.Lock()
+
+
+def _file_digest(path: Path, st: os.stat_result) -> str:
+    key = str(path)
+    with _digest_lock:
+        memo = _digest_memo.get(key)
+    if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+        return memo[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_memo[key] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+
+def file_digest(path: Path) -> str:
+    """Return the SHA-256 of *path*; re-read only if its size or mtime changed."""
+    return _file_digest(path, path.stat())
+
+
+def iter_source_files(
+    workspace: Path, rules: Optional[IgnoreRules] = None
+) -> Iterator[Tuple[str, Path]]:
+    """Yield ``(relative_posix_path, path)`` for every build input file.
+
+    Uses the same ignore rules as the container sync (defaults +
+    ``.stm32mcpignore`` when *rules* is not given).
+    """
+    yield from iter_input_files(workspace, rules or IgnoreRules.for_workspace(workspace))
+
+
+def compute_build_key(
+    workspace: Path,
+    project_subdir: str,
+    make_target: str,
+    image_digest: str,
+    ignore: Optional[Sequence[str]] = None,
+    diagnostics_format: str = "text",
+) -> str:
+    """Return the cache key for building *workspace* with these parameters."""
+    h = hashlib.sha256()
+    params = {
+        "project_subdir": project_subdir,
+        "make_target": make_target,
+        "image": image_digest,
+        "ignore": list(ignore or []),
+        # the stored errors come from GCC's text or JSON output
+        "diagnostics_format": diagnostics_format,
+    }
+    h.update(json.dumps(params, sort_keys=True).encode())
+    rules = IgnoreRules.for_workspace(workspace, project_subdir, ignore)
+    for rel, path in iter_source_files(workspace, rules):
+        try:
+            st = path.stat()
+            digest = _file_digest(path, st)
+        except OSError:
+            continue  # vanished or unreadable; not a build input then
+        h.update(rel.encode())
+        h.update(b"\0")
+        h.update(digest.encode())
+    return h.hexdigest()
+
+
+# ── Cache store ──────────────────────────────────────────────
+
+class BuildResultCache:
+    """On-disk LRU store of build outputs keyed by :func:`compute_build_key`."""
+
+    DEFAULT_MAX_MB = 512
+
+    def __init__(self, root: Optional[Path] = None, max_bytes: Optional[int] = None) -> None:
+        self.root = root or cache_root() / "results"
+        if max_bytes is None:
+            max_mb = int(os.environ.get("STM32_MCP_RESULT_CACHE_MB", self.DEFAULT_MAX_MB))
+            max_bytes = max_mb * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def restore(self, key: str, outdir: Path) -> Optional[Dict[str, Any]]:
+        """Copy a cached result into *outdir*.
+
+        ``outdir/artifacts`` is replaced, not merged into, so no image of
+        another build configuration survives a hit.  Returns the stored
+        metadata (``errors``, ``error_summary`` …) on a hit, ``None`` on a
+        miss.
+        """
+        entry = self.root / key
+        meta_path = entry / "meta.json"
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+        artifacts_dir = outdir / "artifacts"
+        tmp = outdir / f".artifacts.{os.getpid()}.{threading.get_ident()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            outdir.mkdir(parents=True, exist_ok=True)
+            shutil.copytree(entry / "artifacts", tmp)
+            shutil.rmtree(artifacts_dir, ignore_errors=True)
+            os.replace(tmp, artifacts_dir)
+            if (entry / "build.log").exists():
+                shutil.copy2(entry / "build.log", outdir / "build.log")
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+
+        try:
+            os.utime(meta_path)  # LRU: last use is the meta mtime
+        except OSError:
+            pass  # evicted meanwhile; the restored copy is still good
+        return meta
+
+    def store(self, key: str, outdir: Path, meta: Dict[str, Any]) -> None:
+        """Save ``outdir/artifacts`` and ``outdir/build.log`` under *key*."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f".{key}.{os.getpid()}.{threading.get_ident()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            (tmp / "artifacts").mkdir(parents=True)
+            size = 0
+            artifacts_dir = outdir / "artifacts"
+            if artifacts_dir.is_dir():
+                for f in artifacts_dir.iterdir():
+                    if f.is_file():
+                        shutil.copy2(f, tmp / "artifacts" / f.name)
+                        size += f.stat().st_size
+            if (outdir / "build.log").exists():
+                shutil.copy2(outdir / "build.log", tmp / "build.log")
+                size += (tmp / "build.log").stat().st_size
+
+            meta = dict(meta, size_bytes=size, created=time.time())
+            (tmp / "meta.json").write_text(json.dumps(meta))
+
+            dest = self.root / key
+            with self._lock:
+                shutil.rmtree(dest, ignore_errors=True)
+                os.replace(tmp, dest)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self._evict()
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for entry in self.root.iterdir():
+            if entry.name.startswith("."):
+                continue
+            meta_path = entry / "meta.json"
+            try:
+                size = json.loads(meta_path.read_text()).get("size_bytes", 0)
+                entries.append((meta_path.stat().st_mtime, size, entry))
+            except (OSError, ValueError):
+                shutil.rmtree(entry, ignore_errors=True)
+        return entries
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e[0])
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+
+_cache: Optional[BuildResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> BuildResultCache:
+    """Return the process-wide :class:`BuildResultCache`."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BuildResultCache()
+        return _cache
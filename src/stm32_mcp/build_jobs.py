@@ -0,0 +1,180 @@
+"""Asynchronous build jobs.
+
+``start_build`` hands a build to :class:`BuildJobManager`, which runs it on a
+bounded thread pool and returns a ``build_id`` straight away.  The job can
+then be polled, awaited or cancelled; cancelling sets the job's
+``cancel_event``, which makes :meth:`DockerRunner.run_build` kill the
+container.
+
+Configuration via environment:
+
+* ``STM32_MCP_BUILD_WORKERS`` – concurrent builds (default 2)
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+BuildFn = Callable[[threading.Event], Dict[str, Any]]
+
+
+@dataclass
+class BuildJob:
+    """State of one submitted build."""
+    build_id: str
+    params: Dict[str, Any]
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    future: Optional[Future] = None
+    monitor: Optional[Any] = None  # BuildMonitor feeding live progress
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        """Return a JSON-friendly status record."""
+        end = self.finished or time.time()
+        info: Dict[str, Any] = {
+            "build_id": self.build_id,
+            "status": self.status,
+            "params": self.params,
+            "queued_sec": round((self.started or end) - self.created, 3),
+            "elapsed_sec": round(end - self.started, 3) if self.started else 0.0,
+        }
+        if self.monitor is not None:
+            info["progress"] = self.monitor.snapshot()
+        if include_result and self.status in FINISHED_STATES:
+            info["result"] = self.result
+        return info
+
+
+class BuildJobManager:
+    """Runs builds on a bounded worker pool and tracks them by ID."""
+
+    DEFAULT_WORKERS = 2
+    MAX_FINISHED = 50  # finished jobs kept for status queries
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        if max_workers is None:
+            max_workers = int(os.environ.get("STM32_MCP_BUILD_WORKERS", self.DEFAULT_WORKERS))
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="stm32-build"
+        )
+        self._jobs: Dict[str, BuildJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        fn: BuildFn,
+        params: Dict[str, Any],
+        monitor: Optional[Any] = None,
+    ) -> BuildJob:
+        """Queue *fn* (called with the job's cancel event) as a new job."""
+        job = BuildJob(build_id=uuid.uuid4().hex[:12], params=params, monitor=monitor)
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job.build_id] = job
+        job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, build_id: str) -> Optional[BuildJob]:
+        with self._lock:
+            return self._jobs.get(build_id)
+
+    def cancel(self, build_id: str) -> Optional[BuildJob]:
+        """Request cancellation; returns the job or ``None`` if unknown."""
+        job = self.get(build_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            # never started: finish it here
+            self._finish(job, CANCELLED, {"ok": False, "error": "Build cancelled"})
+        return job
+
+    def wait(self, build_id: str, timeout: Optional[float] = None) -> Optional[BuildJob]:
+        """Block until the job finishes or *timeout* expires."""
+        job = self.get(build_id)
+        if job is None or job.future is None:
+            return job
+        try:
+            job.future.result(timeout=timeout)
+        except Exception:
+            pass  # timeout / cancellation – caller inspects job.status
+        return job
+
+    # ── Internals ────────────────────────────────────────────
+
+    def _run(self, job: BuildJob, fn: BuildFn) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED, {"ok": False, "error": "Build cancelled"})
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            result = fn(job.cancel_event)
+        except Exception as exc:
+            result = {"ok": False, "error": f"Build crashed: {exc}"}
+        if job.cancel_event.is_set():
+            status = CANCELLED
+        else:
+            status = SUCCEEDED if result.get("ok") else FAILED
+        self._finish(job, status, result)
+
+    def _finish(self, job: BuildJob, status: str, result: Dict[str, Any]) -> None:
+        job.result = dict(result, build_id=job.build_id)
+        job.finished = time.time()
+        job.status = status
+
+    def _prune_locked(self) -> None:
+        finished = sorted(
+            (j for j in self._jobs.values() if j.status in FINISHED_STATES),
+            key=lambda j: j.finished or 0,
+        )
+        for job in finished[: max(0, len(finished) - self.MAX_FINISHED)]:
+            del self._jobs[job.build_id]
+
+
+# ── Per-workspace serialisation ──────────────────────────────
+
+_workspace_locks: Dict[str, threading.Lock] = {}
+_workspace_locks_guard = threading.Lock()
+
+
+def workspace_lock(workspace: Path) -> threading.Lock:
+    """Return the lock serialising builds that share *workspace*/out."""
+    key = str(workspace)
+    with _workspace_locks_guard:
+        lock = _workspace_locks.get(key)
+        if lock is None:
+            lock = _workspace_locks[key] = threading.Lock()
+        return lock
+
+
+_manager: Optional[BuildJobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> BuildJobManager:
+    """Return the process-wide :class:`BuildJobManager`."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = BuildJobManager()
+        return _manager
@@ -0,0 +1,95 @@
+"""Build timing: host phases, container phases and per-file compile times.
+
+``build.sh`` appends ``name<TAB>start<TAB>end`` lines to ``out/phases.tsv``
+for each of its steps (sync, Makefile fix, clean, toolchain setup, make,
+artifact collection).  With ``PROFILE=1`` its compiler wrapper also appends
+one ``kind<TAB>file<TAB>start<TAB>end<TAB>exit`` line per compiler call to
+``out/tu-times.tsv``; *kind* is ``compile`` (``-c``) or ``link``.
+
+On the host, :class:`PhaseTimer` records the server-side phases (cache
+lookup, image check, waiting for ``-j`` slots, the container run, artifact
+collection, log parsing, cache store).
+"""
+
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class PhaseTimer:
+    """Accumulates wall-clock seconds per named phase, in first-seen order."""
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = round(self.phases.get(name, 0.0) + elapsed, 3)
+
+
+def _read_tsv(path: Path) -> List[List[str]]:
+    try:
+        text = path.read_text(errors="replace")
+    except OSError:
+        return []
+    return [line.split("\t") for line in text.splitlines() if line]
+
+
+def read_container_phases(outdir: Path) -> Dict[str, float]:
+    """Return ``{phase: seconds}`` as recorded by ``build.sh``."""
+    phases: Dict[str, float] = {}
+    for row in _read_tsv(outdir / "phases.tsv"):
+        try:
+            name, start, end = row[0], float(row[1]), float(row[2])
+        except (IndexError, ValueError):
+            continue
+        phases[name] = round(phases.get(name, 0.0) + end - start, 3)
+    return phases
+
+
+def read_compile_profile(outdir: Path, top: int = 10) -> Optional[Dict[str, Any]]:
+    """Summarise ``tu-times.tsv``; ``None`` if profiling did not run.
+
+    Returns ``{units, compile_cpu_sec, compile_wall_sec, link_sec, failed,
+    slowest}``, where *slowest* lists the *top* slowest translation units
+    as ``{file, sec}``.  *compile_cpu_sec* sums every compile, so the ratio
+    to *compile_wall_sec* shows how well ``make -j`` parallelised.
+    """
+    units: Dict[str, float] = {}
+    starts: List[float] = []
+    ends: List[float] = []
+    link_sec = 0.0
+    failed = 0
+    rows = _read_tsv(outdir / "tu-times.tsv")
+    if not rows:
+        return None
+    for row in rows:
+        try:
+            kind, name, start, end, code = row[0], row[1], float(row[2]), float(row[3]), row[4]
+        except (IndexError, ValueError):
+            continue
+        if code.strip() != "0":
+            failed += 1
+        if kind == "link":
+            link_sec += end - start
+            continue
+        # a file compiled twice (e.g. two targets) counts once, slowest run
+        units[name] = max(units.get(name, 0.0), end - start)
+        starts.append(start)
+        ends.append(end)
+
+    slowest = sorted(units.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return {
+        "units": len(units),
+        "compile_cpu_sec": round(sum(units.values()), 3),
+        "compile_wall_sec": round(max(ends) - min(starts), 3) if starts else 0.0,
+        "link_sec": round(link_sec, 3),
+        "failed": failed,
+        "slowest": [{"file": name, "sec": round(sec, 3)} for name, sec in slowest],
+    }
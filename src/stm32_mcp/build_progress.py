@@ -0,0 +1,135 @@
+"""Live progress tracking for a running build.
+
+:class:`BuildMonitor` is fed the build output one line at a time while make
+runs.  It counts compiled translation units against the number of sources
+the project declares, runs every line through a :class:`gcc_parse.LogParser`
+so diagnostics are available as soon as they are printed (notes are attached
+to their parent rather than reported on their own), and can request an early
+abort on the first error.
+"""
+
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .gcc_parse import ErrorSeverity, LogParser, ParsedError, PathMapper, errors_to_dict
+
+_SOURCE_EXTS = (".c", ".cc", ".cpp", ".cxx", ".s", ".S")
+_SOURCE_TOKEN = re.compile(r"[\w./\\-]+\.(?:c|cc|cpp|cxx|s|S)(?=[\s\\]|$)", re.MULTILINE)
+# "... arm-none-eabi-gcc ... -c ... foo.c ..." (the make recipe echo)
+_COMPILE_CMD = re.compile(r"(?:^|[\s/])(?:arm-none-eabi-)?(?:gcc|g\+\+|cc)(?=\s|$).*\s-c(?=\s|$)")
+
+Listener = Callable[[Dict[str, Any], List[ParsedError]], None]
+
+
+def count_translation_units(project_path: Path) -> int:
+    """Estimate how many sources a build will compile.
+
+    Sources listed in the Makefile are counted; Makefiles that use
+    wildcards (no explicit list) fall back to the source files on disk.
+    """
+    makefile = project_path / "Makefile"
+    try:
+        text = makefile.read_text(errors="replace")
+    except OSError:
+        text = ""
+    listed = {m.group(0) for m in _SOURCE_TOKEN.finditer(text)}
+    if listed:
+        return len(listed)
+    return sum(
+        1 for p in project_path.rglob("*")
+        if p.suffix in _SOURCE_EXTS and p.relative_to(project_path).parts[0] != "out"
+    )
+
+
+class BuildMonitor:
+    """Consumes build output lines and tracks progress and diagnostics.
+
+    *listener* is called with ``(snapshot, new_errors)`` whenever new
+    diagnostics appear, and otherwise at most every *interval* seconds.
+    When *fail_fast* is set, the first error-severity diagnostic sets
+    :attr:`abort_event`.
+    """
+
+    def __init__(
+        self,
+        total_units: int,
+        workspace: str = "",
+        fail_fast: bool = False,
+        listener: Optional[Listener] = None,
+        interval: float = 0.5,
+        mapper: Optional[PathMapper] = None,
+    ) -> None:
+        self.total_units = total_units
+        self.workspace = workspace
+        self._parser = LogParser(workspace, mapper=mapper)
+        self.fail_fast = fail_fast
+        self.listener = listener
+        self.interval = interval
+        self.abort_event = threading.Event()
+
+        self.compiled: Set[str] = set()
+        self.errors = 0
+        self.warnings = 0
+        self.lines = 0
+        self.current = ""
+        self.first_error: Optional[ParsedError] = None
+
+        self._lock = threading.Lock()
+        self._last_emit = 0.0
+
+    def feed(self, line: str) -> None:
+        """Process one line of build output."""
+        new_errors: List[ParsedError] = []
+        with self._lock:
+            self.lines += 1
+            if _COMPILE_CMD.search(line):
+                sources = [t for t in line.split() if t.endswith(_SOURCE_EXTS)]
+                if sources:
+                    self.current = sources[-1]
+                    self.compiled.add(self.current)
+            else:
+                error = self._parser.feed_line(line)
+                if error is not None:
+                    new_errors.append(error)
+                    if error.severity == ErrorSeverity.WARNING:
+                        self.warnings += 1
+                    elif error.severity == ErrorSeverity.ERROR:
+                        self.errors += 1
+                        if self.first_error is None:
+                            self.first_error = error
+                            if self.fail_fast:
+                                self.abort_event.set()
+            now = time.monotonic()
+            emit = bool(new_errors) or now - self._last_emit >= self.interval
+            if emit:
+                self._last_emit = now
+                snapshot = self._snapshot_locked()
+        if emit and self.listener is not None:
+            try:
+                self.listener(snapshot, new_errors)
+            except Exception:
+                pass  # a broken listener must not break the build
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current progress as a JSON-friendly dict."""
+        with self._lock:
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self) -> Dict[str, Any]:
+        compiled = len(self.compiled)
+        total = max(self.total_units, compiled)
+        return {
+            "compiled": compiled,
+            "total": total,
+            "percent": round(100.0 * compiled / total, 1) if total else None,
+            "current_file": self.current,
+            "lines": self.lines,
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "first_error": (
+                errors_to_dict([self.first_error])[0] if self.first_error else None
+            ),
+        }
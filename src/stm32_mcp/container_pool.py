@@ -0,0 +1,259 @@
+"""Warm pool of long-lived toolchain containers.
+
+Instead of paying for ``docker run --rm`` (container creation, mount setup,
+shell start-up) on every build, :class:`DockerRunner` can run ``build.sh``
+with ``docker exec`` inside a container that is kept alive between builds.
+
+Containers are keyed by *(image, workspace, mount profile)* because mounts,
+tmpfs and capabilities are fixed at creation time.  The pool
+
+* evicts containers that have been idle longer than ``idle_timeout_sec``,
+* health-checks a container before handing it out again,
+* holds at most ``max_size`` containers (least recently used goes first),
+* counts hits and misses so callers can report them.
+
+Configuration via environment:
+
+* ``STM32_MCP_POOL_SIZE``      – max containers (default 4, 0 disables)
+* ``STM32_MCP_POOL_IDLE_SEC``  – idle eviction timeout (default 600)
+"""
+
+import atexit
+import dataclasses
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .docker_backend import ContainerSpec, get_backend
+
+POOL_LABEL = "stm32-mcp.pool"
+OWNER_LABEL = "stm32-mcp.pool.owner"
+
+
+@dataclass
+class PooledContainer:
+    """A warm container owned by the pool."""
+    name: str
+    key: Tuple[str, str, str]
+    created: float
+    last_used: float
+    busy: bool = False
+    builds: int = 0
+
+
+class ContainerPool:
+    """Keeps toolchain containers running between builds."""
+
+    DEFAULT_SIZE = 4
+    DEFAULT_IDLE_SEC = 600
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        idle_timeout_sec: Optional[float] = None,
+    ) -> None:
+        if max_size is None:
+            max_size = int(os.environ.get("STM32_MCP_POOL_SIZE", self.DEFAULT_SIZE))
+        if idle_timeout_sec is None:
+            idle_timeout_sec = float(
+                os.environ.get("STM32_MCP_POOL_IDLE_SEC", self.DEFAULT_IDLE_SEC)
+            )
+        self.max_size = max(0, max_size)
+        self.idle_timeout_sec = idle_timeout_sec
+        self.hits = 0
+        self.misses = 0
+
+        self._containers: Dict[Tuple[str, str, str], PooledContainer] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = False
+
+    # ── Public API ───────────────────────────────────────────
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def acquire(
+        self,
+        workspace: str,
+        spec: ContainerSpec,
+    ) -> Tuple[Optional[PooledContainer], str]:
+        """Check out a warm container for *workspace* created from *spec*.
+
+        *spec* (image, mounts, tmpfs, capabilities) is used when a new
+        container has to be created; its name and labels are filled in by
+        the pool.
+
+        Returns ``(container, status)`` where *status* is ``hit``, ``miss``
+        or ``bypass``.  On ``bypass`` (pool disabled, the matching container
+        is already busy, or every slot is busy) *container* is ``None`` and
+        the caller should fall back to a one-shot ``docker run``.
+        """
+        if not self.enabled:
+            return None, "bypass"
+
+        key = (spec.image, workspace, spec.mount_profile())
+        # A busy, nameless entry holds the slot while the container is
+        # created outside the lock, so concurrent misses cannot overshoot
+        # max_size or start a second container for the same key.
+        now = time.monotonic()
+        reserved = PooledContainer(name="", key=key, created=now, last_used=now, busy=True)
+        bypass = False
+        with self._lock:
+            stale = self._pop_idle_locked()
+            entry = self._containers.get(key)
+            if entry is not None and entry.busy:
+                bypass = True
+            elif entry is None and len(self._containers) >= self.max_size:
+                victim = self._lru_idle_locked()
+                if victim is None:
+                    bypass = True
+                else:
+                    del self._containers[victim.key]
+                    stale.append(victim)
+                    self._containers[key] = reserved
+            elif entry is not None:
+                entry.busy = True
+            else:
+                self._containers[key] = reserved
+        self._remove_all(stale)
+        if bypass:
+            return None, "bypass"
+
+        if entry is not None:
+            if self._is_healthy(entry.name):
+                with self._lock:
+                    self.hits += 1
+                return entry, "hit"
+            with self._lock:
+                if self._containers.get(key) is entry:
+                    self._containers[key] = reserved
+            self._remove(entry.name)
+
+        try:
+            entry = self._create(key, spec)
+        except BaseException:
+            with self._lock:
+                if self._containers.get(key) is reserved:
+                    del self._containers[key]
+            raise
+        with self._lock:
+            if self._containers.get(key) is reserved:  # gone after shutdown()
+                del self._containers[key]
+                if entry is not None:
+                    self._containers[key] = entry
+            if entry is None:
+                return None, "bypass"
+            self.misses += 1
+        self._start_reaper()
+        return entry, "miss"
+
+    def release(self, entry: PooledContainer, healthy: bool = True) -> None:
+        """Return *entry* to the pool; discard it if the build broke it."""
+        with self._lock:
+            entry.busy = False
+            entry.last_used = time.monotonic()
+            entry.builds += 1
+            if healthy and not self._closed:
+                return
+            if self._containers.get(entry.key) is entry:
+                del self._containers[entry.key]
+        self._remove(entry.name)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters for inclusion in build results."""
+        with self._lock:
+            return {
+                "size": len(self._containers),
+                "max_size": self.max_size,
+                "idle_timeout_sec": self.idle_timeout_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def shutdown(self) -> None:
+        """Remove every pooled container (called at interpreter exit)."""
+        with self._lock:
+            self._closed = True
+            entries = [c for c in self._containers.values() if c.name]  # not reservations
+            self._containers.clear()
+        self._remove_all(entries)
+
+    # ── Internals ────────────────────────────────────────────
+
+    def _pop_idle_locked(self) -> List[PooledContainer]:
+        now = time.monotonic()
+        idle = [
+            c for c in self._containers.values()
+            if not c.busy and now - c.last_used > self.idle_timeout_sec
+        ]
+        for c in idle:
+            del self._containers[c.key]
+        return idle
+
+    def _lru_idle_locked(self) -> Optional[PooledContainer]:
+        idle = [c for c in self._containers.values() if not c.busy]
+        return min(idle, key=lambda c: c.last_used) if idle else None
+
+    def _create(
+        self, key: Tuple[str, str, str], spec: ContainerSpec
+    ) -> Optional[PooledContainer]:
+        digest = hashlib.sha1("\0".join(key).encode()).hexdigest()[:12]
+        name = f"stm32-mcp-pool-{digest}-{os.getpid()}"
+        self._remove(name)  # leftover from an earlier crash
+        spec = dataclasses.replace(
+            spec,
+            name=name,
+            labels={POOL_LABEL: "1", OWNER_LABEL: str(os.getpid())},
+        )
+        if not get_backend().start_detached(spec, ["sleep", "infinity"]):
+            return None
+        now = time.monotonic()
+        return PooledContainer(name=name, key=key, created=now, last_used=now, busy=True)
+
+    def _is_healthy(self, name: str) -> bool:
+        return get_backend().is_running(name)
+
+    def _remove(self, name: str) -> None:
+        get_backend().remove(name)
+
+    def _remove_all(self, entries: List[PooledContainer]) -> None:
+        for entry in entries:
+            self._remove(entry.name)
+
+    def _start_reaper(self) -> None:
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(
+                target=self._reap_loop, name="stm32-mcp-pool-reaper", daemon=True
+            )
+        self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        interval = max(5.0, min(60.0, self.idle_timeout_sec / 2))
+        while not self._closed:
+            time.sleep(interval)
+            with self._lock:
+                idle = self._pop_idle_locked()
+            self._remove_all(idle)
+
+
+# ── Process-wide pool ────────────────────────────────────────
+
+_pool: Optional[ContainerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ContainerPool:
+    """Return the process-wide :class:`ContainerPool`, creating it lazily."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ContainerPool()
+            atexit.register(_pool.shutdown)
+        return _pool
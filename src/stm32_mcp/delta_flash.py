@@ -0,0 +1,237 @@
+"""Differential flashing: rewrite only the flash sectors that changed.
+
+``flash write_image erase`` erases and reprograms every sector the image
+touches.  After a small code change most of those sectors hold exactly the
+same bytes as before.  :func:`flash_delta` keeps, per device, a manifest of
+the last image it flashed: the flash geometry, a hash of every sector's
+contents (image bytes, ``0xFF`` where the image has none) and a copy of the
+image itself.  On the next flash only the sectors whose hash changed are
+erased and programmed, as one Intel HEX file padded to sector boundaries.
+
+The manifest is only trusted after the target confirms it: OpenOCD's
+``verify_image_checksum`` (a CRC32 computed on the target) must match the
+stored copy of the previous image.  If it does not – first flash, another
+tool flashed the board, a different chip on the same probe – the whole
+image is flashed, checked the same way, and becomes the new baseline.
+
+Devices are identified by probe serial, target config and the chip's
+96-bit unique ID (the IDCODE where the UID address is unknown).  Manifests
+live under ``$STM32_MCP_CACHE_DIR/flash`` (see :func:`build_cache.cache_root`).
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .build_cache import cache_root
+from .image import Segment, SparseImage, write_hex
+from .openocd_session import OpenOcdError, OpenOcdSession, tcl_quote
+
+_FLASH_BANK = re.compile(r"at 0x([0-9a-fA-F]+), size 0x([0-9a-fA-F]+)")
+_FLASH_SECTOR = re.compile(r"#\s*(\d+):\s*0x([0-9a-fA-F]+)\s*\(0x([0-9a-fA-F]+)")
+
+
+# ── Flash geometry ───────────────────────────────────────────
+
+def read_sectors(session: OpenOcdSession) -> Tuple[int, List[Tuple[int, int]]]:
+    """Return ``(bank base, [(sector address, size)])`` of flash bank 0."""
+    session.run("flash probe 0")
+    output = session.run("flash info 0")
+    bank = _FLASH_BANK.search(output)
+    if bank is None:
+        raise OpenOcdError(f"Unexpected 'flash info' output: {output.strip()[:200]!r}")
+    base = int(bank.group(1), 16)
+    sectors = [(base + int(m.group(2), 16), int(m.group(3), 16)) for m in _FLASH_SECTOR.finditer(output)]
+    if not sectors:
+        raise OpenOcdError("'flash info' listed no sectors")
+    return base, sectors
+
+
+def sector_contents(
+    segments: List[Segment], sectors: List[Tuple[int, int]]
+) -> Optional[Dict[int, bytearray]]:
+    """Map sector index -> sector bytes after programming *segments*.
+
+    Bytes the image does not cover are ``0xFF`` (erased).  Returns ``None``
+    if the image extends past the listed sectors.
+    """
+    contents: Dict[int, bytearray] = {}
+    index = 0
+    for start, data in sorted(segments):
+        end = start + len(data)
+        view = memoryview(data)
+        while index > 0 and sectors[index][0] > start:
+            index -= 1
+        address = start
+        while address < end:
+            while index < len(sectors) and sectors[index][0] + sectors[index][1] <= address:
+                index += 1
+            if index == len(sectors) or sectors[index][0] > address:
+                return None
+            sector_start, size = sectors[index]
+            chunk_end = min(end, sector_start + size)
+            buf = contents.get(index)
+            if buf is None:
+                buf = contents[index] = bytearray(b"\xff" * size)
+            buf[address - sector_start:chunk_end - sector_start] = view[address - start:chunk_end - start]
+            address = chunk_end
+    return contents
+
+
+# ── Manifests ────────────────────────────────────────────────
+
+def manifest_dir() -> Path:
+    return cache_root() / "flash"
+
+
+def device_key(serial: str, target_cfg: str, chip_id: str) -> str:
+    return hashlib.sha1(f"{serial}\0{target_cfg}\0{chip_id}".encode()).hexdigest()[:20]
+
+
+def _load_manifest(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        manifest = json.loads((manifest_dir() / f"{key}.json").read_text())
+    except (OSError, ValueError):
+        return None
+    return manifest if (manifest_dir() / f"{key}.hex").is_file() else None
+
+
+def _save_manifest(key: str, manifest: Dict[str, Any], segments: List[Segment]) -> None:
+    directory = manifest_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = directory / f"{key}.hex.tmp"
+    write_hex(segments, tmp)
+    os.replace(tmp, directory / f"{key}.hex")
+    tmp = directory / f"{key}.json.tmp"
+    tmp.write_text(json.dumps(manifest))
+    os.replace(tmp, directory / f"{key}.json")
+
+
+def forget_device(key: str) -> None:
+    """Drop the manifest of *key* (the next flash is a full one)."""
+    for suffix in (".json", ".hex"):
+        try:
+            (manifest_dir() / f"{key}{suffix}").unlink()
+        except FileNotFoundError:
+            pass
+
+
+# ── Flashing ─────────────────────────────────────────────────
+
+def _runs(indices: List[int]) -> List[Tuple[int, int]]:
+    """Group sorted sector indices into ``(first, last)`` runs."""
+    runs: List[Tuple[int, int]] = []
+    for index in indices:
+        if runs and runs[-1][1] == index - 1:
+            runs[-1] = (runs[-1][0], index)
+        else:
+            runs.append((index, index))
+    return runs
+
+
+def flash_delta(
+    session: OpenOcdSession,
+    image_path: Path,
+    image: SparseImage,
+    verify: bool = True,
+    reset: bool = True,
+    timeout: float = 120.0,
+    verify_method: str = "crc",
+) -> Dict[str, Any]:
+    """Flash *image* (read from *image_path*), rewriting only the sectors that changed.
+
+    Returns ``{mode, baseline, sectors, sectors_written, bytes_written,
+    verify, output}``: *mode* is ``delta``, ``full`` or ``unchanged``;
+    *baseline* is ``trusted`` (target CRC matched the manifest),
+    ``mismatch`` or ``none``; *verify* is the
+    :meth:`OpenOcdSession.verify` report of the written sectors (a full
+    flash is always verified, so the next call can trust it).  Raises
+    :class:`OpenOcdError`.
+    """
+    segments = image.segments
+    output = [session.run("reset halt")]
+    chip_id = session.read_uid() or f"{session.read_idcode():08x}"
+    probe = session.probe
+    key = device_key(probe.serial, probe.target_cfg, chip_id)
+    base, sectors = read_sectors(session)
+    contents = sector_contents(segments, sectors)
+
+    manifest = _load_manifest(key)
+    baseline = "none"
+    geometry = [list(s) for s in sectors]
+    if manifest is not None and contents is not None and manifest.get("sectors") == geometry:
+        ok, result = session.try_run(
+            f"verify_image_checksum {tcl_quote(str(manifest_dir() / f'{key}.hex'))}", timeout
+        )
+        baseline = "trusted" if ok else "mismatch"
+        output.append(result)
+
+    hashes = {
+        str(index): hashlib.sha1(buf).hexdigest() for index, buf in (contents or {}).items()
+    }
+    if baseline == "trusted":
+        old = manifest.get("hashes", {}) if manifest else {}
+        dirty = sorted(int(index) for index, digest in hashes.items() if old.get(index) != digest)
+        mode = "delta" if dirty else "unchanged"
+        written = 0
+        report = None
+        if dirty:
+            assert contents is not None
+            delta = [(sectors[first][0], b"".join(contents[i] for i in range(first, last + 1)))
+                     for first, last in _runs(dirty)]
+            written = sum(len(data) for _, data in delta)
+            fd, tmp_name = tempfile.mkstemp(suffix=".hex", prefix="stm32-mcp-delta-")
+            os.close(fd)
+            tmp = Path(tmp_name)
+            try:
+                write_hex(delta, tmp)
+                output.append(session.run(f"flash write_image erase {tcl_quote(tmp_name)}", timeout))
+                if verify:
+                    report, result = session.verify(tmp_name, None, verify_method, timeout)
+                    output += result
+            finally:
+                tmp.unlink()
+        sectors_written = len(dirty)
+    else:
+        mode = "full"
+        address = image.start if image.format == "bin" else None
+        source = tcl_quote(str(image_path)) + (f" 0x{address:08x}" if address is not None else "")
+        output.append(session.run(f"flash write_image erase {source}", timeout))
+        # the check that lets the next flash trust this baseline
+        report, result = session.verify(
+            str(image_path), address, verify_method if verify else "crc", timeout
+        )
+        output += result
+        sectors_written = len(contents) if contents is not None else 0
+        written = image.size
+
+    if contents is not None:
+        _save_manifest(key, {
+            "target": probe.target_cfg,
+            "serial": probe.serial,
+            "chip_id": chip_id,
+            "flash_base": base,
+            "sectors": geometry,
+            "hashes": hashes,
+            "image": str(image_path),
+            "updated": time.time(),
+        }, segments)
+    else:
+        forget_device(key)  # image spans several banks: no delta support
+
+    if reset:
+        output.append(session.run("reset run"))
+    return {
+        "mode": mode,
+        "baseline": baseline,
+        "sectors": len(contents or {}),
+        "sectors_written": sectors_written,
+        "bytes_written": written,
+        "verify": report,
+        "output": output,
+    }
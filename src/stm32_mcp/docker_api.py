@@ -0,0 +1,377 @@
+"""Minimal Docker Engine API client over the local unix socket.
+
+Talks HTTP/1.1 to ``/var/run/docker.sock`` (or the ``unix://`` path in
+``DOCKER_HOST``) with the standard library only.  Short requests reuse
+keep-alive connections from a small pool, so readiness checks cost a
+round-trip instead of forking the ``docker`` CLI.  Streaming endpoints
+(logs, exec output, pull progress) get a dedicated connection that is closed
+when the stream ends.
+
+Only the handful of endpoints stm32-mcp needs are wrapped.
+"""
+
+import http.client
+import json
+import os
+import socket
+import struct
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+API_VERSION = "v1.41"  # Docker 20.10+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+# Multiplexed stream ids (see "Stream format" in the Engine API docs)
+STDOUT = 1
+STDERR = 2
+
+
+# What a keep-alive connection closed by the daemon while idle looks like
+_STALE_CONNECTION = (BrokenPipeError, ConnectionResetError, http.client.BadStatusLine)
+
+
+class DockerAPIError(Exception):
+    """The daemon answered with an HTTP error status."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """``HTTPConnection`` that connects to a unix domain socket."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def socket_path_from_env() -> Optional[str]:
+    """Return the daemon socket path, or ``None`` if it is not a unix socket."""
+    host = os.environ.get("DOCKER_HOST", "")
+    if not host:
+        return DEFAULT_SOCKET
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    return None  # tcp:// / ssh:// – leave those to the CLI
+
+
+class DockerEngineClient:
+    """Thread-safe client for a subset of the Docker Engine API."""
+
+    MAX_IDLE = 4
+    TIMEOUT = 30.0
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET) -> None:
+        self.socket_path = socket_path
+        self._idle: List[UnixHTTPConnection] = []
+        self._lock = threading.Lock()
+
+    # ── Transport ────────────────────────────────────────────
+
+    def _take(self) -> Tuple[UnixHTTPConnection, bool]:
+        """Return ``(connection, reused)``."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return UnixHTTPConnection(self.socket_path, timeout=self.TIMEOUT), False
+
+    def _give_back(self, conn: UnixHTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.MAX_IDLE:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _send(
+        self,
+        conn: UnixHTTPConnection,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        body: Optional[Any],
+    ) -> http.client.HTTPResponse:
+        url = f"/{API_VERSION}{path}"
+        if params:
+            url += "?" + urlencode(params)
+        headers = {"Host": "docker"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        conn.request(method, url, body=payload, headers=headers)
+        return conn.getresponse()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Optional[Any] = None,
+        expect: Tuple[int, ...] = (200, 201, 204),
+    ) -> Tuple[int, Any]:
+        """Send a short request and return ``(status, decoded_json_or_None)``.
+
+        Raises :class:`DockerAPIError` for statuses outside *expect* and
+        ``OSError`` / ``http.client.HTTPException`` if the daemon is
+        unreachable.  A request is retried only if a reused keep-alive
+        connection turns out to have been closed by the daemon (reset or
+        closed before any response); a timeout or any other failure is
+        raised, since the daemon may already have acted on a POST.
+        """
+        while True:
+            conn, reused = self._take()
+            try:
+                resp = self._send(conn, method, path, params, body)
+                data = resp.read()
+            except _STALE_CONNECTION:
+                conn.close()
+                if not reused:
+                    raise
+                continue
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._give_back(conn)
+            break
+
+        decoded: Any = None
+        if data and resp.getheader("Content-Type", "").startswith("application/json"):
+            decoded = json.loads(data)
+        if resp.status not in expect:
+            message = decoded.get("message", "") if isinstance(decoded, dict) else data.decode(errors="replace")
+            raise DockerAPIError(resp.status, message.strip())
+        return resp.status, decoded if decoded is not None else data
+
+    def stream(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Optional[Any] = None,
+    ) -> Tuple[UnixHTTPConnection, http.client.HTTPResponse]:
+        """Open a streaming request on a dedicated, timeout-free connection.
+
+        The caller reads the response and must close the connection.
+        """
+        conn = UnixHTTPConnection(self.socket_path, timeout=None)
+        resp = self._send(conn, method, path, params, body)
+        if resp.status >= 400:
+            data = resp.read()
+            conn.close()
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode(errors="replace")
+            raise DockerAPIError(resp.status, message.strip())
+        return conn, resp
+
+    # ── System ───────────────────────────────────────────────
+
+    def ping(self) -> bool:
+        try:
+            status, _ = self.request("GET", "/_ping")
+            return status == 200
+        except (OSError, http.client.HTTPException, DockerAPIError):
+            return False
+
+    def version(self) -> Dict[str, Any]:
+        return self.request("GET", "/version")[1]
+
+    def events(self, types: List[str]) -> Iterator[Dict[str, Any]]:
+        """Yield daemon events of the given object *types* as they happen."""
+        params = {"filters": json.dumps({"type": types})}
+        conn, resp = self.stream("GET", "/events", params=params)
+        try:
+            for raw in resp:
+                try:
+                    yield json.loads(raw)
+                except ValueError:
+                    continue
+        finally:
+            conn.close()
+
+    # ── Images ───────────────────────────────────────────────
+
+    def image_inspect(self, image: str) -> Optional[Dict[str, Any]]:
+        """Return image metadata, or ``None`` if the image is not local."""
+        try:
+            return self.request("GET", f"/images/{quote(image, safe='')}/json")[1]
+        except DockerAPIError as exc:
+            if exc.status == 404:
+                return None
+            raise
+
+    def image_pull(self, image: str) -> None:
+        """Pull *image*; raises :class:`DockerAPIError` on failure."""
+        name, tag = split_image_ref(image)
+        params = {"fromImage": name}
+        if tag:
+            params["tag"] = tag
+        conn, resp = self.stream("POST", "/images/create", params=params)
+        try:
+            for raw in resp:
+                try:
+                    event = json.loads(raw)
+                except ValueError:
+                    continue
+                if event.get("error"):
+                    raise DockerAPIError(500, event["error"])
+        finally:
+            conn.close()
+
+    # ── Containers ───────────────────────────────────────────
+
+    def container_create(
+        self,
+        image: str,
+        cmd: List[str],
+        name: str = "",
+        binds: Optional[List[str]] = None,
+        env: Optional[Dict[str, str]] = None,
+        labels: Optional[Dict[str, str]] = None,
+        network_mode: str = "none",
+        auto_remove: bool = False,
+        extra_host_config: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        host_config: Dict[str, Any] = {
+            "Binds": binds or [],
+            "NetworkMode": network_mode,
+            "AutoRemove": auto_remove,
+        }
+        host_config.update(extra_host_config or {})
+        body = {
+            "Image": image,
+            "Cmd": cmd,
+            "Env": [f"{k}={v}" for k, v in (env or {}).items()],
+            "Labels": labels or {},
+            "HostConfig": host_config,
+            "AttachStdout": True,
+            "AttachStderr": True,
+        }
+        params = {"name": name} if name else None
+        return self.request("POST", "/containers/create", params=params, body=body)[1]["Id"]
+
+    def container_start(self, container: str) -> None:
+        self.request("POST", f"/containers/{container}/start", expect=(204, 304))
+
+    def container_inspect(self, container: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.request("GET", f"/containers/{container}/json")[1]
+        except DockerAPIError as exc:
+            if exc.status == 404:
+                return None
+            raise
+
+    def container_wait(self, container: str) -> int:
+        """Block until *container* stops; return its exit code."""
+        conn, resp = self.stream("POST", f"/containers/{container}/wait")
+        try:
+            return int(json.loads(resp.read()).get("StatusCode", -1))
+        finally:
+            conn.close()
+
+    def container_kill(self, container: str) -> None:
+        self.request("POST", f"/containers/{container}/kill", expect=(204, 404, 409))
+
+    def container_remove(self, container: str, force: bool = True) -> None:
+        self.request(
+            "DELETE",
+            f"/containers/{container}",
+            params={"force": "1" if force else "0"},
+            expect=(204, 404, 409),
+        )
+
+    def container_logs(self, container: str, follow: bool = True) -> Iterator[Tuple[int, bytes]]:
+        """Yield ``(stream_id, payload)`` frames of the container output."""
+        params = {"stdout": "1", "stderr": "1", "follow": "1" if follow else "0"}
+        conn, resp = self.stream("GET", f"/containers/{container}/logs", params=params)
+        try:
+            yield from iter_frames(resp)
+        finally:
+            conn.close()
+
+    # ── Exec ─────────────────────────────────────────────────
+
+    def exec_create(
+        self,
+        container: str,
+        cmd: List[str],
+        env: Optional[Dict[str, str]] = None,
+    ) -> str:
+        body = {
+            "Cmd": cmd,
+            "Env": [f"{k}={v}" for k, v in (env or {}).items()],
+            "AttachStdout": True,
+            "AttachStderr": True,
+        }
+        return self.request("POST", f"/containers/{container}/exec", body=body)[1]["Id"]
+
+    def exec_start(self, exec_id: str) -> Iterator[Tuple[int, bytes]]:
+        """Run the exec instance and yield its output frames until it exits."""
+        conn, resp = self.stream(
+            "POST", f"/exec/{exec_id}/start", body={"Detach": False, "Tty": False}
+        )
+        try:
+            yield from iter_frames(resp)
+        finally:
+            conn.close()
+
+    def exec_inspect(self, exec_id: str) -> Dict[str, Any]:
+        return self.request("GET", f"/exec/{exec_id}/json")[1]
+
+
+def iter_frames(resp: http.client.HTTPResponse) -> Iterator[Tuple[int, bytes]]:
+    """Decode the multiplexed stdout/stderr stream format."""
+    while True:
+        header = resp.read(8)
+        if len(header) < 8:
+            return
+        stream_id, size = struct.unpack(">BxxxL", header)
+        payload = resp.read(size)
+        if not payload:
+            return
+        yield stream_id, payload
+
+
+def split_image_ref(image: str) -> Tuple[str, str]:
+    """Split ``repo[:tag]`` into ``(repo, tag)``; digests stay in *repo*."""
+    if "@" in image:
+        return image, ""
+    name, sep, tag = image.rpartition(":")
+    if sep and "/" not in tag:
+        return name, tag
+    return image, "latest"
+
+
+_client: Optional[DockerEngineClient] = None
+_client_checked = False
+_client_lock = threading.Lock()
+
+
+def get_engine_client() -> Optional[DockerEngineClient]:
+    """Return a shared client if the daemon socket answers ``/_ping``.
+
+    The probe runs once per process; ``None`` means "use the CLI".
+    """
+    global _client, _client_checked
+    with _client_lock:
+        if not _client_checked:
+            _client_checked = True
+            path = socket_path_from_env()
+            if path and os.path.exists(path):
+                client = DockerEngineClient(path)
+                if client.ping():
+                    _client = client
+        return _client
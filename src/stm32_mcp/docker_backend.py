@@ -0,0 +1,424 @@
+"""Docker backends: Engine API over the unix socket, or the ``docker`` CLI.
+
+:class:`DockerRunner` and :class:`ContainerPool` talk to Docker only through
+the backend returned by :func:`get_backend`.  Both backends offer the same
+small surface:
+
+* ``available`` / ``version`` / ``image_id`` / ``pull``
+* ``events`` – a blocking iterator over daemon events
+* ``start_detached`` / ``is_running`` / ``kill`` / ``remove`` for pooled
+  containers
+* ``run`` (one-shot container) and ``exec`` (in a running container), which
+  return a :class:`BuildProcess` streaming output lines as they arrive.
+
+:class:`ApiBackend` is preferred because it avoids forking a CLI process per
+call; any transport error falls back to :class:`CliBackend` for that call.
+
+Configuration via environment:
+
+* ``STM32_MCP_DOCKER_BACKEND`` – ``auto`` (default), ``api`` or ``cli``
+"""
+
+import codecs
+import functools
+import http.client
+import json
+import os
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .docker_api import STDERR, STDOUT, DockerAPIError, DockerEngineClient, get_engine_client
+
+# Called with (stream_id, line) for every output line, newline included.
+LineSink = Callable[[int, str], None]
+
+
+@dataclass
+class ContainerSpec:
+    """Everything needed to create a build container."""
+    image: str
+    binds: List[str]
+    name: str = ""
+    labels: Dict[str, str] = field(default_factory=dict)
+    network: str = "none"
+    tmpfs: Dict[str, str] = field(default_factory=dict)  # path -> mount options
+    cap_add: List[str] = field(default_factory=list)
+    security_opt: List[str] = field(default_factory=list)
+
+    def mount_profile(self) -> str:
+        """Describe the mounts and privileges fixed at container creation."""
+        parts = [f"tmpfs={path}:{opts}" for path, opts in sorted(self.tmpfs.items())]
+        parts += [f"cap={cap}" for cap in sorted(self.cap_add)]
+        parts += [f"security={opt}" for opt in sorted(self.security_opt)]
+        return ";".join(parts)
+
+    def host_config(self) -> Dict[str, Any]:
+        """Engine API ``HostConfig`` fields beyond binds and network."""
+        config: Dict[str, Any] = {}
+        if self.tmpfs:
+            config["Tmpfs"] = dict(self.tmpfs)
+        if self.cap_add:
+            config["CapAdd"] = list(self.cap_add)
+        if self.security_opt:
+            config["SecurityOpt"] = list(self.security_opt)
+        return config
+
+
+# ── Build processes ──────────────────────────────────────────
+
+class BuildProcess:
+    """A running ``build.sh`` whose output is being pumped to a sink."""
+
+    def wait(self, timeout: float) -> Optional[int]:
+        """Return the exit code, or ``None`` if still running after *timeout*."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Stop reading output and release client-side resources."""
+        raise NotImplementedError
+
+
+class _CliProcess(BuildProcess):
+    def __init__(self, cmd: List[str], sink: LineSink) -> None:
+        self._proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+            bufsize=1,
+        )
+        self._pumps = [
+            threading.Thread(target=_pump_stream, args=(stream, sid, sink), daemon=True)
+            for stream, sid in ((self._proc.stdout, STDOUT), (self._proc.stderr, STDERR))
+        ]
+        for t in self._pumps:
+            t.start()
+
+    def wait(self, timeout: float) -> Optional[int]:
+        try:
+            code = self._proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return None
+        for t in self._pumps:
+            t.join(timeout=10)
+        return code
+
+    def close(self) -> None:
+        if self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        for t in self._pumps:
+            t.join(timeout=10)
+
+
+class _ApiProcess(BuildProcess):
+    """Pumps multiplexed frames from the API, then fetches the exit code."""
+
+    def __init__(
+        self,
+        frames: Iterator[Tuple[int, bytes]],
+        exit_code: Callable[[], int],
+        sink: LineSink,
+        cleanup: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self._frames = frames
+        self._exit_code = exit_code
+        self._sink = sink
+        self._cleanup = cleanup
+        self._code: Optional[int] = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+
+    def _pump(self) -> None:
+        decoders = {sid: codecs.getincrementaldecoder("utf-8")("replace") for sid in (STDOUT, STDERR)}
+        partial = {STDOUT: "", STDERR: ""}
+        try:
+            for sid, payload in self._frames:
+                if sid not in decoders:
+                    continue
+                text = partial[sid] + decoders[sid].decode(payload)
+                *lines, partial[sid] = text.split("\n")
+                for line in lines:
+                    self._sink(sid, line + "\n")
+            for sid, rest in partial.items():
+                rest += decoders[sid].decode(b"", final=True)
+                if rest:
+                    self._sink(sid, rest)
+            self._code = self._exit_code()
+        except (OSError, http.client.HTTPException, DockerAPIError, ValueError):
+            self._code = -1
+        finally:
+            if self._cleanup is not None:
+                try:
+                    self._cleanup()
+                except (OSError, http.client.HTTPException, DockerAPIError):
+                    pass
+            self._done.set()
+
+    def wait(self, timeout: float) -> Optional[int]:
+        if not self._done.wait(timeout):
+            return None
+        return self._code
+
+    def close(self) -> None:
+        # The stream ends once the container / exec'd process is killed.
+        self._thread.join(timeout=10)
+
+
+def _pump_stream(stream: Any, stream_id: int, sink: LineSink) -> None:
+    for line in stream:
+        sink(stream_id, line)
+    stream.close()
+
+
+# ── CLI backend ──────────────────────────────────────────────
+
+class CliBackend:
+    """Drives Docker through the ``docker`` command line client."""
+
+    name = "cli"
+
+    def _run(self, args: List[str], timeout: float) -> Optional[subprocess.CompletedProcess]:
+        try:
+            return subprocess.run(
+                ["docker", *args], capture_output=True, text=True, timeout=timeout
+            )
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            return None
+
+    def available(self) -> bool:
+        r = self._run(["info"], timeout=10)
+        return r is not None and r.returncode == 0
+
+    def version(self) -> str:
+        r = self._run(["--version"], timeout=5)
+        return r.stdout.strip() if r is not None and r.returncode == 0 else ""
+
+    def image_id(self, image: str) -> str:
+        r = self._run(["image", "inspect", "--format", "{{.Id}}", image], timeout=10)
+        return r.stdout.strip() if r is not None and r.returncode == 0 else ""
+
+    def pull(self, image: str) -> bool:
+        r = self._run(["pull", image], timeout=600)  # large images may take a while
+        return r is not None and r.returncode == 0
+
+    def events(self, types: List[str]) -> Iterator[Dict[str, Any]]:
+        cmd = ["docker", "events", "--format", "{{json .}}"]
+        for t in types:
+            cmd += ["--filter", f"type={t}"]
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        try:
+            for line in proc.stdout:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        finally:
+            proc.kill()
+            proc.wait()
+
+    def _create_args(self, spec: ContainerSpec) -> List[str]:
+        args = [f"--network={spec.network}"]
+        if spec.name:
+            args += ["--name", spec.name]
+        for key, value in spec.labels.items():
+            args += ["--label", f"{key}={value}"]
+        for bind in spec.binds:
+            args += ["-v", bind]
+        for path, opts in spec.tmpfs.items():
+            args += ["--tmpfs", f"{path}:{opts}" if opts else path]
+        for cap in spec.cap_add:
+            args += ["--cap-add", cap]
+        for opt in spec.security_opt:
+            args += ["--security-opt", opt]
+        return args
+
+    def start_detached(self, spec: ContainerSpec, cmd: List[str]) -> bool:
+        r = self._run(
+            ["run", "-d", "--rm", *self._create_args(spec), spec.image, *cmd], timeout=60
+        )
+        return r is not None and r.returncode == 0
+
+    def is_running(self, name: str) -> bool:
+        r = self._run(["inspect", "-f", "{{.State.Running}}", name], timeout=10)
+        return r is not None and r.returncode == 0 and r.stdout.strip() == "true"
+
+    def kill(self, name: str) -> None:
+        self._run(["kill", name], timeout=30)
+
+    def remove(self, name: str) -> None:
+        self._run(["rm", "-f", name], timeout=30)
+
+    @staticmethod
+    def _env_args(env: Dict[str, str]) -> List[str]:
+        return [arg for k, v in env.items() for arg in ("-e", f"{k}={v}")]
+
+    def run(
+        self, spec: ContainerSpec, env: Dict[str, str], cmd: List[str], sink: LineSink
+    ) -> BuildProcess:
+        return _CliProcess(
+            ["docker", "run", "--rm", *self._create_args(spec), *self._env_args(env),
+             spec.image, *cmd],
+            sink,
+        )
+
+    def exec(
+        self, name: str, env: Dict[str, str], cmd: List[str], sink: LineSink
+    ) -> BuildProcess:
+        return _CliProcess(["docker", "exec", *self._env_args(env), name, *cmd], sink)
+
+
+# ── Engine API backend ───────────────────────────────────────
+
+_TRANSPORT_ERRORS = (OSError, http.client.HTTPException)
+
+
+def _cli_fallback(method: Callable) -> Callable:
+    """Retry *method* on the CLI backend if the socket transport fails."""
+
+    @functools.wraps(method)
+    def wrapper(self: "ApiBackend", *args: Any, **kwargs: Any) -> Any:
+        try:
+            return method(self, *args, **kwargs)
+        except _TRANSPORT_ERRORS:
+            return getattr(self.cli, method.__name__)(*args, **kwargs)
+
+    return wrapper
+
+
+class ApiBackend:
+    """Drives Docker through the Engine API on the local unix socket."""
+
+    name = "api"
+
+    def __init__(self, client: DockerEngineClient) -> None:
+        self.client = client
+        self.cli = CliBackend()
+
+    @_cli_fallback
+    def available(self) -> bool:
+        return self.client.ping()
+
+    @_cli_fallback
+    def version(self) -> str:
+        info = self.client.version()
+        return f"Docker version {info.get('Version', '?')}, API {info.get('ApiVersion', '?')}"
+
+    def events(self, types: List[str]) -> Iterator[Dict[str, Any]]:
+        # A generator cannot fall back mid-stream; callers reconnect.
+        return self.client.events(types)
+
+    @_cli_fallback
+    def image_id(self, image: str) -> str:
+        try:
+            info = self.client.image_inspect(image)
+        except DockerAPIError:
+            return ""
+        return info.get("Id", "") if info else ""
+
+    @_cli_fallback
+    def pull(self, image: str) -> bool:
+        try:
+            self.client.image_pull(image)
+        except DockerAPIError:
+            return False
+        return True
+
+    @_cli_fallback
+    def start_detached(self, spec: ContainerSpec, cmd: List[str]) -> bool:
+        try:
+            cid = self.client.container_create(
+                spec.image, cmd, name=spec.name, binds=spec.binds,
+                labels=spec.labels, network_mode=spec.network, auto_remove=True,
+                extra_host_config=spec.host_config(),
+            )
+            self.client.container_start(cid)
+        except DockerAPIError:
+            return False
+        return True
+
+    @_cli_fallback
+    def is_running(self, name: str) -> bool:
+        try:
+            info = self.client.container_inspect(name)
+        except DockerAPIError:
+            return False
+        return bool(info and info.get("State", {}).get("Running"))
+
+    @_cli_fallback
+    def kill(self, name: str) -> None:
+        self.client.container_kill(name)
+
+    @_cli_fallback
+    def remove(self, name: str) -> None:
+        self.client.container_remove(name, force=True)
+
+    def run(
+        self, spec: ContainerSpec, env: Dict[str, str], cmd: List[str], sink: LineSink
+    ) -> BuildProcess:
+        # Only the create step falls back to the CLI: once the container
+        # exists, a transport error may hide a build that is already running,
+        # and running it again through the CLI would do the work twice.
+        client = self.client
+        try:
+            cid = client.container_create(
+                spec.image, cmd, name=spec.name, binds=spec.binds, env=env,
+                labels=spec.labels, network_mode=spec.network,
+                extra_host_config=spec.host_config(),
+            )
+        except _TRANSPORT_ERRORS:
+            return self.cli.run(spec, env, cmd, sink)
+        try:
+            client.container_start(cid)
+        except (DockerAPIError, *_TRANSPORT_ERRORS):
+            try:
+                client.container_remove(cid, force=True)
+            except (DockerAPIError, *_TRANSPORT_ERRORS):
+                pass
+            raise
+        # Not auto-removed: the exit code is read after the log stream ends.
+        return _ApiProcess(
+            client.container_logs(cid, follow=True),
+            lambda: client.container_wait(cid),
+            sink,
+            cleanup=lambda: client.container_remove(cid, force=True),
+        )
+
+    def exec(
+        self, name: str, env: Dict[str, str], cmd: List[str], sink: LineSink
+    ) -> BuildProcess:
+        # As in run(): no CLI retry once the exec instance exists.
+        client = self.client
+        try:
+            exec_id = client.exec_create(name, cmd, env=env)
+        except _TRANSPORT_ERRORS:
+            return self.cli.exec(name, env, cmd, sink)
+
+        def exit_code() -> int:
+            code = client.exec_inspect(exec_id).get("ExitCode")
+            return -1 if code is None else int(code)
+
+        return _ApiProcess(client.exec_start(exec_id), exit_code, sink)
+
+
+# ── Backend selection ────────────────────────────────────────
+
+_backend: Optional[Any] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Any:
+    """Return the process-wide backend (:class:`ApiBackend` when possible)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            mode = os.environ.get("STM32_MCP_DOCKER_BACKEND", "auto").lower()
+            client = get_engine_client() if mode != "cli" else None
+            _backend = ApiBackend(client) if client is not None else CliBackend()
+        return _backend
@@ -1,21 +1,41 @@
 """Docker container runner for STM32 compilation.
 
 Manages Docker image lifecycle (check/pull/build) and runs
-STM32 builds inside isolated containers.
+STM32 builds inside isolated containers.  Docker is reached through
+:func:`docker_backend.get_backend` – the Engine API socket when available,
+the ``docker`` CLI otherwise.
 """
 
+import dataclasses
+import hashlib
 import importlib.resources
-import subprocess
+import os
 import sys
-import tempfile
+import threading
+import time
+import uuid
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import IO, Any, Callable, Dict, List, Optional
+
+from .build_profile import read_compile_profile, read_container_phases
+from .container_pool import PooledContainer, get_pool
+from .docker_api import STDERR, STDOUT
+from .docker_backend import BuildProcess, ContainerSpec, get_backend
+from .gcc_parse import PathMapper
+from .readiness import get_readiness
+from .source_filter import IgnoreRules, write_sync_list
 
 
 class DockerRunner:
     """Manages Docker toolchain images and runs STM32 builds."""
 
     DEFAULT_IMAGE = "legogogoagent/stm32-toolchain:latest"
+    CCACHE_VOLUME = "stm32-mcp-ccache"
+    CCACHE_MAX_SIZE = os.environ.get("STM32_MCP_CCACHE_SIZE", "2G")
+    # Container mount points; build.sh compiles in PROJECT_DIR
+    SRC_MOUNT = "/src"
+    WORK_MOUNT = "/work"
+    PROJECT_DIR = "/work/project"
 
     def __init__(self, image: str = DEFAULT_IMAGE) -> None:
         self.image = image
@@ -23,58 +43,33 @@ class DockerRunner:
     # ── Docker availability ──────────────────────────────────
 
     def is_docker_available(self) -> bool:
-        """Return True if the Docker CLI is installed and the daemon is reachable."""
-        try:
-            r = subprocess.run(
-                ["docker", "info"],
-                capture_output=True,
-                timeout=10,
-            )
-            return r.returncode == 0
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            return False
+        """Return True if the Docker daemon is reachable (cached, see readiness)."""
+        return get_readiness().docker_status()[0]
 
     def docker_version(self) -> str:
         """Return human-readable Docker version string."""
-        try:
-            r = subprocess.run(
-                ["docker", "--version"],
-                capture_output=True,
-                text=True,
-                timeout=5,
-            )
-            return r.stdout.strip() if r.returncode == 0 else ""
-        except Exception:
-            return ""
+        return get_readiness().docker_status()[1]
 
     # ── Image management ─────────────────────────────────────
 
     def is_image_available(self) -> bool:
         """Return True if *self.image* exists in the local Docker cache."""
-        try:
-            r = subprocess.run(
-                ["docker", "images", "-q", self.image],
-                capture_output=True,
-                text=True,
-                timeout=10,
-            )
-            return bool(r.stdout.strip())
-        except Exception:
-            return False
+        return bool(self.image_digest())
+
+    def image_digest(self) -> str:
+        """Return the local image ID of *self.image* (``""`` if unknown).
+
+        Served from the process-wide readiness cache, which Docker image
+        events and ``pull`` invalidate.
+        """
+        return get_readiness().image_digest(self.image)
 
     def pull_image(self) -> bool:
         """Pull *self.image* from the registry.  Returns True on success."""
-        try:
-            print(f"Pulling Docker image {self.image} …", file=sys.stderr)
-            r = subprocess.run(
-                ["docker", "pull", self.image],
-                capture_output=True,
-                text=True,
-                timeout=600,  # large images may take a while
-            )
-            return r.returncode == 0
-        except Exception:
-            return False
+        print(f"Pulling Docker image {self.image} …", file=sys.stderr)
+        ok = get_backend().pull(self.image)
+        get_readiness().invalidate(self.image)
+        return ok
 
     def ensure_image(self) -> Dict[str, Any]:
         """Make sure the toolchain image is available.
@@ -107,6 +102,17 @@ class DockerRunner:
         with importlib.resources.as_file(ref) as p:
             return str(p)
 
+    @staticmethod
+    def work_volume_name(workspace: Path) -> str:
+        """Return the persistent ``/work`` volume name for *workspace*."""
+        digest = hashlib.sha1(str(workspace).encode()).hexdigest()[:12]
+        return f"stm32-mcp-work-{digest}"
+
+    @classmethod
+    def path_mapper(cls, workspace: str, project_subdir: str = "") -> PathMapper:
+        """Return a mapper from container paths in build logs to *workspace*."""
+        return PathMapper(workspace, project_subdir, (cls.PROJECT_DIR, cls.SRC_MOUNT))
+
     def run_build(
         self,
         workspace: str,
@@ -115,14 +121,65 @@ class DockerRunner:
         jobs: int = 4,
         make_target: str = "all",
         timeout_sec: int = 600,
+        use_pool: bool = True,
+        incremental: bool = False,
+        ccache: bool = False,
+        profile: bool = False,
+        ignore: Optional[List[str]] = None,
+        work_mode: str = "copy",
+        work_tmpfs_mb: int = 0,
+        diagnostics_format: str = "text",
+        cancel_event: Optional[threading.Event] = None,
+        on_line: Optional[Callable[[str], None]] = None,
+        abort_event: Optional[threading.Event] = None,
     ) -> Dict[str, Any]:
         """Run an STM32 build inside a Docker container.
 
         * *workspace* is mounted **read-only** at ``/src``.
         * A temporary ``out/`` directory is mounted **read-write** at ``/out``.
         * The bundled ``build.sh`` is mounted at ``/tools/build.sh``.
+        * Only files passing the ignore rules (defaults,
+          ``.stm32mcpignore`` and *ignore*) are copied into the work tree;
+          the list is written to ``out/.stm32mcp/sync-files``.
+        * With *work_mode* ``"overlay"`` nothing is copied: ``/work/project``
+          is an overlayfs over ``/src`` whose upper layer holds the fixed
+          Makefile and the objects.  The container gets ``CAP_SYS_ADMIN``
+          (and no AppArmor profile) for the mount; ``build.sh`` copies
+          instead if the mount fails.
+        * With *work_tmpfs_mb* > 0, ``/work`` is a RAM-backed tmpfs of that
+          size instead of the work volume.  Incremental state then lives
+          only as long as the pooled container.
+        * With *diagnostics_format* ``"json"``, GCC's JSON diagnostics are
+          collected in ``out/.stm32mcp/diagnostics.jsonl`` (see
+          :func:`gcc_parse.parse_json_diagnostics`); the file is absent if
+          the toolchain cannot produce them.
+        * With *incremental*, a named volume keyed by the workspace path is
+          mounted at ``/work`` and ``build.sh`` only syncs changed files
+          into it, so object files survive between builds.
+        * With *ccache*, the shared ``stm32-mcp-ccache`` volume is mounted at
+          ``/ccache`` and the cross compilers are wrapped with ccache
+          (size-capped by ``STM32_MCP_CCACHE_SIZE``, default ``2G``).
+        * With *profile*, every compiler call is timed and the per-file
+          summary is returned in ``profile``.
 
-        Returns ``{ok, exit_code, outdir, stdout, stderr}``.
+        With *use_pool* the build runs via ``docker exec`` in a warm
+        container from the shared :class:`ContainerPool`; otherwise (or when
+        the pool cannot serve the request) a one-shot ``docker run --rm`` is
+        used.
+
+        Output is streamed: *on_line* is called (from reader threads) with
+        every stdout/stderr line as soon as the container prints it, and
+        each stream is spooled to ``out/.stm32mcp/stdout.log`` /
+        ``stderr.log`` rather than kept in memory.
+
+        On timeout, or when *cancel_event* / *abort_event* is set, the
+        container itself is killed (not just the ``docker`` client) and
+        ``cancelled`` / ``aborted`` / ``error`` are set in the result.
+
+        Returns ``{ok, exit_code, outdir, stdout_log, stderr_log, pool, ccache,
+        phases, profile, sync, cancelled, aborted}``; *phases* holds the
+        seconds spent in each ``build.sh`` step, *sync* the number of
+        input files/bytes and how many of them were actually copied.
         """
         workspace_path = Path(workspace).resolve()
         if not workspace_path.is_dir():
@@ -135,43 +192,253 @@ class DockerRunner:
         # Locate bundled build script
         build_script = self.get_build_script_path()
 
-        docker_cmd = [
-            "docker", "run", "--rm",
-            "--network=none",
-            "-v", f"{workspace_path}:/src:ro",
-            "-v", f"{outdir}:/out:rw",
-            "-v", f"{build_script}:/tools/build.sh:ro",
-            "-e", f"CLEAN={1 if clean else 0}",
-            "-e", f"JOBS={jobs}",
-            "-e", f"MAKE_TARGET={make_target}",
-            "-e", f"PROJECT_SUBDIR={project_subdir}",
-            self.image,
-            "bash", "/tools/build.sh",
+        # Reports from an earlier run must not be mistaken for this one's
+        for report in (
+            "phases.tsv", "tu-times.tsv", ".stm32mcp/sync-stats", ".stm32mcp/work-mode",
+            ".stm32mcp/diagnostics.jsonl",
+        ):
+            (outdir / report).unlink(missing_ok=True)
+
+        # Input file list for build.sh (ignore rules applied on the host)
+        rules = IgnoreRules.for_workspace(workspace_path, project_subdir, ignore)
+        input_files, input_bytes = write_sync_list(
+            workspace_path, rules, outdir / ".stm32mcp" / "sync-files"
+        )
+
+        binds = [
+            f"{workspace_path}:{self.SRC_MOUNT}:ro",
+            f"{outdir}:/out:rw",
+            f"{build_script}:/tools/build.sh:ro",
         ]
+        work_bind = f"{self.work_volume_name(workspace_path)}:{self.WORK_MOUNT}"
+        cache_bind = f"{self.CCACHE_VOLUME}:/ccache"
+        env = {
+            "CCACHE": str(int(ccache)),
+            "CCACHE_MAXSIZE": self.CCACHE_MAX_SIZE,
+            "CLEAN": str(int(clean)),
+            "INCREMENTAL": str(int(incremental)),
+            "JOBS": str(jobs),
+            "MAKE_TARGET": make_target,
+            "PROJECT_SUBDIR": project_subdir,
+            "PROFILE": str(int(profile)),
+            "SYNC_LIST": "/out/.stm32mcp/sync-files",
+            "WORK_MODE": work_mode,
+            "DIAG_FORMAT": "json" if diagnostics_format == "json" else "",
+        }
+        cmd = ["bash", "/tools/build.sh"]
 
-        try:
-            result = subprocess.run(
-                docker_cmd,
-                capture_output=True,
-                text=True,
-                timeout=timeout_sec,
+        # Mount profile: where /work lives and what the overlay mount needs
+        base_spec = ContainerSpec(image=self.image, binds=binds)
+        if work_tmpfs_mb > 0:
+            base_spec.tmpfs[self.WORK_MOUNT] = f"rw,exec,size={work_tmpfs_mb}m"
+            work_binds: List[str] = []
+        else:
+            work_binds = [work_bind]
+        if work_mode == "overlay":
+            base_spec.cap_add.append("SYS_ADMIN")
+            base_spec.security_opt.append("apparmor=unconfined")
+
+        backend = get_backend()
+        pool = get_pool()
+        container: Optional[PooledContainer] = None
+        pool_status = "disabled"
+        if use_pool:
+            # pooled containers always get the work and cache volumes so
+            # that toggling incremental / ccache does not need a new container
+            container, pool_status = pool.acquire(
+                str(workspace_path),
+                dataclasses.replace(base_spec, binds=binds + work_binds + [cache_bind]),
             )
+        target = container.name if container is not None else (
+            f"stm32-mcp-build-{uuid.uuid4().hex[:12]}"
+        )
+
+        spool = _LogSpool(outdir / ".stm32mcp")
+
+        def sink(stream_id: int, line: str) -> None:
+            spool.write(stream_id, line)
+            if on_line is not None:
+                on_line(line.rstrip("\n"))
+
+        healthy = True
+        try:
+            proc: BuildProcess
+            if container is not None:
+                proc = backend.exec(container.name, env, cmd, sink)
+            else:
+                # the overlay's upper layer must not sit on the container's
+                # own overlay root, so overlay mode also needs /work mounted
+                spec = dataclasses.replace(
+                    base_spec,
+                    binds=binds
+                    + (work_binds if incremental or work_mode == "overlay" else [])
+                    + ([cache_bind] if ccache else []),
+                    name=target,
+                )
+                proc = backend.run(spec, env, cmd, sink)
+
+            deadline = time.monotonic() + timeout_sec
+            error = ""
+            while True:
+                returncode = proc.wait(timeout=0.5)
+                if returncode is not None:
+                    break
+                if cancel_event is not None and cancel_event.is_set():
+                    error = "Build cancelled"
+                elif abort_event is not None and abort_event.is_set():
+                    error = "Build aborted"
+                elif time.monotonic() > deadline:
+                    error = f"Build timed out after {timeout_sec}s"
+                else:
+                    continue
+                # Killing only the client would leave the build running in
+                # the container.  A killed pooled container is also dropped
+                # from the pool on release.
+                healthy = False
+                self.kill_container(target)
+                break
+            proc.close()
+            spool.close()
+
+            if error:
+                return {
+                    "ok": False,
+                    "exit_code": -1,
+                    "error": error,
+                    "cancelled": error == "Build cancelled",
+                    "aborted": error == "Build aborted",
+                    "outdir": str(outdir),
+                    **spool.paths(),
+                    "pool": {"status": pool_status, **pool.stats()},
+                }
+            # 125-127 come from docker itself, not from the build
+            healthy = 0 <= returncode < 125
+            if not healthy:
+                get_readiness().invalidate()
             return {
-                "ok": result.returncode == 0,
-                "exit_code": result.returncode,
+                "ok": returncode == 0,
+                "exit_code": returncode,
                 "outdir": str(outdir),
-                "stdout": result.stdout,
-                "stderr": result.stderr,
-            }
-        except subprocess.TimeoutExpired:
-            return {
-                "ok": False,
-                "exit_code": -1,
-                "error": f"Build timed out after {timeout_sec}s",
+                **spool.paths(),
+                "pool": {"status": pool_status, **pool.stats()},
+                "ccache": read_ccache_stats(outdir) if ccache else None,
+                "phases": read_container_phases(outdir),
+                "profile": read_compile_profile(outdir) if profile else None,
+                "sync": {
+                    "input_files": input_files,
+                    "input_bytes": input_bytes,
+                    **read_sync_stats(outdir),
+                    "work_mode": _read_text(outdir / ".stm32mcp" / "work-mode"),
+                    "work_tmpfs_mb": work_tmpfs_mb,
+                },
+                "cancelled": False,
+                "aborted": False,
             }
         except Exception as exc:
+            healthy = False
+            get_readiness().invalidate()
             return {
                 "ok": False,
                 "exit_code": -1,
                 "error": str(exc),
+                "pool": {"status": pool_status, **pool.stats()},
             }
+        finally:
+            spool.close()
+            if container is not None:
+                pool.release(container, healthy=healthy)
+
+    def kill_container(self, name: str) -> None:
+        """Kill a running container (ignored if it is already gone)."""
+        get_backend().kill(name)
+
+
+class _LogSpool:
+    """Writes container stdout/stderr lines to one file per stream.
+
+    The backend's reader threads call :meth:`write` concurrently, so
+    writes are serialised.  Lines arriving after :meth:`close` (a reader
+    still draining a killed container) are dropped.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        self.stdout_path = directory / "stdout.log"
+        self.stderr_path = directory / "stderr.log"
+        self._lock = threading.Lock()
+        self._files: Dict[int, IO[str]] = {
+            STDOUT: open(self.stdout_path, "w", encoding="utf-8", errors="replace"),
+            STDERR: open(self.stderr_path, "w", encoding="utf-8", errors="replace"),
+        }
+
+    def write(self, stream_id: int, line: str) -> None:
+        with self._lock:
+            f = self._files.get(stream_id if stream_id == STDOUT else STDERR)
+            if f is not None:
+                f.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+    def paths(self) -> Dict[str, str]:
+        return {"stdout_log": str(self.stdout_path), "stderr_log": str(self.stderr_path)}
+
+
+def _read_text(path: Path) -> str:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return ""
+
+
+def read_sync_stats(outdir: Path) -> Dict[str, int]:
+    """Return ``{files_copied, bytes_copied}`` written by ``build.sh``."""
+    return _read_print_stats(outdir / ".stm32mcp" / "sync-stats")
+
+
+# ── ccache statistics ────────────────────────────────────────
+
+def _read_print_stats(path: Path) -> Dict[str, int]:
+    """Parse ``ccache --print-stats`` output (``key<TAB>value`` lines)."""
+    stats: Dict[str, int] = {}
+    try:
+        for line in path.read_text().splitlines():
+            key, _, value = line.partition("\t")
+            if value.strip().isdigit():
+                stats[key.strip()] = int(value)
+    except OSError:
+        pass
+    return stats
+
+
+def read_ccache_stats(outdir: Path) -> Optional[Dict[str, Any]]:
+    """Return ccache hit/miss/size figures for the build that just ran.
+
+    ``build.sh`` snapshots ``ccache --print-stats`` before and after make;
+    counters are the difference, sizes are the state afterwards.  The
+    cache is shared, so counters include any build that ran concurrently.
+    """
+    after = _read_print_stats(outdir / "ccache-stats.after")
+    if not after:
+        return None
+    before = _read_print_stats(outdir / "ccache-stats.before")
+
+    def delta(key: str) -> int:
+        return after.get(key, 0) - before.get(key, 0)
+
+    hits = delta("direct_cache_hit") + delta("preprocessed_cache_hit")
+    misses = delta("cache_miss")
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "direct_hits": delta("direct_cache_hit"),
+        "preprocessed_hits": delta("preprocessed_cache_hit"),
+        "misses": misses,
+        "uncacheable": delta("uncacheable_call") + delta("unsupported_compiler_option"),
+        "hit_rate": round(hits / lookups, 3) if lookups else None,
+        "files_in_cache": after.get("files_in_cache", 0),
+        "cache_size_kb": after.get("cache_size_kibibyte", 0),
+    }
@@ -0,0 +1,216 @@
+"""Read-only ELF32 reader for size and symbol queries.
+
+Answers the questions ``arm-none-eabi-size`` / ``nm`` would, without a
+toolchain container: the ``.elf`` is memory-mapped, the section headers and
+the symbol table (``.symtab``) are indexed once, and queries run against
+the in-memory index.  Only ELF32 (either byte order) is supported, which
+covers every Cortex-M image.
+
+Indexes are cached per file hash (see :func:`build_cache.file_digest`,
+which only re-reads a file whose size or mtime changed), so repeated queries
+about the same build skip both the hashing and the parsing.
+"""
+
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .build_cache import file_digest
+
+_CACHE_ENTRIES = 8
+
+_ELFCLASS32 = 1
+_ELFDATA2LSB = 1
+_EM_ARM = 40
+_SHN_UNDEF = 0
+_SHN_LORESERVE = 0xFF00
+_SHN_ABS = 0xFFF1
+_SHN_COMMON = 0xFFF2
+_SHN_XINDEX = 0xFFFF
+
+_SHT_SYMTAB = 2
+_SHT_NOBITS = 8
+_SHF_WRITE = 0x1
+_SHF_ALLOC = 0x2
+_SHF_EXECINSTR = 0x4
+
+_SYMBOL_TYPES = {0: "notype", 1: "object", 2: "func", 3: "section", 4: "file", 5: "common", 6: "tls"}
+_SYMBOL_BINDS = {0: "local", 1: "global", 2: "weak"}
+
+# (name, address, size, type, bind, section)
+Symbol = Tuple[str, int, int, str, str, str]
+
+
+def _cstring(data: mmap.mmap, offset: int) -> str:
+    end = data.find(b"\0", offset)
+    return data[offset:end if end >= 0 else len(data)].decode("utf-8", errors="replace")
+
+
+def _symbol_dict(symbol: Symbol) -> Dict[str, Any]:
+    name, address, size, kind, bind, section = symbol
+    return {
+        "name": name,
+        "address": f"0x{address:08x}",
+        "size": size,
+        "type": kind,
+        "bind": bind,
+        "section": section,
+    }
+
+
+class ElfImage:
+    """Section and symbol index of one ELF32 file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.sections: List[Dict[str, Any]] = []
+        self.symbols: List[Symbol] = []
+        self._by_name: Dict[str, Symbol] = {}
+        self._by_size: Optional[List[Symbol]] = None
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            self._index(data)
+
+    # ── Indexing ─────────────────────────────────────────────
+
+    def _index(self, data: mmap.mmap) -> None:
+        if len(data) < 52 or data[:4] != b"\x7fELF":
+            raise ValueError(f"{self.path.name}: not an ELF file")
+        if data[4] != _ELFCLASS32:
+            raise ValueError(f"{self.path.name}: only ELF32 is supported")
+        endian = "<" if data[5] == _ELFDATA2LSB else ">"
+        (_, self.machine, _, self.entry, _, shoff, _, _, _, _,
+         shentsize, shnum, shstrndx) = struct.unpack_from(endian + "HHIIIIIHHHHHH", data, 16)
+
+        section_header = struct.Struct(endian + "10I")
+        if shoff == 0:
+            return
+        if shnum == 0 or shstrndx == _SHN_XINDEX:
+            # more than 0xff00 sections: the real values live in section 0
+            first = section_header.unpack_from(data, shoff)
+            shnum = shnum or first[5]
+            shstrndx = first[6] if shstrndx == _SHN_XINDEX else shstrndx
+        headers = [section_header.unpack_from(data, shoff + i * shentsize) for i in range(shnum)]
+
+        names_offset = headers[shstrndx][4] if shstrndx < shnum else 0
+        names: List[str] = []
+        for (sh_name, sh_type, sh_flags, sh_addr, _, sh_size, _, _, _, _) in headers:
+            name = _cstring(data, names_offset + sh_name) if names_offset else ""
+            names.append(name)
+            if sh_flags & _SHF_ALLOC and sh_size:
+                self.sections.append({
+                    "name": name,
+                    "address": f"0x{sh_addr:08x}",
+                    "size": sh_size,
+                    "kind": (
+                        "bss" if sh_type == _SHT_NOBITS
+                        else "data" if sh_flags & _SHF_WRITE
+                        else "text"
+                    ),
+                    "flags": "".join(flag for bit, flag in (
+                        (_SHF_WRITE, "W"), (_SHF_ALLOC, "A"), (_SHF_EXECINSTR, "X")
+                    ) if sh_flags & bit),
+                })
+
+        for header in headers:
+            if header[1] == _SHT_SYMTAB:
+                self._index_symbols(data, endian, header, headers[header[6]][4], names)
+                break
+
+    def _index_symbols(
+        self, data: mmap.mmap, endian: str, symtab: Tuple[int, ...], strtab: int, names: List[str]
+    ) -> None:
+        entry = struct.Struct(endian + "IIIBBH")
+        offset, size = symtab[4], symtab[5]
+        if symtab[9] not in (0, entry.size):
+            return
+        thumb = self.machine == _EM_ARM
+        by_name = self._by_name
+        table = data[offset:offset + size - size % entry.size]
+        for st_name, value, st_size, info, _, shndx in entry.iter_unpack(table):
+            kind = _SYMBOL_TYPES.get(info & 0xF, "other")
+            if not st_name or kind in ("section", "file"):
+                continue
+            if shndx == _SHN_UNDEF:
+                continue
+            if shndx == _SHN_ABS:
+                section = "*ABS*"
+            elif shndx == _SHN_COMMON:
+                section = "*COM*"
+            elif shndx < _SHN_LORESERVE and shndx < len(names):
+                section = names[shndx]
+            else:
+                section = ""
+            if thumb and kind == "func":
+                value &= ~1  # Thumb bit
+            symbol = (_cstring(data, strtab + st_name), value, st_size, kind,
+                      _SYMBOL_BINDS.get(info >> 4, "other"), section)
+            self.symbols.append(symbol)
+            previous = by_name.get(symbol[0])
+            # a global definition wins over same-named locals
+            if previous is None or (previous[4] == "local" and symbol[4] != "local"):
+                by_name[symbol[0]] = symbol
+
+    # ── Queries ──────────────────────────────────────────────
+
+    def get_symbol(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return the symbol *name* (globals before locals), or ``None``."""
+        symbol = self._by_name.get(name)
+        return _symbol_dict(symbol) if symbol is not None else None
+
+    def top_symbols_by_size(
+        self, count: int = 20, kind: str = "", section: str = ""
+    ) -> List[Dict[str, Any]]:
+        """Return the *count* largest symbols, optionally only of type *kind*
+        (``func``, ``object``) or in sections starting with *section*."""
+        if self._by_size is None:
+            self._by_size = sorted(
+                (s for s in self.symbols if s[2]), key=lambda s: (-s[2], s[0])
+            )
+        result = []
+        for symbol in self._by_size:
+            if kind and symbol[3] != kind:
+                continue
+            if section and not symbol[5].startswith(section):
+                continue
+            result.append(_symbol_dict(symbol))
+            if len(result) >= count > 0:
+                break
+        return result
+
+    def section_sizes(self) -> Dict[str, Any]:
+        """Return the allocated sections and Berkeley ``size`` totals.
+
+        ``{sections, text, data, bss}`` – *text* is read-only contents
+        (code, constants, vectors), *data* initialised writable data (in
+        RAM, with a copy in flash) and *bss* zero-initialised RAM.
+        """
+        totals = {"text": 0, "data": 0, "bss": 0}
+        for section in self.sections:
+            totals[section["kind"]] += section["size"]
+        return {"sections": self.sections, **totals}
+
+
+# ── Cache ────────────────────────────────────────────────────
+
+# file sha256 -> ElfImage, least-recently-used first out
+_images: "OrderedDict[str, ElfImage]" = OrderedDict()
+_images_lock = threading.Lock()
+
+
+def load_elf(path: Path) -> Tuple[ElfImage, str, bool]:
+    """Return ``(index, sha256, cached)`` for the ELF file at *path*."""
+    digest = file_digest(path)
+    with _images_lock:
+        image = _images.get(digest)
+        if image is not None:
+            _images.move_to_end(digest)
+            return image, digest, True
+    image = ElfImage(path)
+    with _images_lock:
+        _images[digest] = image
+        while len(_images) > _CACHE_ENTRIES:
+            _images.popitem(last=False)
+    return image, digest, False
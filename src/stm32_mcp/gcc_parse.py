@@ -4,9 +4,12 @@
 支持GCC编译器错误、LD链接器错误、以及make系统错误。
 """
 
+import json
+import os
+import posixpath
 import re
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
 
 
@@ -38,6 +41,32 @@ class ParsedError:
     raw: str                   # 原始行文本
     code: str = ""             # 错误代码（如果有）
     suggestion: str = ""       # 建议（如果有）
+    tu: str = ""               # 产生该诊断的编译单元（源文件）
+    end_line: int = 0          # 范围结束行（仅 JSON 诊断）
+    end_col: int = 0           # 范围结束列（仅 JSON 诊断）
+    context: str = ""          # 所在函数（如 "In function 'main'"）
+    include_chain: List[str] = field(default_factory=list)      # "file:line"，由内向外
+    notes: List["ParsedError"] = field(default_factory=list)    # 附属的 note
+
+
+# ── 预编译正则 ──────────────────────────────────────────────
+
+# GCC: file:line:col: severity: message（支持 error, warning, note, fatal error）
+_GCC_PATTERN = re.compile(r'^(.*?):(\d+):(\d+):\s*(fatal error|error|warning|note):\s*(.+)$')
+_LD_UNDEFINED = re.compile(r"undefined reference to [`'](\w+)'")
+_LD_MULTIPLE_DEF = re.compile(r"multiple definition of [`'](\w+)'")
+_LD_CANNOT_FIND = re.compile(r"cannot find -(\w+)")
+_LD_SECTION_OVERFLOW = re.compile(r"section [`'](\w+)' will not fit in region [`'](\w+)'")
+_MAKE_ERROR = re.compile(r"make:\s*\*\*\*\s*\[(.*?)\]\s*Error\s*(\d+)")
+_MAKE_NO_RULE = re.compile(r"make:\s*\*\*\*\s*No rule to make target ['\"](.+?)['\"]")
+_TOOLCHAIN_ERROR = re.compile(r"arm-none-eabi-(gcc|g\+\+|ld|as):\s*error:\s*(.+)")
+
+_SEVERITY_MAP = {
+    'error': ErrorSeverity.ERROR,
+    'fatal error': ErrorSeverity.ERROR,
+    'warning': ErrorSeverity.WARNING,
+    'note': ErrorSeverity.NOTE,
+}
 
 
 def parse_gcc_error(line: str, workspace: str = "") -> Optional[ParsedError]:
@@ -53,11 +82,7 @@ def parse_gcc_error(line: str, workspace: str = "") -> Optional[ParsedError]:
     Returns:
         ParsedError对象或None
     """
-    # GCC错误正则表达式
-    # 匹配: file:line:col: severity: message
-    # 支持: error, warning, note, fatal error
-    pattern = r'^(.*?):(\d+):(\d+):\s*(fatal error|error|warning|note):\s*(.+)$'
-    match = re.match(pattern, line)
+    match = _GCC_PATTERN.match(line)
     
     if not match:
         return None
@@ -68,14 +93,7 @@ def parse_gcc_error(line: str, workspace: str = "") -> Optional[ParsedError]:
     severity_str = match.group(4).lower()
     message = match.group(5).strip()
     
-    # 确定严重级别
-    severity_map = {
-        'error': ErrorSeverity.ERROR,
-        'fatal error': ErrorSeverity.ERROR,
-        'warning': ErrorSeverity.WARNING,
-        'note': ErrorSeverity.NOTE,
-    }
-    severity = severity_map.get(severity_str, ErrorSeverity.ERROR)
+    severity = _SEVERITY_MAP.get(severity_str, ErrorSeverity.ERROR)
     
     # 归一化路径
     if workspace:
@@ -109,33 +127,20 @@ def parse_ld_error(line: str, workspace: str = "") -> Optional[ParsedError]:
         ParsedError对象或None
     """
     # 链接错误通常没有文件位置信息
-    undefined_pattern = r"undefined reference to [`'](\w+)'"
-    multiple_def_pattern = r"multiple definition of [`'](\w+)'"
-    cannot_find_pattern = r"cannot find -(\w+)"
-    section_overflow_pattern = r"section [`'](\w+)' will not fit in region [`'](\w+)'"
-    
     message = line.strip()
     file_path = ""
     line_num = 0
     col_num = 0
     
-    if re.search(undefined_pattern, line):
-        match = re.search(undefined_pattern, line)
-        symbol = match.group(1)
-        message = f"未定义的引用: {symbol}"
-    elif re.search(multiple_def_pattern, line):
-        match = re.search(multiple_def_pattern, line)
-        symbol = match.group(1)
-        message = f"多重定义: {symbol}"
-    elif re.search(cannot_find_pattern, line):
-        match = re.search(cannot_find_pattern, line)
-        lib = match.group(1)
-        message = f"找不到库: -l{lib}"
-    elif re.search(section_overflow_pattern, line):
-        match = re.search(section_overflow_pattern, line)
-        section = match.group(1)
-        region = match.group(2)
-        message = f"段溢出: {section} 超出 {region} 区域"
+    match = _LD_UNDEFINED.search(line)
+    if match:
+        message = f"未定义的引用: {match.group(1)}"
+    elif (match := _LD_MULTIPLE_DEF.search(line)):
+        message = f"多重定义: {match.group(1)}"
+    elif (match := _LD_CANNOT_FIND.search(line)):
+        message = f"找不到库: -l{match.group(1)}"
+    elif (match := _LD_SECTION_OVERFLOW.search(line)):
+        message = f"段溢出: {match.group(1)} 超出 {match.group(2)} 区域"
     else:
         # 其他链接错误
         if "error" in line.lower() or "undefined" in line.lower():
@@ -167,12 +172,8 @@ def parse_make_error(line: str) -> Optional[ParsedError]:
     Returns:
         ParsedError对象或None
     """
-    # Make错误模式
-    make_error_pattern = r"make:\s*\*\*\*\s*\[(.*?)\]\s*Error\s*(\d+)"
-    no_rule_pattern = r"make:\s*\*\*\*\s*No rule to make target ['\"](.+?)['\"]"
-    
-    if re.search(make_error_pattern, line):
-        match = re.search(make_error_pattern, line)
+    match = _MAKE_ERROR.search(line)
+    if match:
         target = match.group(1)
         error_code = match.group(2)
         return ParsedError(
@@ -184,8 +185,8 @@ def parse_make_error(line: str) -> Optional[ParsedError]:
             message=f"Make目标失败: {target} (错误码 {error_code})",
             raw=line
         )
-    elif re.search(no_rule_pattern, line):
-        match = re.search(no_rule_pattern, line)
+    match = _MAKE_NO_RULE.search(line)
+    if match:
         target = match.group(1)
         return ParsedError(
             type=ErrorType.MAKE,
@@ -226,9 +227,8 @@ def parse_toolchain_error(line: str) -> Optional[ParsedError]:
         )
     
     # GCC工具链错误
-    gcc_error_pattern = r"arm-none-eabi-(gcc|g\+\+|ld|as):\s*error:\s*(.+)"
-    if re.search(gcc_error_pattern, line):
-        match = re.search(gcc_error_pattern, line)
+    match = _TOOLCHAIN_ERROR.search(line)
+    if match:
         tool = match.group(1)
         message = match.group(2)
         return ParsedError(
@@ -244,10 +244,60 @@ def parse_toolchain_error(line: str) -> Optional[ParsedError]:
     return None
 
 
+# DockerRunner 的挂载点：在 /work/project 中编译，源码只读挂载在 /src
+CONTAINER_ROOTS = ("/work/project", "/src")
+
+
+class PathMapper:
+    """容器路径 → 工作区相对路径（带缓存）
+    
+    编译日志中的路径是容器路径（``/work/project/Core/Src/main.c``、
+    ``/src/...``），或相对于 make 工作目录
+    （``/work/project/<project_subdir>``）的相对路径。:meth:`map` 把它们
+    以及宿主机上工作区内的绝对路径转换为工作区相对的 POSIX 路径；
+    工作区之外的路径（如工具链头文件）原样返回。
+    
+    只做字符串运算、不访问文件系统，每个不同的路径只计算一次。
+    """
+    
+    def __init__(
+        self,
+        workspace: str = "",
+        project_subdir: str = "",
+        container_roots: Tuple[str, ...] = CONTAINER_ROOTS,
+    ) -> None:
+        self.workspace = workspace
+        self.project_subdir = project_subdir
+        self._roots = [posixpath.normpath(root) for root in container_roots]
+        if workspace:
+            self._roots.append(posixpath.normpath(os.path.abspath(workspace).replace("\\", "/")))
+        base = self._roots[0] if self._roots else "/"
+        self._build_dir = posixpath.normpath(posixpath.join(base, project_subdir.replace("\\", "/")))
+        self._memo: Dict[str, str] = {}
+    
+    def map(self, path: str) -> str:
+        """返回 *path* 的工作区相对路径（无法映射时原样返回）"""
+        mapped = self._memo.get(path)
+        if mapped is None:
+            mapped = self._memo[path] = self._map(path)
+        return mapped
+    
+    def _map(self, path: str) -> str:
+        if not path:
+            return path
+        posix = path.replace("\\", "/")
+        absolute = posixpath.normpath(posixpath.join(self._build_dir, posix))
+        for root in self._roots:
+            if absolute.startswith(root + "/"):
+                return absolute[len(root) + 1:]
+        return path
+
+
 def normalize_path(file_path: str, workspace: str) -> str:
     """归一化路径
     
-    将绝对路径转换为相对于workspace的相对路径
+    将容器路径或绝对路径转换为相对于workspace的相对路径
+    （见 :class:`PathMapper`）
     
     Args:
         file_path: 原始文件路径
@@ -256,72 +306,408 @@ def normalize_path(file_path: str, workspace: str) -> str:
     Returns:
         归一化后的相对路径
     """
-    from pathlib import Path
+    return PathMapper(workspace).map(file_path)
+
+
+# ── 单遍解析引擎 ────────────────────────────────────────────
+
+# 预过滤：能产生诊断的行（转小写后）必含 "error"、"warning"、"undefined"、
+# "multiple definition"、"no rule" 或 "not"（覆盖 note / cannot find /
+# will not fit / command not found）；"from " 用于识别包含链，": in " /
+# ": at top level" 用于识别函数上下文。绝大多数行（编译进度、size输出等）
+# 几次子串查找即可跳过——比不区分大小写的正则分支快一个数量级。
+def _is_candidate(lower: str) -> bool:
+    return (
+        "error" in lower
+        or "not" in lower
+        or "warning" in lower
+        or "undefined" in lower
+        or "multiple definition" in lower
+        or "no rule" in lower
+        or "from " in lower
+        or ": in " in lower
+        or ": at top level" in lower
+    )
+
+
+# 包含链: "In file included from a.h:3," / "from main.c:5:"（去除缩进后），
+# 链的最后一行（以 ":" 结尾）是编译单元
+_INCLUDED_FROM = re.compile(r"^(?:In file included )?from (.+?):(\d+)(?::\d+)?([:,])$")
+
+# 函数上下文: "main.c: In function 'main':" / "main.c: At top level:"
+_CONTEXT = re.compile(
+    r"^(.+?): ((?:In (?:static |member |lambda )?function|In constructor|In destructor"
+    r"|At top level|At global scope).*):$"
+)
+
+_SOURCE_SUFFIXES = (".c", ".cc", ".cpp", ".cxx", ".s", ".S")
+
+
+# make 回显的编译/链接命令（如 "arm-none-eabi-gcc -c ... -Werror ..."），
+# 其中的 -Werror 等选项不是诊断
+_COMMAND_ECHO = re.compile(r"(?:ccache\s+)?(?:\S*[/-])?(?:gcc|g\+\+|c\+\+|cc|as|ld)\s")
+
+# GCC 的源码摘录: "   42 | int x = foo;" / "      |         ^~~" / "  +++ |+#include ..."
+# 摘录中的代码可能含 "error" 等字样，不是诊断
+_SOURCE_EXCERPT = re.compile(r"^(?:\d+|\+\+\+)?\s*\|")
+
+# 合并分派：一次 search 确定行类型（GCC 格式锚定在行首，优先匹配）
+_DISPATCH = re.compile("|".join([
+    r"^(?P<g_file>.*?):(?P<g_line>\d+):(?P<g_col>\d+):\s*"
+    r"(?P<g_sev>fatal error|error|warning|note):\s*(?P<g_msg>.+)$",
+    r"undefined reference to [`'](?P<undefined>\w+)'",
+    r"multiple definition of [`'](?P<multiple>\w+)'",
+    r"cannot find -(?P<lib>\w+)",
+    r"section [`'](?P<section>\w+)' will not fit in region [`'](?P<region>\w+)'",
+    r"make:\s*\*\*\*\s*\[(?P<target>.*?)\]\s*Error\s*(?P<code>\d+)",
+    r"make:\s*\*\*\*\s*No rule to make target ['\"](?P<no_rule>.+?)['\"]",
+    r"arm-none-eabi-(?P<tool>gcc|g\+\+|ld|as):\s*error:\s*(?P<tool_msg>.+)",
+]))
+
+
+def _parse(line: str, mapper: PathMapper) -> Optional[ParsedError]:
+    """解析一行（已去除首尾空白）"""
+    lower = line.lower()
+    if (
+        not _is_candidate(lower)
+        or _COMMAND_ECHO.match(line) is not None
+        or _INCLUDED_FROM.match(line) is not None
+        or _SOURCE_EXCERPT.match(line) is not None
+    ):
+        return None
+
+    match = _DISPATCH.search(line)
+    if match is None:
+        if "command not found" in line:
+            return ParsedError(ErrorType.TOOLCHAIN, ErrorSeverity.ERROR, "", 0, 0,
+                               "工具链命令未找到", line)
+        if "error" in lower or "undefined" in lower:
+            # 其他链接错误
+            return ParsedError(ErrorType.LINKER, ErrorSeverity.ERROR, "", 0, 0, line, line)
+        return None
+
+    group = match.groupdict()
+    if group["g_sev"] is not None:
+        return ParsedError(
+            type=ErrorType.COMPILER,
+            severity=_SEVERITY_MAP.get(group["g_sev"], ErrorSeverity.ERROR),
+            file=mapper.map(group["g_file"]),
+            line=int(group["g_line"]),
+            col=int(group["g_col"]),
+            message=group["g_msg"].strip(),
+            raw=line,
+        )
+    if group["undefined"] is not None:
+        return ParsedError(ErrorType.LINKER, ErrorSeverity.ERROR, "", 0, 0,
+                           f"未定义的引用: {group['undefined']}", line)
+    if group["multiple"] is not None:
+        return ParsedError(ErrorType.LINKER, ErrorSeverity.ERROR, "", 0, 0,
+                           f"多重定义: {group['multiple']}", line)
+    if group["lib"] is not None:
+        return ParsedError(ErrorType.LINKER, ErrorSeverity.ERROR, "", 0, 0,
+                           f"找不到库: -l{group['lib']}", line)
+    if group["section"] is not None:
+        return ParsedError(ErrorType.LINKER, ErrorSeverity.ERROR, "", 0, 0,
+                           f"段溢出: {group['section']} 超出 {group['region']} 区域", line)
+    if group["code"] is not None:
+        return ParsedError(ErrorType.MAKE, ErrorSeverity.ERROR, "", 0, 0,
+                           f"Make目标失败: {group['target']} (错误码 {group['code']})", line)
+    if group["no_rule"] is not None:
+        return ParsedError(ErrorType.MAKE, ErrorSeverity.ERROR, "", 0, 0,
+                           f"缺少make规则: {group['no_rule']}", line)
+    return ParsedError(ErrorType.TOOLCHAIN, ErrorSeverity.ERROR, "", 0, 0,
+                       f"工具链错误 ({group['tool']}): {group['tool_msg']}", line)
+
+
+# 按严重级别排序：ERROR > WARNING > NOTE
+_SEVERITY_ORDER = {
+    ErrorSeverity.ERROR: 0,
+    ErrorSeverity.WARNING: 1,
+    ErrorSeverity.NOTE: 2,
+}
+_SEVERITY_RANK = {severity.value: rank for severity, rank in _SEVERITY_ORDER.items()}
+
+
+class LogParser:
+    """增量（流式）编译日志解析器
+    
+    用法::
+    
+        parser = LogParser(workspace)
+        for chunk in stream:
+            new_errors = parser.feed(chunk)
+        errors = parser.finish()
+    
+    feed() 接受任意切分的文本块，末尾不完整的行留到下一次 feed() 或
+    finish()。每行只经过一次预过滤和一次合并正则分派；编译命令回显
+    直接跳过。
+    
+    解析器是一个跨行的状态机：
+    
+    * 包含链（"In file included from ..."）附加到其后同一文件的诊断
+      （``include_chain``），链的根即编译单元（``tu``）；源文件中的诊断
+      的编译单元即该文件。
+    * 函数上下文（"main.c: In function 'main':"）附加到其后同一文件的
+      诊断（``context``）。
+    * ``note:`` 附加到前一条 error/warning 的 ``notes``，不单独返回；
+      没有父诊断的 note 保留为顶层记录。
+    
+    结果按日志中出现的顺序返回，不重新排序。
+    
+    *compiler* 为 False 时忽略 GCC 格式的编译诊断（已由
+    :func:`parse_json_diagnostics` 读取），只识别链接、make 和工具链错误。
+    文件路径经 *mapper*（默认 ``PathMapper(workspace)``）映射。
+    """
     
-    try:
-        file_path_obj = Path(file_path).resolve()
-        workspace_obj = Path(workspace).resolve()
+    def __init__(
+        self,
+        workspace: str = "",
+        compiler: bool = True,
+        mapper: Optional[PathMapper] = None,
+    ) -> None:
+        self.workspace = workspace
+        self.compiler = compiler
+        self.mapper = mapper or PathMapper(workspace)
+        self.errors: List[ParsedError] = []
+        self.lines = 0
+        self._partial = ""
+        self._tu = ""
+        self._chain: List[str] = []
+        self._chain_file: Optional[str] = ""  # None：链已结束，等待下一条诊断
+        self._context = ""
+        self._context_file = ""
+        self._parent: Optional[ParsedError] = None
+    
+    def feed(self, chunk: str) -> List[ParsedError]:
+        """解析一个文本块，返回其中新发现的诊断"""
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        self.lines += len(lines)
+        # 热路径：先用预过滤跳过无关行，只有候选行进入 _handle
+        new_errors = []
+        for line in lines:
+            if _is_candidate(line.lower()):
+                error = self._handle(line)
+                if error is not None:
+                    new_errors.append(error)
+        return new_errors
+    
+    def feed_line(self, line: str) -> Optional[ParsedError]:
+        """解析一个完整的行；返回新的顶层诊断（附加到父诊断的 note 返回 None）"""
+        self.lines += 1
+        return self._handle(line)
+    
+    def _handle(self, line: str) -> Optional[ParsedError]:
+        line = line.strip()
+        if not line:
+            return None
+        include = _INCLUDED_FROM.match(line)
+        if include is not None:
+            file_path = self.mapper.map(include.group(1))
+            if line.startswith("In file") or self._chain_file is not None:
+                self._chain = []
+            self._chain.append(f"{file_path}:{include.group(2)}")
+            self._chain_file = None
+            self._tu = file_path
+            return None
+        context = _CONTEXT.match(line) if line[-1] == ":" else None
+        if context is not None:
+            self._context_file = self.mapper.map(context.group(1))
+            self._context = "" if context.group(2).startswith("At ") else context.group(2)
+            return None
+        error = _parse(line, self.mapper)
+        if error is None or (not self.compiler and error.type is ErrorType.COMPILER):
+            return None
+        if error.type is not ErrorType.COMPILER:
+            self._parent = None
+            self.errors.append(error)
+            return error
         
-        # 尝试获取相对路径
-        try:
-            relative = file_path_obj.relative_to(workspace_obj)
-            return str(relative)
-        except ValueError:
-            # 如果不在workspace下，返回原始路径
-            return file_path
-    except Exception:
-        return file_path
+        if error.file.endswith(_SOURCE_SUFFIXES):
+            self._tu = error.file
+            error.tu = error.file
+        elif error.file:
+            error.tu = self._tu
+        if self._chain_file is None:
+            self._chain_file = error.file
+        if error.file == self._chain_file:
+            error.include_chain = self._chain
+        else:
+            self._chain, self._chain_file = [], ""
+        if error.file == self._context_file:
+            error.context = self._context
+        
+        if error.severity is ErrorSeverity.NOTE:
+            if self._parent is not None:
+                self._parent.notes.append(error)
+                return None
+        else:
+            self._parent = error
+        self.errors.append(error)
+        return error
+    
+    def finish(self) -> List[ParsedError]:
+        """处理剩余的不完整行，返回全部顶层诊断（按日志顺序）"""
+        if self._partial:
+            self.feed_line(self._partial)
+            self._partial = ""
+        return self.errors
 
 
-def parse_build_log(log_content: str, workspace: str = "") -> List[ParsedError]:
+def sort_errors(errors: List[ParsedError]) -> List[ParsedError]:
+    """按严重级别排序（稳定排序，errors在前）"""
+    return sorted(errors, key=lambda e: _SEVERITY_ORDER.get(e.severity, 99))
+
+
+def parse_line(
+    line: str, workspace: str = "", mapper: Optional[PathMapper] = None
+) -> Optional[ParsedError]:
+    """解析单行日志
+    
+    识别GCC、LD、Make、工具链错误，可用于边编译边解析。
+    
+    Args:
+        line: 日志行文本
+        workspace: 工作目录路径
+        mapper: 路径映射（逐行调用时传入以复用缓存）
+        
+    Returns:
+        ParsedError对象或None
+    """
+    line = line.strip()
+    if not line:
+        return None
+    return _parse(line, mapper or PathMapper(workspace))
+
+
+def parse_build_log(
+    log_content: str, workspace: str = "", mapper: Optional[PathMapper] = None
+) -> List[ParsedError]:
     """解析完整的编译日志
     
-    解析编译日志中的所有错误，按严重级别排序。
+    解析编译日志中的所有错误（见 :class:`LogParser`）。
     
     Args:
         log_content: 编译日志内容
         workspace: 工作目录路径
+        mapper: 路径映射（默认 ``PathMapper(workspace)``）
         
     Returns:
-        ParsedError列表，按严重级别排序（errors在前）
+        顶层 ParsedError 列表，按日志顺序（note 附加在父诊断上）
     """
-    errors = []
-    lines = log_content.splitlines()
+    parser = LogParser(workspace, mapper=mapper)
+    parser.feed(log_content)
+    return parser.finish()
+
+
+def parse_log_lines(
+    lines: Iterable[str],
+    workspace: str = "",
+    compiler: bool = True,
+    mapper: Optional[PathMapper] = None,
+) -> List[ParsedError]:
+    """逐行解析日志（流式）
     
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # 尝试解析不同类型的错误
-        error = None
-        
-        # 1. 尝试解析GCC编译错误
-        error = parse_gcc_error(line, workspace)
-        
-        # 2. 如果不是编译错误，尝试链接错误
-        if not error:
-            error = parse_ld_error(line, workspace)
-        
-        # 3. 如果不是链接错误，尝试Make错误
-        if not error:
-            error = parse_make_error(line)
-        
-        # 4. 如果不是Make错误，尝试工具链错误
-        if not error:
-            error = parse_toolchain_error(line)
+    与 :func:`parse_build_log` 相同，但接受任意行迭代器（例如打开的日志
+    文件），无需把整个日志读入内存。
+    
+    Args:
+        lines: 日志行迭代器
+        workspace: 工作目录路径
+        compiler: 是否识别GCC编译诊断（见 :class:`LogParser`）
+        mapper: 路径映射（默认 ``PathMapper(workspace)``）
         
-        if error:
-            errors.append(error)
+    Returns:
+        顶层 ParsedError 列表，按日志顺序（note 附加在父诊断上）
+    """
+    parser = LogParser(workspace, compiler=compiler, mapper=mapper)
+    for line in lines:
+        parser.feed_line(line)
+    return parser.finish()
+
+
+# ── GCC JSON 诊断 ───────────────────────────────────────────
+
+def _json_fixit_suggestion(fixits: List[Dict[str, Any]]) -> str:
+    """把 GCC fix-it 提示转成一行建议"""
+    hints = []
+    for fixit in fixits:
+        start, end = fixit.get("start") or {}, fixit.get("next") or {}
+        text = fixit.get("string", "")
+        where = f"{start.get('line', 0)}:{start.get('column', 0)}"
+        if start == end:
+            hints.append(f"在 {where} 插入 '{text}'")
+        elif text:
+            hints.append(f"将 {where}-{end.get('column', 0)} 替换为 '{text}'")
+        else:
+            hints.append(f"删除 {where}-{end.get('column', 0)}")
+    return "; ".join(hints)
+
+
+def _json_to_error(diagnostic: Dict[str, Any], tu: str, mapper: PathMapper) -> ParsedError:
+    """一条 GCC JSON 诊断 → ParsedError（子诊断放入 ``notes``）"""
+    location = (diagnostic.get("locations") or [{}])[0]
+    caret = location.get("caret") or {}
+    finish = location.get("finish") or {}
+    file_path = mapper.map(caret.get("file", ""))
+    kind = diagnostic.get("kind", "error")
+    message = diagnostic.get("message", "")
+    line, col = caret.get("line", 0), caret.get("column", 0)
+    raw = f"{caret.get('file', '')}:{line}:{col}: {kind}: {message}" if caret else f"{kind}: {message}"
+    return ParsedError(
+        type=ErrorType.COMPILER,
+        severity=_SEVERITY_MAP.get(kind, ErrorSeverity.ERROR),
+        file=file_path,
+        line=line,
+        col=col,
+        message=message,
+        raw=raw,
+        code=diagnostic.get("option", ""),
+        suggestion=_json_fixit_suggestion(diagnostic.get("fixits") or []),
+        tu=tu,
+        end_line=finish.get("line", 0),
+        end_col=finish.get("column", 0),
+        notes=[_json_to_error(child, tu, mapper) for child in diagnostic.get("children") or []],
+    )
+
+
+def parse_json_diagnostics(
+    lines: Iterable[str], workspace: str = "", mapper: Optional[PathMapper] = None
+) -> List[ParsedError]:
+    """解析 ``build.sh`` 收集的 GCC JSON 诊断（``diagnostics.jsonl``）
     
-    # 按严重级别排序：ERROR > WARNING > NOTE
-    severity_order = {
-        ErrorSeverity.ERROR: 0,
-        ErrorSeverity.WARNING: 1,
-        ErrorSeverity.NOTE: 2,
-    }
-    errors.sort(key=lambda e: severity_order.get(e.severity, 99))
+    每行是一次编译器调用的 ``{"tu": 源文件, "diagnostics": [...]}``，
+    ``diagnostics`` 为 GCC ``-fdiagnostics-format=json`` 的原样输出。
+    与文本解析相比，可直接得到选项名（``code``）、fix-it 建议
+    （``suggestion``）、范围结束位置和可靠的编译单元；子诊断和紧随其后的
+    note 放在父诊断的 ``notes`` 中。
     
+    Args:
+        lines: diagnostics.jsonl 的行
+        workspace: 工作目录路径
+        mapper: 路径映射（默认 ``PathMapper(workspace)``）
+        
+    Returns:
+        ParsedError列表，按编译单元和输出顺序
+    """
+    mapper = mapper or PathMapper(workspace)
+    errors: List[ParsedError] = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        tu = mapper.map(record.get("tu", ""))
+        parent: Optional[ParsedError] = None
+        for diagnostic in record.get("diagnostics") or []:
+            error = _json_to_error(diagnostic, tu, mapper)
+            # 部分 GCC 版本把 note 输出为独立的顶层诊断
+            if error.severity is ErrorSeverity.NOTE and parent is not None:
+                parent.notes.append(error)
+                continue
+            if error.severity is not ErrorSeverity.NOTE:
+                parent = error
+            errors.append(error)
     return errors
 
 
@@ -345,11 +731,84 @@ def errors_to_dict(errors: List[ParsedError]) -> List[Dict[str, Any]]:
             "raw": error.raw,
             "code": error.code,
             "suggestion": error.suggestion,
+            **({"end_line": error.end_line, "end_col": error.end_col} if error.end_line else {}),
+            **({"context": error.context} if error.context else {}),
+            **({"include_chain": error.include_chain} if error.include_chain else {}),
+            **({"notes": errors_to_dict(error.notes)} if error.notes else {}),
         }
         for error in errors
     ]
 
 
+def _group_key(error: ParsedError) -> Tuple[str, str, str, int, int, str]:
+    return (error.type.value, error.severity.value, error.file, error.line, error.col, error.message)
+
+
+def group_errors(errors: List[ParsedError]) -> List[Dict[str, Any]]:
+    """合并重复诊断
+    
+    同一头文件中的错误被多个编译单元包含时，GCC 会为每个编译单元
+    重复输出。按 (file, line, col, message) 合并，保留首次出现的记录
+    （顺序不变），并加上 ``count``（出现次数）和 ``translation_units``
+    （来自多少个不同的编译单元）。
+    
+    Args:
+        errors: ParsedError列表
+        
+    Returns:
+        字典列表（字段同 :func:`errors_to_dict`，另加 count、translation_units）
+    """
+    groups: Dict[Tuple[str, str, str, int, int, str], Dict[str, Any]] = {}
+    units: Dict[Tuple[str, str, str, int, int, str], set] = {}
+    for error in errors:
+        key = _group_key(error)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = errors_to_dict([error])[0]
+            group["count"] = 0
+            units[key] = set()
+        group["count"] += 1
+        if error.tu:
+            units[key].add(error.tu)
+    for key, group in groups.items():
+        group["translation_units"] = len(units[key])
+    return list(groups.values())
+
+
+def limit_errors(
+    errors: List[Dict[str, Any]],
+    max_total: int = 0,
+    max_per_file: int = 0,
+    max_bytes: int = 0,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """按数量和体积截断诊断列表（0 表示不限）
+    
+    按严重级别优先选取记录（错误优先）：每个文件最多 *max_per_file* 条，
+    总数最多 *max_total* 条，JSON 编码后总大小不超过 *max_bytes*。
+    保留的记录维持原有顺序。
+    
+    Returns:
+        (保留的记录, 省略的条数)
+    """
+    order = sorted(range(len(errors)), key=lambda i: _SEVERITY_RANK.get(errors[i].get("severity"), 99))
+    chosen: List[int] = []
+    per_file: Dict[str, int] = {}
+    size = 2  # "[]"
+    for i in order:
+        if max_total and len(chosen) >= max_total:
+            break
+        file_key = errors[i].get("file", "")
+        if max_per_file and per_file.get(file_key, 0) >= max_per_file:
+            continue
+        item_size = len(json.dumps(errors[i], ensure_ascii=False).encode()) + 2
+        if max_bytes and size + item_size > max_bytes:
+            break
+        chosen.append(i)
+        per_file[file_key] = per_file.get(file_key, 0) + 1
+        size += item_size
+    return [errors[i] for i in sorted(chosen)], len(errors) - len(chosen)
+
+
 def get_error_summary(errors: List[ParsedError]) -> Dict[str, Any]:
     """获取错误摘要统计
     
@@ -362,6 +821,7 @@ def get_error_summary(errors: List[ParsedError]) -> Dict[str, Any]:
     error_count = sum(1 for e in errors if e.severity == ErrorSeverity.ERROR)
     warning_count = sum(1 for e in errors if e.severity == ErrorSeverity.WARNING)
     note_count = sum(1 for e in errors if e.severity == ErrorSeverity.NOTE)
+    note_count += sum(len(e.notes) for e in errors)
     
     # 按文件分组
     files_with_errors = {}
@@ -373,6 +833,7 @@ def get_error_summary(errors: List[ParsedError]) -> Dict[str, Any]:
     
     return {
         "total": len(errors),
+        "unique": len({_group_key(e) for e in errors}),
         "errors": error_count,
         "warnings": warning_count,
         "notes": note_count,
@@ -403,7 +864,13 @@ def format_error_for_display(error: ParsedError) -> str:
         ErrorSeverity.NOTE: "ℹ️",
     }.get(error.severity, "❓")
     
-    return f"{severity_emoji} [{error.type.value.upper()}] {location}\n   {error.message}"
+    text = f"{severity_emoji} [{error.type.value.upper()}] {location}\n   {error.message}"
+    if error.context:
+        text += f"\n   ({error.context})"
+    for note in error.notes:
+        note_location = f"{note.file}:{note.line}" if note.file else "(全局)"
+        text += f"\n   ℹ️ {note_location}: {note.message}"
+    return text
 
 
 # 向后兼容的函数
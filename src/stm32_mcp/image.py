@@ -0,0 +1,241 @@
+"""Firmware images as sparse address ranges.
+
+Every flash path (OpenOCD sessions, one-shot OpenOCD, differential
+flashing, the ESP32 bridge) works on the same :class:`SparseImage`: a
+sorted list of non-overlapping ``(address, data)`` segments, read from
+
+* Intel HEX (record types 00/01/02/04; 03/05 start addresses are ignored),
+* ELF32 ``PT_LOAD`` program headers with file contents, placed at their
+  physical (load) address, so ``.data`` initialisers land in flash,
+* raw binaries, placed at a given base address (default ``0x08000000``).
+
+The format is taken from the file contents (``:`` / ``\\x7fELF``), not the
+extension.  Parsing works a record or segment at a time – HEX payloads are
+decoded with :func:`binascii.unhexlify` and joined through memoryviews,
+ELF segments are sliced from a memory map – so there is no per-byte Python
+loop.  Parsed images are cached by file hash (see
+:func:`build_cache.file_digest`); ``benchmarks/bench_image.py`` measures
+the parser on multi-megabyte images.
+"""
+
+import binascii
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .build_cache import file_digest
+
+DEFAULT_FLASH_BASE = 0x08000000
+
+_CACHE_ENTRIES = 8
+
+_PT_LOAD = 1
+
+# (address, data)
+Segment = Tuple[int, bytes]
+
+
+class SparseImage:
+    """A firmware image: sorted, non-overlapping ``(address, data)`` segments."""
+
+    def __init__(self, segments: List[Segment], format: str = "bin") -> None:
+        self.segments = _coalesce(segments)
+        self.format = format
+
+    def __iter__(self) -> Iterator[Segment]:
+        return iter(self.segments)
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    @property
+    def start(self) -> int:
+        return self.segments[0][0] if self.segments else 0
+
+    @property
+    def end(self) -> int:
+        """First address after the image."""
+        return self.segments[-1][0] + len(self.segments[-1][1]) if self.segments else 0
+
+    @property
+    def size(self) -> int:
+        """Bytes of data (gaps excluded)."""
+        return sum(len(data) for _, data in self.segments)
+
+    def to_bin(self, fill: int = 0xFF) -> bytes:
+        """Return the image from :attr:`start` to :attr:`end`, gaps filled with *fill*."""
+        if len(self.segments) == 1:
+            return self.segments[0][1]
+        start = self.start
+        out = bytearray(bytes([fill]) * (self.end - start))
+        for address, data in self.segments:
+            out[address - start:address - start + len(data)] = data
+        return bytes(out)
+
+    def write_hex(self, path: Path) -> None:
+        write_hex(self.segments, path)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "format": self.format,
+            "start": f"0x{self.start:08x}",
+            "end": f"0x{self.end:08x}",
+            "size": self.size,
+            "segments": len(self.segments),
+        }
+
+
+def _coalesce(segments: List[Segment]) -> List[Segment]:
+    """Sort *segments* and merge adjacent ones; raise on overlap."""
+    result: List[Segment] = []
+    pending: List[bytes] = []
+    start = end = -1
+    for address, data in sorted((s for s in segments if s[1]), key=lambda s: s[0]):
+        if address < end:
+            raise ValueError(f"Overlapping image data at 0x{address:08x}")
+        if address == end:
+            pending.append(data)
+        else:
+            if pending:
+                result.append((start, pending[0] if len(pending) == 1 else b"".join(pending)))
+            start, pending = address, [data]
+        end = address + len(data)
+    if pending:
+        result.append((start, pending[0] if len(pending) == 1 else b"".join(pending)))
+    return result
+
+
+# ── Readers ──────────────────────────────────────────────────
+
+def parse_hex(text: bytes, name: str = "image.hex") -> List[Segment]:
+    """Return the data segments of Intel HEX *text*.
+
+    Raises :class:`ValueError` for malformed records or bad checksums.
+    """
+    segments: List[Segment] = []
+    chunks: List[memoryview] = []
+    start = end = base = 0
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line[:1] != b":":
+                raise binascii.Error
+            record = binascii.unhexlify(line[1:])
+        except binascii.Error:
+            raise ValueError(f"{name}:{lineno}: not an Intel HEX record") from None
+        if len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xFF:
+            raise ValueError(f"{name}:{lineno}: bad Intel HEX record")
+        kind = record[3]
+        if kind == 0:
+            address = base + (record[1] << 8 | record[2])
+            if address != end or not chunks:
+                if chunks:
+                    segments.append((start, b"".join(chunks)))
+                start, chunks = address, []
+            chunks.append(memoryview(record)[4:-1])
+            end = address + record[0]
+        elif kind == 1:
+            break
+        elif kind == 2:
+            base = (record[4] << 8 | record[5]) << 4
+        elif kind == 4:
+            base = (record[4] << 8 | record[5]) << 16
+    if chunks:
+        segments.append((start, b"".join(chunks)))
+    return segments
+
+
+def parse_elf(data: mmap.mmap, name: str = "image.elf") -> List[Segment]:
+    """Return the loadable segments of an ELF32 file at their load addresses."""
+    if len(data) < 52 or data[:4] != b"\x7fELF":
+        raise ValueError(f"{name}: not an ELF file")
+    if data[4] != 1:
+        raise ValueError(f"{name}: only ELF32 is supported")
+    endian = "<" if data[5] == 1 else ">"
+    phoff, = struct.unpack_from(endian + "I", data, 28)
+    phentsize, phnum = struct.unpack_from(endian + "HH", data, 42)
+    header = struct.Struct(endian + "8I")
+    segments: List[Segment] = []
+    for i in range(phnum):
+        p_type, p_offset, _, p_paddr, p_filesz, _, _, _ = header.unpack_from(data, phoff + i * phentsize)
+        if p_type == _PT_LOAD and p_filesz:
+            if p_offset + p_filesz > len(data):
+                raise ValueError(f"{name}: segment {i} extends past the end of the file")
+            segments.append((p_paddr, data[p_offset:p_offset + p_filesz]))
+    return segments
+
+
+def read_image(path: Path, address: int = DEFAULT_FLASH_BASE) -> SparseImage:
+    """Read the Intel HEX, ELF or raw binary image at *path*.
+
+    A raw binary is placed at *address*.  Raises :class:`ValueError` for a
+    malformed or empty image.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+        if magic == b"\x7fELF":
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                image = SparseImage(parse_elf(data, path.name), "elf")
+        elif magic[:1] == b":" and path.suffix.lower() != ".bin":
+            image = SparseImage(parse_hex(magic + f.read(), path.name), "hex")
+        elif path.suffix.lower() in (".hex", ".ihex", ".elf"):
+            raise ValueError(f"{path.name}: not a valid {path.suffix[1:].upper()} file")
+        else:
+            image = SparseImage([(address, magic + f.read())], "bin")
+    if not image.segments:
+        raise ValueError(f"{path.name}: image has no loadable data")
+    return image
+
+
+def write_hex(segments: List[Segment], path: Path) -> None:
+    """Write *segments* as an Intel HEX file (16-byte data records)."""
+    lines = []
+    upper = -1
+    for start, data in segments:
+        view = memoryview(data)
+        offset = 0
+        while offset < len(data):
+            address = start + offset
+            if address >> 16 != upper:
+                upper = address >> 16
+                record = bytes([2, 0, 0, 4]) + upper.to_bytes(2, "big")
+                lines.append(":" + (record + bytes([-sum(record) & 0xFF])).hex().upper())
+            # records must not cross a 64 KiB boundary
+            end = min(offset + 16, len(data), (upper + 1 << 16) - start)
+            record = bytes([end - offset]) + (address & 0xFFFF).to_bytes(2, "big") + b"\0" + view[offset:end]
+            lines.append(":" + (record + bytes([-sum(record) & 0xFF])).hex().upper())
+            offset = end
+    lines.append(":00000001FF")
+    path.write_text("\n".join(lines) + "\n")
+
+
+# ── Cache ────────────────────────────────────────────────────
+
+# "sha256:base" -> SparseImage, least-recently-used first out
+_images: "OrderedDict[str, SparseImage]" = OrderedDict()
+_images_lock = threading.Lock()
+
+
+def load_image(path: Path, address: int = DEFAULT_FLASH_BASE) -> Tuple[SparseImage, str, bool]:
+    """Return ``(image, sha256, cached)`` for the image file at *path*.
+
+    The image is shared between callers and must not be modified.
+    """
+    digest = file_digest(path)
+    key = f"{digest}:{address:x}"
+    with _images_lock:
+        image = _images.get(key)
+        if image is not None:
+            _images.move_to_end(key)
+            return image, digest, True
+    image = read_image(path, address)
+    with _images_lock:
+        _images[key] = image
+        while len(_images) > _CACHE_ENTRIES:
+            _images.popitem(last=False)
+    return image, digest, False
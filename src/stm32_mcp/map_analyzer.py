@@ -0,0 +1,244 @@
+"""GNU ld map file analysis: memory regions and per-module sizes.
+
+``build.sh`` collects the linker's ``*.map`` into ``out/artifacts``.  The map
+is read in one streaming pass:
+
+* ``Memory Configuration`` gives the regions (``FLASH``, ``RAM``, ...) with
+  their origin and length,
+* ``Linker script and memory map`` lists every output section (``.text``,
+  ``.data``, ...) with its address, size and, for initialised data, the
+  ``load address`` in flash, followed by the input sections it was built
+  from (``.text.main  0x08000150  0x5c  build/main.o``).
+
+An output section counts towards the region holding its address and, when
+it has a load address in another region and holds initialised contents,
+towards that region too (``.data`` uses both RAM and FLASH).  ld prints a
+load address for ``.bss`` and other no-load sections as well, so sections
+made only of ``.bss*`` / ``COMMON`` / ``.noinit`` input (or no input at all,
+like ``._user_heap_stack``) use no flash.  Input sections are attributed
+the same way to their object file, and to the library for archive members
+(``libc_nano.a(lib_a-memset.o)``).  Sections outside every region
+(``.debug_*``, ``.comment``, ...) and ``Discarded input sections`` are
+ignored.
+
+Results are cached in memory by the SHA-256 of the map file (see
+:func:`build_cache.file_digest`), so repeated queries for the same build
+are a dictionary lookup.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .build_cache import file_digest
+from .gcc_parse import PathMapper
+
+_CACHE_ENTRIES = 16
+
+_INDENT = " " * 16  # symbol / assignment lines and wrapped section names
+
+_REGION = re.compile(r"^(\S+)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)")
+# "<name> 0xADDR 0xSIZE [load address 0xLMA]" (name may be on the line before)
+_SECTION = re.compile(
+    r"^(\S*)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)(?:\s+load address 0x([0-9a-fA-F]+))?\s*$"
+)
+# " <name> 0xADDR 0xSIZE <object>"
+_INPUT = re.compile(r"^ ?(\S*)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)(?:\s+(\S.*?))?\s*$")
+_ARCHIVE_MEMBER = re.compile(r"^(.*?)\(([^()]+)\)$")
+# input sections without file contents (NOBITS)
+_NO_LOAD = (".bss", ".sbss", ".tbss", ".noinit", "COMMON")
+
+
+class _Region:
+    __slots__ = ("name", "origin", "length", "attributes", "used")
+
+    def __init__(self, name: str, origin: int, length: int, attributes: str) -> None:
+        self.name = name
+        self.origin = origin
+        self.length = length
+        self.attributes = attributes
+        self.used = 0
+
+    def contains(self, address: int) -> bool:
+        return self.origin <= address < self.origin + self.length
+
+
+def _add(table: Dict[str, Dict[str, Any]], name: str, regions: Tuple[str, ...], size: int) -> None:
+    entry = table.get(name)
+    if entry is None:
+        entry = table[name] = {"name": name, "size": 0, "regions": {}}
+    entry["size"] += size
+    for region in regions:
+        entry["regions"][region] = entry["regions"].get(region, 0) + size
+
+
+def _ranked(table: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(table.values(), key=lambda entry: (-entry["size"], entry["name"]))
+
+
+def parse_map(lines: Iterable[str], mapper: Optional[PathMapper] = None) -> Dict[str, Any]:
+    """Parse GNU ld map file *lines* in a single pass.
+
+    Object paths are made workspace-relative through *mapper*.
+
+    Returns ``{regions, sections, modules, libraries, fill}``: *regions* as
+    ``{name, origin, length, used, free, percent}``; *sections* (allocated
+    output sections) as ``{name, address, size, region, load_region}``;
+    *modules* (object files, with ``library`` for archive members) and
+    *libraries* as ``{name, size, regions}`` sorted by size, where *size*
+    counts each input section once and *regions* has the bytes per region
+    (initialised data appears in both RAM and FLASH); *fill* is alignment
+    padding per region.
+    """
+    mapper = mapper or PathMapper()
+    regions: List[_Region] = []
+    sections: List[Dict[str, Any]] = []
+    modules: Dict[str, Dict[str, Any]] = {}
+    libraries: Dict[str, Dict[str, Any]] = {}
+    fill: Dict[str, int] = {}
+
+    state = ""
+    pending = ""                      # output/input section name wrapped to the next line
+    vma: Optional[_Region] = None     # region of the current output section
+    lma: Optional[_Region] = None     # its load region, if different
+    section: Dict[str, Any] = {}
+    loaded = False                    # current section has initialised contents
+
+    def region_of(address: int) -> Optional[_Region]:
+        for region in regions:
+            if region.contains(address):
+                return region
+        return None
+
+    def close_section() -> None:
+        if lma is not None and loaded:
+            lma.used += section["size"]
+            section["load_region"] = lma.name
+
+    for raw in lines:
+        line = raw.rstrip("\n")
+        if state != "map":
+            if line.startswith("Memory Configuration"):
+                state = "memory"
+            elif line.startswith("Linker script and memory map"):
+                state = "map"
+            elif state == "memory":
+                match = _REGION.match(line)
+                if match is not None and match.group(1) not in ("Name", "*default*"):
+                    attributes = line[match.end():].strip()
+                    regions.append(_Region(match.group(1), int(match.group(2), 16),
+                                           int(match.group(3), 16), attributes))
+            continue
+
+        # hot path: symbols, assignments and "*(.text*)" patterns
+        if not line or (line.startswith(_INDENT) and not pending) or line.startswith(" *("):
+            continue
+
+        if line[0] != " " or (pending and pending[0] != " "):
+            # output section (or LOAD / OUTPUT / cross-reference lines)
+            match = _SECTION.match(line)
+            if match is None:
+                name = line.strip()
+                pending = name if line[0] != " " and " " not in name else ""
+                if not pending:
+                    close_section()
+                    vma = None
+                continue
+            close_section()
+            name = match.group(1) or pending
+            pending = ""
+            address, size = int(match.group(2), 16), int(match.group(3), 16)
+            vma = region_of(address) if name != "/DISCARD/" else None
+            lma = region_of(int(match.group(4), 16)) if match.group(4) else None
+            if lma is vma:
+                lma = None
+            loaded = False
+            section = {"name": name, "address": f"0x{address:08x}", "size": size,
+                       "region": vma.name if vma else ""}
+            if vma is not None:
+                vma.used += size
+                if size:
+                    sections.append(section)
+            continue
+
+        if vma is None:
+            pending = ""
+            continue
+        match = _INPUT.match(line)
+        if match is None:
+            stripped = line.strip()
+            pending = " " + stripped if stripped and " " not in stripped else ""
+            continue
+        name = match.group(1) or pending.strip()
+        pending = ""
+        size = int(match.group(3), 16)
+        if not size:
+            continue
+        if name == "*fill*" or match.group(4) is None:
+            fill[vma.name] = fill.get(vma.name, 0) + size
+            continue
+        occupies: Tuple[str, ...] = (vma.name,)
+        if lma is not None and not name.startswith(_NO_LOAD):
+            loaded = True
+            occupies = (vma.name, lma.name)
+        obj = match.group(4)
+        member = _ARCHIVE_MEMBER.match(obj)
+        if member is not None:
+            library = mapper.map(member.group(1)).rsplit("/", 1)[-1]
+            module = f"{library}({member.group(2)})"
+            _add(libraries, library, occupies, size)
+            _add(modules, module, occupies, size)
+            modules[module]["library"] = library
+        else:
+            _add(modules, mapper.map(obj), occupies, size)
+    close_section()
+
+    return {
+        "regions": [
+            {
+                "name": r.name,
+                "origin": f"0x{r.origin:08x}",
+                "length": r.length,
+                "attributes": r.attributes,
+                "used": r.used,
+                "free": r.length - r.used,
+                "percent": round(100.0 * r.used / r.length, 2) if r.length else None,
+            }
+            for r in regions
+        ],
+        "sections": sections,
+        "modules": _ranked(modules),
+        "libraries": _ranked(libraries),
+        "fill": fill,
+    }
+
+
+# ── Cache ────────────────────────────────────────────────────
+
+# map sha256 -> parse_map() result, least-recently-used last out
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def analyze_map_file(path: Path, mapper: Optional[PathMapper] = None) -> Tuple[Dict[str, Any], bool]:
+    """Return ``(parse_map() result, cached)`` for the map file at *path*.
+
+    The result is shared between callers and must not be modified.
+    """
+    digest = file_digest(path)
+    key = f"{digest}:{mapper.workspace}:{mapper.project_subdir}" if mapper else digest
+    with _cache_lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+            return result, True
+    with open(path, "r", errors="replace") as f:
+        result = parse_map(f, mapper)
+    result["sha256"] = digest
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > _CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return result, False
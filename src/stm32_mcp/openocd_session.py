@@ -0,0 +1,547 @@
+"""Persistent OpenOCD daemons driven over the TCL RPC port.
+
+Starting ``openocd`` for every flash or detect call repeats adapter init,
+SWD connect and target examination, which takes seconds.  Instead, one
+daemon is kept running per probe (interface + target config + USB serial)
+and commands are sent over its TCL RPC socket: each command is terminated
+by ``0x1a`` and so is each reply.  Commands run as
+``catch {capture {...}} __stm32mcp`` so failures are reported as errors
+together with the command's output.
+
+The session manager
+
+* starts a daemon on first use, on a free localhost port,
+* restarts a daemon that crashed or whose socket broke, retrying the
+  operation once,
+* drops a session after any failed command, so the next call starts from a
+  fresh adapter connection,
+* shuts daemons down after ``idle_timeout_sec`` without use and at exit.
+
+Configuration via environment:
+
+* ``STM32_MCP_OPENOCD``           – OpenOCD executable (default ``openocd``)
+* ``STM32_MCP_OPENOCD_IDLE_SEC``  – idle shutdown timeout (default 300,
+  0 disables persistent sessions)
+"""
+
+import atexit
+import collections
+import os
+import socket
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_TERMINATOR = b"\x1a"
+_STARTUP_TIMEOUT_SEC = 20.0
+_COMMAND_TIMEOUT_SEC = 30.0
+_LOG_LINES = 400
+_START_ATTEMPTS = 3
+_LISTENING = "Listening on port {port} for tcl connections"
+_BIND_FAILED = "couldn't bind"  # "couldn't bind tcl to socket on port N: Address already in use"
+
+# DBGMCU_IDCODE address per family (target config prefix), default F1/F2/F3/F4/F7/L1/L4
+_IDCODE_ADDRESSES = {
+    "stm32f0x": 0x40015800,
+    "stm32g0x": 0x40015800,
+    "stm32l0": 0x40015800,
+    "stm32h7x": 0x5C001000,
+}
+_IDCODE_DEFAULT = 0xE0042000
+
+# 96-bit unique device ID address per family (target config prefix)
+_UID_ADDRESSES = {
+    "stm32f0x": 0x1FFFF7AC,
+    "stm32f1x": 0x1FFFF7E8,
+    "stm32f2x": 0x1FFF7A10,
+    "stm32f3x": 0x1FFFF7AC,
+    "stm32f4x": 0x1FFF7A10,
+    "stm32f7x": 0x1FF0F420,
+    "stm32g0x": 0x1FFF7590,
+    "stm32g4x": 0x1FFF7590,
+    "stm32h7x": 0x1FF1E800,
+    "stm32l0": 0x1FF80050,
+    "stm32l1": 0x1FF80050,
+    "stm32l4x": 0x1FFF7590,
+}
+
+
+class OpenOcdError(RuntimeError):
+    """An OpenOCD command failed or the daemon could not be started."""
+
+    def __init__(self, message: str, log: str = "") -> None:
+        super().__init__(message)
+        self.log = log
+
+
+class OpenOcdConnectionError(OpenOcdError):
+    """The daemon died or its RPC socket broke; the session is unusable."""
+
+
+def tcl_quote(value: str) -> str:
+    """Quote *value* (e.g. a file path) as a single TCL word."""
+    return "{" + value + "}"
+
+
+@dataclass(frozen=True)
+class ProbeConfig:
+    """What identifies one OpenOCD daemon.
+
+    *serial* selects one of several connected probes by USB serial number
+    (see :func:`probes.list_probes`); empty takes the first one found.
+    """
+    interface_cfg: str
+    target_cfg: str
+    serial: str = ""
+
+    def args(self) -> List[str]:
+        args = ["-f", self.interface_cfg]
+        if self.serial:
+            args += ["-c", f"adapter serial {tcl_quote(self.serial)}"]
+        return args + ["-f", self.target_cfg]
+
+
+class OpenOcdSession:
+    """One running OpenOCD daemon and its TCL RPC connection."""
+
+    def __init__(self, probe: ProbeConfig, executable: str = "openocd") -> None:
+        self.probe = probe
+        self.executable = executable
+        self.lock = threading.Lock()  # one operation at a time per probe
+        self.last_used = time.monotonic()
+        self.commands = 0
+        self.port = 0
+
+        self._process: Optional[subprocess.Popen] = None
+        self._sock: Optional[socket.socket] = None
+        self._log: Deque[str] = collections.deque(maxlen=_LOG_LINES)
+        self._log_count = 0
+        self._log_lock = threading.Lock()
+
+    # ── Lifecycle ────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Launch the daemon and connect to its TCL port.
+
+        Raises :class:`OpenOcdError` if OpenOCD is missing, exits during
+        init (no probe, no target, bad config) or does not answer in time.
+        A daemon that could not bind its port (taken by another process
+        between picking and binding it) is started again on another one.
+        """
+        for attempt in range(1, _START_ATTEMPTS + 1):
+            if self._launch(retry_bind=attempt < _START_ATTEMPTS):
+                return
+
+    def _launch(self, retry_bind: bool) -> bool:
+        """Start one daemon; return ``False`` if it lost its port and *retry_bind*."""
+        _release_port(self.port)
+        self.port = _free_port()
+        cmd = [
+            self.executable, *self.probe.args(),
+            "-c", "bindto 127.0.0.1",
+            "-c", f"tcl_port {self.port}",
+            "-c", "gdb_port disabled",
+            "-c", "telnet_port disabled",
+            "-c", "init",
+        ]
+        try:
+            self._process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+            )
+        except FileNotFoundError:
+            raise OpenOcdError(f"{self.executable} not found. Install OpenOCD first.") from None
+        mark = self.log_mark
+        reader = threading.Thread(target=self._read_log, name="stm32-mcp-openocd-log", daemon=True)
+        reader.start()
+
+        deadline = time.monotonic() + _STARTUP_TIMEOUT_SEC
+        while True:
+            if self._process.poll() is not None:
+                reader.join(timeout=1.0)  # collect the last lines of output
+                log = self.log_since(mark)
+                if retry_bind and _BIND_FAILED in log:
+                    return False
+                raise OpenOcdError(f"OpenOCD exited during init (code {self._process.returncode})", log)
+            # only connect once our daemon holds the port: whoever else
+            # might be listening on it is not our OpenOCD
+            if _LISTENING.format(port=self.port) in self.log_since(mark):
+                try:
+                    self._sock = socket.create_connection(("127.0.0.1", self.port), timeout=1.0)
+                    break
+                except OSError:
+                    pass
+            if time.monotonic() > deadline:
+                self.close()
+                raise OpenOcdError("OpenOCD did not open its TCL port", self.log_since(mark))
+            time.sleep(0.05)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return True
+
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None and self._sock is not None
+
+    def close(self) -> None:
+        """Shut the daemon down (politely first)."""
+        asked = False
+        if self._sock is not None:
+            try:
+                self._sock.settimeout(2.0)
+                self._sock.sendall(b"shutdown" + _TERMINATOR)
+                asked = True
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+        if self._process is not None:
+            if not asked and self._process.poll() is None:
+                self._process.terminate()
+            try:
+                self._process.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        _release_port(self.port)
+
+    # ── Daemon output ────────────────────────────────────────
+
+    def _read_log(self) -> None:
+        assert self._process is not None and self._process.stdout is not None
+        for line in self._process.stdout:
+            with self._log_lock:
+                self._log.append(line.rstrip("\n"))
+                self._log_count += 1
+
+    @property
+    def log_mark(self) -> int:
+        """Position in the daemon output, for :meth:`log_since`."""
+        with self._log_lock:
+            return self._log_count
+
+    def log_since(self, mark: int) -> str:
+        """Daemon output printed since *mark* (as far as still buffered)."""
+        with self._log_lock:
+            lines = list(self._log)[max(0, len(self._log) - (self._log_count - mark)):]
+        return "\n".join(lines)
+
+    # ── RPC ──────────────────────────────────────────────────
+
+    def command(self, cmd: str, timeout: float = _COMMAND_TIMEOUT_SEC) -> str:
+        """Send one raw TCL command and return its result."""
+        if not self.alive():
+            raise OpenOcdConnectionError("OpenOCD is not running", self.log_since(0))
+        assert self._sock is not None
+        try:
+            self._sock.settimeout(timeout)
+            self._sock.sendall(cmd.encode() + _TERMINATOR)
+            reply = bytearray()
+            while True:
+                chunk = self._sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("connection closed")
+                reply += chunk
+                if reply.endswith(_TERMINATOR):
+                    break
+        except socket.timeout:
+            # the reply may still arrive, so the session cannot be reused
+            self._sock.close()
+            self._sock = None
+            raise OpenOcdError(f"'{cmd}' timed out after {timeout:g}s", self.log_since(0)) from None
+        except OSError as exc:
+            raise OpenOcdConnectionError(f"OpenOCD connection lost: {exc}", self.log_since(0)) from None
+        self.commands += 1
+        return reply[:-1].decode(errors="replace")
+
+    def try_run(self, cmd: str, timeout: float = _COMMAND_TIMEOUT_SEC) -> Tuple[bool, str]:
+        """Run an OpenOCD command; return ``(succeeded, output or error)``."""
+        code = self.command(f"catch {{capture {{{cmd}}}}} __stm32mcp", timeout)
+        return code.strip() == "0", self.command("set __stm32mcp")
+
+    def run(self, cmd: str, timeout: float = _COMMAND_TIMEOUT_SEC) -> str:
+        """Run an OpenOCD command, returning its output; raise on failure."""
+        mark = self.log_mark
+        ok, output = self.try_run(cmd, timeout)
+        if not ok:
+            raise OpenOcdError(output.strip() or f"'{cmd}' failed", self.log_since(mark))
+        return output
+
+    def read_words(self, address: int, count: int = 1) -> List[int]:
+        """Read *count* 32-bit words from target memory."""
+        output = self.run(f"mdw 0x{address:08x} {count}")
+        words = []
+        for line in output.splitlines():
+            if ":" in line:
+                words += [int(word, 16) for word in line.split(":", 1)[1].split()]
+        if len(words) < count:
+            raise OpenOcdError(f"Unexpected mdw output: {output.strip()!r}")
+        return words[:count]
+
+    # ── Operations ───────────────────────────────────────────
+
+    def program(
+        self,
+        path: str,
+        address: Optional[int] = None,
+        verify: bool = True,
+        reset: bool = True,
+        timeout: float = 120.0,
+        verify_method: str = "crc",
+    ) -> Tuple[List[str], Optional[Dict[str, Any]]]:
+        """Halt, erase + write *path*, optionally verify and reset-run.
+
+        *address* is required for raw ``.bin`` images.  Returns the output
+        of each step and the :meth:`verify` report (``None`` without
+        *verify*).
+        """
+        output = [self.run("reset halt")]
+        output.append(self.run(f"flash write_image erase {_image_arg(path, address)}", timeout))
+        report = None
+        if verify:
+            report, verify_output = self.verify(path, address, verify_method, timeout)
+            output += verify_output
+        if reset:
+            output.append(self.run("reset run"))
+        return output, report
+
+    def verify(
+        self,
+        path: str,
+        address: Optional[int] = None,
+        method: str = "crc",
+        timeout: float = 120.0,
+    ) -> Tuple[Dict[str, Any], List[str]]:
+        """Check that flash holds the image at *path*.
+
+        ``crc`` lets the target compute a CRC32 of each image section
+        (``verify_image_checksum``) and reads the image back only when a
+        checksum differs; ``readback`` always compares every byte
+        (``verify_image``).  OpenOCD computes the host side of the CRC
+        comparison itself, from the same file and with its own CRC32
+        variant, so no host CRC of the image is computed here.  Returns
+        ``({method, duration_sec}, output)`` where *method* is the check
+        that decided; raises :class:`OpenOcdError` if the contents differ.
+        """
+        start = time.monotonic()
+        image = _image_arg(path, address)
+        output = []
+        if method == "crc":
+            ok, result = self.try_run(f"verify_image_checksum {image}", timeout)
+            output.append(result)
+            if ok:
+                return {"method": "crc", "duration_sec": round(time.monotonic() - start, 3)}, output
+        output.append(self.run(f"verify_image {image}", timeout))
+        report = {"method": "readback", "duration_sec": round(time.monotonic() - start, 3)}
+        if method == "crc":
+            report["crc_mismatch"] = True
+        return report, output
+
+    def _family_address(self, table: Dict[str, int]) -> Optional[int]:
+        target = os.path.basename(self.probe.target_cfg)
+        return next((a for prefix, a in table.items() if target.startswith(prefix)), None)
+
+    def read_idcode(self) -> int:
+        """Return the MCU's DBGMCU_IDCODE register."""
+        return self.read_words(self._family_address(_IDCODE_ADDRESSES) or _IDCODE_DEFAULT)[0]
+
+    def read_uid(self) -> str:
+        """Return the 96-bit unique device ID as hex, or ``""`` if unknown."""
+        address = self._family_address(_UID_ADDRESSES)
+        if address is None:
+            return ""
+        return "".join(f"{word:08x}" for word in self.read_words(address, 3))
+
+
+def _image_arg(path: str, address: Optional[int]) -> str:
+    return tcl_quote(path) + (f" 0x{address:08x}" if address is not None else "")
+
+
+# ports handed to daemons of this process, so that parallel starts never
+# pick the same one (and connect to each other's daemon)
+_claimed_ports: Set[int] = set()
+_claimed_ports_lock = threading.Lock()
+
+
+def _free_port() -> int:
+    while True:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        with _claimed_ports_lock:
+            if port not in _claimed_ports:
+                _claimed_ports.add(port)
+                return port
+
+
+def _release_port(port: int) -> None:
+    with _claimed_ports_lock:
+        _claimed_ports.discard(port)
+
+
+class OpenOcdSessions:
+    """Keeps one OpenOCD daemon per probe alive between tool calls."""
+
+    DEFAULT_IDLE_SEC = 300
+
+    def __init__(
+        self,
+        idle_timeout_sec: Optional[float] = None,
+        executable: Optional[str] = None,
+    ) -> None:
+        if idle_timeout_sec is None:
+            idle_timeout_sec = float(
+                os.environ.get("STM32_MCP_OPENOCD_IDLE_SEC", self.DEFAULT_IDLE_SEC)
+            )
+        self.idle_timeout_sec = idle_timeout_sec
+        self.executable = executable or os.environ.get("STM32_MCP_OPENOCD", "openocd")
+        self.starts = 0
+        self.restarts = 0
+
+        self._sessions: Dict[ProbeConfig, OpenOcdSession] = {}
+        self._lock = threading.Lock()
+        # a probe can only be opened once: one start lock per USB device
+        self._start_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = False
+
+    # ── Public API ───────────────────────────────────────────
+
+    @property
+    def enabled(self) -> bool:
+        return self.idle_timeout_sec > 0
+
+    def run(self, probe: ProbeConfig, operation: Callable[[OpenOcdSession], T]) -> Tuple[T, str]:
+        """Run *operation* against the daemon for *probe*.
+
+        Returns ``(result, status)`` where *status* is ``hit`` (warm
+        daemon), ``miss`` (daemon started) or ``restart`` (the daemon had
+        died and was restarted).  Raises :class:`OpenOcdError`.
+        """
+        status = ""
+        for attempt in range(2):
+            session, started = self._checkout(probe)
+            status = status or ("miss" if started else "hit")
+            try:
+                with session.lock:
+                    result = operation(session)
+                    session.last_used = time.monotonic()
+                return result, status
+            except OpenOcdConnectionError:
+                self._discard(session)
+                if attempt:
+                    raise
+                status = "restart"
+                with self._lock:
+                    self.restarts += 1
+            except OpenOcdError:
+                # start the next call from a fresh adapter connection
+                self._discard(session)
+                raise
+        raise AssertionError("unreachable")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "idle_timeout_sec": self.idle_timeout_sec,
+                "starts": self.starts,
+                "restarts": self.restarts,
+            }
+
+    def shutdown(self) -> None:
+        """Stop every daemon (called at interpreter exit)."""
+        with self._lock:
+            self._closed = True
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    # ── Internals ────────────────────────────────────────────
+
+    def _checkout(self, probe: ProbeConfig) -> Tuple[OpenOcdSession, bool]:
+        with self._lock:
+            start_lock = self._start_locks.setdefault(
+                (probe.interface_cfg, probe.serial), threading.Lock()
+            )
+        with start_lock:
+            with self._lock:
+                session = self._sessions.get(probe)
+                if session is not None and session.alive():
+                    return session, False
+                self._sessions.pop(probe, None)
+                # daemons holding the same adapter under another target config
+                # (or with/without its serial) would keep the new one out
+                conflicts = [
+                    other for key, other in self._sessions.items()
+                    if key.interface_cfg == probe.interface_cfg
+                    and (not key.serial or not probe.serial or key.serial == probe.serial)
+                ]
+                for other in conflicts:
+                    del self._sessions[other.probe]
+            if session is not None:
+                session.close()
+            for other in conflicts:
+                with other.lock:  # let a running operation finish
+                    other.close()
+
+            session = OpenOcdSession(probe, self.executable)
+            session.start()
+            with self._lock:
+                self.starts += 1
+                self._sessions[probe] = session
+        self._start_reaper()
+        return session, True
+
+    def _discard(self, session: OpenOcdSession) -> None:
+        with self._lock:
+            if self._sessions.get(session.probe) is session:
+                del self._sessions[session.probe]
+        session.close()
+
+    def _start_reaper(self) -> None:
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(
+                target=self._reap_loop, name="stm32-mcp-openocd-reaper", daemon=True
+            )
+        self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        interval = max(1.0, min(30.0, self.idle_timeout_sec / 2))
+        while not self._closed:
+            time.sleep(interval)
+            now = time.monotonic()
+            with self._lock:
+                idle = [
+                    s for s in self._sessions.values()
+                    if now - s.last_used > self.idle_timeout_sec and not s.lock.locked()
+                ]
+                for session in idle:
+                    del self._sessions[session.probe]
+            for session in idle:
+                session.close()
+
+
+# ── Process-wide session manager ─────────────────────────────
+
+_sessions: Optional[OpenOcdSessions] = None
+_sessions_lock = threading.Lock()
+
+
+def get_openocd_sessions() -> OpenOcdSessions:
+    """Return the process-wide :class:`OpenOcdSessions`, creating it lazily."""
+    global _sessions
+    with _sessions_lock:
+        if _sessions is None:
+            _sessions = OpenOcdSessions()
+            atexit.register(_sessions.shutdown)
+        return _sessions
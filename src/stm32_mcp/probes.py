@@ -0,0 +1,91 @@
+"""Debug probe enumeration by USB serial number.
+
+Probes are found through Linux sysfs (``/sys/bus/usb/devices``), without
+libusb or opening the devices, so enumeration works while OpenOCD daemons
+hold them.  ST-Link probes are recognised by vendor ``0483`` and the known
+product IDs, CMSIS-DAP probes by the ``CMSIS-DAP`` product string that the
+specification requires.
+
+The serial is what OpenOCD's ``adapter serial`` matches (see
+:class:`openocd_session.ProbeConfig`).  Early ST-Link/V2 firmware reports a
+binary serial; OpenOCD compares those as hex, so they are returned
+hex-encoded.
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+SYSFS_USB_DEVICES = Path("/sys/bus/usb/devices")
+
+_ST_VENDOR = "0483"
+_ST_LINK_PRODUCTS = {
+    "3744": "ST-Link/V1",
+    "3748": "ST-Link/V2",
+    "374a": "ST-Link/V2-1",
+    "374b": "ST-Link/V2-1",
+    "3752": "ST-Link/V2-1",
+    "374d": "STLINK-V3",
+    "374e": "STLINK-V3",
+    "374f": "STLINK-V3",
+    "3753": "STLINK-V3",
+    "3754": "STLINK-V3",
+    "3757": "STLINK-V3PWR",
+}
+
+
+def _attr(device: Path, name: str) -> str:
+    try:
+        return (device / name).read_text(errors="surrogateescape").strip()
+    except OSError:
+        return ""
+
+
+def _openocd_serial(serial: str) -> str:
+    if serial.isprintable() and serial.isascii():
+        return serial
+    return serial.encode(errors="surrogateescape").hex().upper()
+
+
+def _port_key(port: str) -> List[Tuple[int, Any]]:
+    """Sort key for sysfs names: ``1-2.10`` after ``1-2.9``, ``usb2`` after ``usb1``."""
+    parts = re.split(r"[-.:]|(?<=\D)(?=\d)", port)
+    return [(0, int(part)) if part.isdigit() else (1, part) for part in parts]
+
+
+def list_probes(sysfs: Path = SYSFS_USB_DEVICES) -> List[Dict[str, Any]]:
+    """Return the connected debug probes, sorted by USB port.
+
+    Each probe is ``{serial, programmer, model, vid, pid, manufacturer,
+    port}``; *programmer* is the ``flash_firmware`` value (``stlink`` or
+    ``cmsis-dap``) and *port* the sysfs bus path (``1-2.3``).
+    """
+    try:
+        devices = sorted(os.listdir(sysfs), key=_port_key)
+    except OSError:
+        return []
+
+    probes = []
+    for port in devices:
+        if ":" in port:
+            continue  # interfaces, not devices
+        device = sysfs / port
+        vid, pid = _attr(device, "idVendor").lower(), _attr(device, "idProduct").lower()
+        product = _attr(device, "product")
+        if vid == _ST_VENDOR and pid in _ST_LINK_PRODUCTS:
+            programmer, model = "stlink", _ST_LINK_PRODUCTS[pid]
+        elif "CMSIS-DAP" in product:
+            programmer, model = "cmsis-dap", product
+        else:
+            continue
+        probes.append({
+            "serial": _openocd_serial(_attr(device, "serial")),
+            "programmer": programmer,
+            "model": model,
+            "vid": vid,
+            "pid": pid,
+            "manufacturer": _attr(device, "manufacturer"),
+            "port": port,
+        })
+    return probes
@@ -0,0 +1,183 @@
+"""Process-wide cache of Docker readiness probes.
+
+Docker availability, the Docker version and the local image ID of each
+toolchain image are cached for ``STM32_MCP_READY_TTL`` seconds (default 60,
+0 disables caching), so ``build_firmware`` and ``check_environment`` do not
+probe Docker on every call.
+
+Entries are dropped early when
+
+* Docker reports an image or daemon event (a background watcher follows the
+  event stream of the active backend and reconnects with back-off),
+* a build fails for an infrastructure reason (see
+  :meth:`DockerRunner.run_build`), or
+* the image is pulled.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .docker_backend import get_backend
+
+_DOCKER_KEY = "docker"
+
+
+class ReadinessCache:
+    """TTL cache of Docker availability, version and image IDs."""
+
+    DEFAULT_TTL = 60.0
+    EVENT_TYPES = ["image", "daemon"]
+
+    def __init__(self, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = float(os.environ.get("STM32_MCP_READY_TTL", self.DEFAULT_TTL))
+        self.ttl = max(0.0, ttl)
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, value)
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    # ── Cached probes ────────────────────────────────────────
+
+    def docker_status(self) -> Tuple[bool, str]:
+        """Return ``(available, version)``."""
+        return self._get(_DOCKER_KEY, self._probe_docker)
+
+    def image_digest(self, image: str) -> str:
+        """Return the local image ID of *image* (``""`` if missing)."""
+        return self._get(f"image:{image}", lambda: get_backend().image_id(image))
+
+    def check(self, image: str) -> Dict[str, Any]:
+        """Return availability, version and image ID in one call.
+
+        On a cold cache the probes run concurrently, so the cost is one
+        round-trip rather than three in series.
+        """
+        cached = self._peek(_DOCKER_KEY), self._peek(f"image:{image}")
+        if all(entry is not None for entry in cached):
+            with self._lock:
+                self.hits += 1
+            (available, version), digest = cached
+            return {"docker_available": available, "docker_version": version,
+                    "image_digest": digest, "cached": True}
+
+        backend = get_backend()
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            available = pool.submit(backend.available)
+            version = pool.submit(backend.version)
+            digest = pool.submit(backend.image_id, image)
+            result = (available.result(), version.result()), digest.result()
+        self._put(_DOCKER_KEY, result[0])
+        self._put(f"image:{image}", result[1])
+        with self._lock:
+            self.misses += 1
+        return {"docker_available": result[0][0], "docker_version": result[0][1],
+                "image_digest": result[1], "cached": False}
+
+    # ── Invalidation ─────────────────────────────────────────
+
+    def invalidate(self, image: Optional[str] = None) -> None:
+        """Drop the entry for *image*, or everything if *image* is ``None``."""
+        with self._lock:
+            if image is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(f"image:{image}", None)
+
+    def invalidate_images(self) -> None:
+        """Drop every cached image ID."""
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith("image:")]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ttl_sec": self.ttl,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "watching_events": self._watcher is not None,
+            }
+
+    # ── Internals ────────────────────────────────────────────
+
+    @staticmethod
+    def _probe_docker() -> Tuple[bool, str]:
+        backend = get_backend()
+        return backend.available(), backend.version()
+
+    def _peek(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def _put(self, key: str, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        # negative results are not cached: the image is about to be
+        # pulled, or the user is about to start the daemon
+        if not value or (key == _DOCKER_KEY and not value[0]):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._start_watcher()
+
+    def _get(self, key: str, probe: Callable[[], Any]) -> Any:
+        value = self._peek(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        value = probe()
+        with self._lock:
+            self.misses += 1
+        self._put(key, value)
+        return value
+
+    def _start_watcher(self) -> None:
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(
+                target=self._watch_events, name="stm32-mcp-docker-events", daemon=True
+            )
+        self._watcher.start()
+
+    def _watch_events(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                for event in get_backend().events(self.EVENT_TYPES):
+                    backoff = 1.0
+                    if event.get("Type") == "image":
+                        # pull / tag / untag / delete may move any tag
+                        self.invalidate_images()
+                    else:
+                        self.invalidate()
+            except Exception:
+                pass
+            # stream ended: the daemon restarted or went away
+            self.invalidate()
+            time.sleep(backoff)
+            backoff = min(60.0, backoff * 2)
+
+
+_cache: Optional[ReadinessCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_readiness() -> ReadinessCache:
+    """Return the process-wide :class:`ReadinessCache`."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReadinessCache()
+        return _cache
@@ -0,0 +1,150 @@
+"""CPU-aware ``make -j`` budget shared by all concurrent builds.
+
+The host's usable CPUs are the smaller of the process affinity mask and the
+CPU quota of the process's cgroup and its ancestors (v2 ``cpu.max`` or v1
+``cpu.cfs_quota_us``).  That total is the global jobs budget (override with
+``STM32_MCP_JOBS_BUDGET``).
+
+Every build acquires its ``-j`` value from :class:`JobBudget` before it
+starts and releases it when it ends, so concurrent builds never oversubscribe
+the host.  :meth:`JobBudget.plan` splits the budget across a batch of
+builds for ``build_matrix``.
+"""
+
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_CGROUP_ROOT = Path("/sys/fs/cgroup")
+_PROC_CGROUP = Path("/proc/self/cgroup")
+
+
+def _own_cgroups() -> Dict[str, str]:
+    """Map controller (``""`` for cgroup v2) -> this process's cgroup path."""
+    paths: Dict[str, str] = {}
+    try:
+        for line in _PROC_CGROUP.read_text().splitlines():
+            _, controllers, path = line.split(":", 2)
+            for controller in controllers.split(","):
+                paths[controller] = path
+    except (OSError, ValueError):
+        pass
+    return paths
+
+
+def _cgroup_dirs(mount: Path, path: str) -> List[Path]:
+    """*mount*/*path* and its ancestors, innermost first.
+
+    Without a cgroup namespace the path may not exist below the mount;
+    whatever exists of it is used, at least *mount* itself.
+    """
+    rel = Path(path.lstrip("/"))
+    return [mount / p for p in (rel, *rel.parents) if (mount / p).is_dir()] or [mount]
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """Return the cgroup CPU quota in CPUs, or ``None`` if unlimited.
+
+    The quota of the process's own cgroup (from ``/proc/self/cgroup``) and
+    of every ancestor applies; the smallest one wins.
+    """
+    own = _own_cgroups()
+    limits: List[float] = []
+    found = False
+    for directory in _cgroup_dirs(_CGROUP_ROOT, own.get("", "/")):
+        try:
+            quota, period = (directory / "cpu.max").read_text().split()[:2]
+            found = True
+            if quota != "max":
+                limits.append(int(quota) / int(period))
+        except (OSError, ValueError):
+            pass
+    if not found:
+        for directory in _cgroup_dirs(_CGROUP_ROOT / "cpu", own.get("cpu", "/")):
+            try:
+                quota = int((directory / "cpu.cfs_quota_us").read_text())
+                period = int((directory / "cpu.cfs_period_us").read_text())
+            except (OSError, ValueError):
+                continue
+            if quota > 0 and period > 0:
+                limits.append(quota / period)
+    return min(limits) if limits else None
+
+
+def available_cpus() -> int:
+    """Return the number of CPUs this process may actually use."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.floor(limit)))
+    return max(1, cpus)
+
+
+class JobBudget:
+    """Counting semaphore over ``make -j`` slots."""
+
+    MAX_JOBS_PER_BUILD = 32  # same bound as build_firmware's ``jobs``
+
+    def __init__(self, total: Optional[int] = None) -> None:
+        if total is None:
+            env = os.environ.get("STM32_MCP_JOBS_BUDGET")
+            total = int(env) if env else available_cpus()
+        self.total = max(1, total)
+        self._free = self.total
+        self._cond = threading.Condition()
+
+    def plan(self, builds: int, max_parallel: int = 0) -> Tuple[int, int]:
+        """Split the budget across *builds*.
+
+        Returns ``(concurrency, jobs_per_build)``: at most *max_parallel*
+        (0 = no limit) builds run at once and each gets an equal share of
+        the budget, capped at :attr:`MAX_JOBS_PER_BUILD`.
+        """
+        concurrency = max(1, min(builds, self.total))
+        if max_parallel > 0:
+            concurrency = min(concurrency, max_parallel)
+        per_build = min(self.MAX_JOBS_PER_BUILD, max(1, self.total // concurrency))
+        return concurrency, per_build
+
+    def acquire(self, jobs: int, cancel_event: Optional[threading.Event] = None) -> int:
+        """Take *jobs* slots (clamped to the budget), waiting for them.
+
+        Returns the number of slots granted, or 0 if *cancel_event* was set
+        while waiting.
+        """
+        jobs = max(1, min(jobs, self.total))
+        with self._cond:
+            while self._free < jobs:
+                if cancel_event is not None and cancel_event.is_set():
+                    return 0
+                self._cond.wait(timeout=0.5)
+            self._free -= jobs
+        return jobs
+
+    def release(self, jobs: int) -> None:
+        """Give back slots obtained from :meth:`acquire`."""
+        with self._cond:
+            self._free += jobs
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"total": self.total, "in_use": self.total - self._free}
+
+
+_budget: Optional[JobBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_job_budget() -> JobBudget:
+    """Return the process-wide :class:`JobBudget`."""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = JobBudget()
+        return _budget
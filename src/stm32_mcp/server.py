@@ -2,26 +2,57 @@
 
 Exposes MCP tools for:
   - build_firmware   – compile STM32 firmware inside Docker
-  - flash_firmware   – flash .hex/.bin via local OpenOCD / ST-Link
+  - start_build / get_build_status / wait_build / cancel_build
+                     – asynchronous build jobs
+  - build_matrix     – build many variants concurrently on a shared -j budget
+  - flash_firmware   – flash .hex/.bin/.elf via local OpenOCD / ST-Link
   - detect_mcu       – read MCU IDCODE via OpenOCD
+                       (both reuse a persistent OpenOCD daemon per probe)
+  - flash_many       – flash one image to several probes concurrently
+  - list_probes      – connected ST-Link / CMSIS-DAP probes by USB serial
   - check_environment – verify Docker & toolchain readiness
   - parse_gcc_errors – parse raw GCC log into structured errors
+  - analyze_memory   – FLASH/RAM usage per region, object file and library
+  - inspect_elf      – section sizes and symbol lookups from the built ELF
   - get_server_info  – version / capabilities
 """
 
+import asyncio
+import os
+import struct
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
-from fastmcp import FastMCP
+from fastmcp import Context, FastMCP
 
+from .build_cache import compute_build_key, get_result_cache
+from .build_jobs import get_job_manager, workspace_lock
+from .build_profile import PhaseTimer
+from .build_progress import BuildMonitor, Listener, count_translation_units
+from .delta_flash import flash_delta
 from .docker_runner import DockerRunner
+from .elf_reader import load_elf
+from .image import DEFAULT_FLASH_BASE, SparseImage, load_image
+from .map_analyzer import analyze_map_file
+from .openocd_session import OpenOcdError, OpenOcdSession, ProbeConfig, get_openocd_sessions
+from .probes import list_probes as enumerate_probes
+from .readiness import get_readiness
+from .scheduler import get_job_budget
 from .gcc_parse import (
+    ErrorSeverity,
+    ParsedError,
     errors_to_dict,
     format_error_for_display,
     get_error_summary,
+    group_errors,
+    limit_errors,
     parse_build_log,
+    parse_json_diagnostics,
+    parse_log_lines,
 )
 
 # ── MCP server instance ─────────────────────────────────────
@@ -33,6 +64,7 @@ mcp = FastMCP("stm32-mcp")
 _VERSION = "2.0.0"
 _DEFAULT_IMAGE = DockerRunner.DEFAULT_IMAGE
 _MAX_TIMEOUT = 3600
+_MAX_ERROR_NOTIFICATIONS = 20  # per build, so warnings floods stay quiet
 
 _ALLOWED_ROOTS = [
     "/home",
@@ -66,118 +98,735 @@ def _validate_workspace(workspace: str) -> Path:
     return path
 
 
+def _collect_artifacts(ws: Path) -> List[str]:
+    """List build artifacts in ``out/artifacts`` relative to *ws*."""
+    artifacts: List[str] = []
+    artifacts_dir = ws / "out" / "artifacts"
+    if artifacts_dir.exists():
+        for ext in (".elf", ".hex", ".bin", ".map"):
+            for f in artifacts_dir.glob(f"*{ext}"):
+                artifacts.append(str(f.relative_to(ws)))
+    return artifacts
+
+
+def _find_artifact(ws: Path, explicit: str, suffix: str) -> Path:
+    """Return *explicit* (relative to *ws*) or the newest ``out/artifacts/*<suffix>``."""
+    if explicit:
+        path = ws / explicit
+    else:
+        candidates = sorted(
+            (ws / "out" / "artifacts").glob(f"*{suffix}"), key=lambda f: f.stat().st_mtime, reverse=True
+        )
+        if not candidates:
+            raise ValueError(f"No {suffix} file found in out/artifacts/ (build first)")
+        path = candidates[0]
+    if not path.is_file():
+        raise ValueError(f"File not found: {path}")
+    return path
+
+
+def _read_log_tail(build_log: Path, max_log_tail_kb: int) -> str:
+    """Return at most *max_log_tail_kb* KB from the end of *build_log*.
+
+    Only the tail is read, whatever the size of the log.
+    """
+    if max_log_tail_kb <= 0:
+        return ""
+    max_bytes = max_log_tail_kb * 1024
+    try:
+        with open(build_log, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - max_bytes))
+            data = f.read(max_bytes)
+    except OSError:
+        return ""
+    if size > max_bytes:
+        # drop a multi-byte character cut in half by the seek
+        while data and (data[0] & 0xC0) == 0x80:
+            data = data[1:]
+    return data.decode("utf-8", errors="replace")
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _iter_log_lines(paths: List[Path]) -> Iterator[str]:
+    """Yield the lines of each existing file in *paths*, one at a time."""
+    for path in paths:
+        try:
+            f = open(path, encoding="utf-8", errors="replace")
+        except OSError:
+            continue
+        with f:
+            yield from f
+
+
 # ═══════════════════════════════════════════════════════════
 #  BUILD TOOLS
 # ═══════════════════════════════════════════════════════════
 
+def _check_build_request(params: Dict[str, Any]) -> Path:
+    """Validate build parameters; return the resolved workspace.
+
+    Raises ``ValueError`` with a user-facing message on bad input.
+    """
+    if not 1 <= params["jobs"] <= 32:
+        raise ValueError("jobs must be 1-32")
+    if not 10 <= params["timeout_sec"] <= _MAX_TIMEOUT:
+        raise ValueError(f"timeout_sec must be 10-{_MAX_TIMEOUT}")
+    if params["diagnostics_format"] not in ("text", "json"):
+        raise ValueError("diagnostics_format must be 'text' or 'json'")
+    if params["work_mode"] not in ("copy", "overlay"):
+        raise ValueError("work_mode must be 'copy' or 'overlay'")
+    if not 0 <= params["work_tmpfs_mb"] <= 65536:
+        raise ValueError("work_tmpfs_mb must be 0-65536")
+    for key in ("max_errors", "max_errors_per_file", "max_errors_kb"):
+        if params[key] < 0:
+            raise ValueError(f"{key} must be >= 0")
+
+    ws = _validate_workspace(params["workspace"])
+
+    project_subdir = params["project_subdir"]
+    project_path = ws / project_subdir if project_subdir else ws
+    if not (project_path / "Makefile").exists():
+        raise ValueError(f"Makefile not found in {project_path}")
+    return ws
+
+
+def _run_build(
+    ws: Path,
+    params: Dict[str, Any],
+    cancel_event: Optional[threading.Event] = None,
+    monitor: Optional[BuildMonitor] = None,
+) -> Dict[str, Any]:
+    """Run one build (cache lookup → Docker → parse → cache store).
+
+    Builds of the same workspace are serialised because they share
+    ``out/``.
+    """
+    with workspace_lock(ws):
+        if cancel_event is not None and cancel_event.is_set():
+            return {"ok": False, "error": "Build cancelled", "cancelled": True}
+        return _run_build_locked(ws, cancel_event=cancel_event, monitor=monitor, **params)
+
+
+def _run_build_locked(
+    ws: Path,
+    workspace: str,
+    project_subdir: str,
+    clean: Optional[bool],
+    jobs: int,
+    make_target: str,
+    timeout_sec: int,
+    max_log_tail_kb: int,
+    docker_image: str,
+    use_pool: bool,
+    incremental: bool,
+    ccache: bool,
+    use_cache: bool,
+    fail_fast: bool,
+    profile: bool,
+    ignore: Optional[List[str]],
+    work_mode: str,
+    work_tmpfs_mb: int,
+    max_errors: int,
+    max_errors_per_file: int,
+    max_errors_kb: int,
+    diagnostics_format: str,
+    cancel_event: Optional[threading.Event] = None,
+    monitor: Optional[BuildMonitor] = None,
+) -> Dict[str, Any]:
+    """Body of :func:`_run_build`; the caller holds the workspace lock."""
+    start = datetime.now()
+    timer = PhaseTimer()
+
+    if clean is None:
+        clean = not incremental
+
+    image = docker_image or _DEFAULT_IMAGE
+    runner = DockerRunner(image=image)
+
+    def capped(groups: List[Dict[str, Any]]) -> Dict[str, Any]:
+        kept, omitted = limit_errors(groups, max_errors, max_errors_per_file, max_errors_kb * 1024)
+        return {"errors": kept, "errors_omitted": omitted}
+
+    outdir = ws / "out"
+    build_log = outdir / "build.log"
+
+    # ── result cache (skipped when profiling: a hit has nothing to time) ──
+    cache = get_result_cache()
+    cache_key = ""
+    if use_cache and not profile:
+        with timer.phase("cache_lookup"):
+            image_digest = runner.image_digest()
+            cached = None
+            if image_digest:
+                cache_key = compute_build_key(
+                    ws, project_subdir, make_target, image_digest, ignore, diagnostics_format
+                )
+                cached = cache.restore(cache_key, outdir)
+        if cached is not None:
+            return {
+                "ok": True,
+                "exit_code": 0,
+                "workspace": str(ws),
+                "outdir": str(outdir),
+                "artifacts": _collect_artifacts(ws),
+                **capped(cached.get("errors", [])),
+                "error_summary": cached.get("error_summary"),
+                "diagnostics_format": cached.get("diagnostics_format", "text"),
+                "log_tail": _read_log_tail(build_log, max_log_tail_kb),
+                "duration_sec": (datetime.now() - start).total_seconds(),
+                "phases": {"host": timer.phases, "container": {}},
+                "profile": None,
+                "sync": None,
+                "jobs": 0,
+                "pool": None,
+                "incremental": incremental,
+                "ccache": None,
+                "cache_hit": True,
+                "cancelled": False,
+                "aborted_on_error": False,
+            }
+
+    # ── run build via Docker ──
+    # Ensure Docker image is available
+    with timer.phase("image_check"):
+        img_status = runner.ensure_image()
+    if not img_status["ok"]:
+        return {"ok": False, "error": img_status["message"]}
+
+    # Take our -j share of the host-wide budget (may wait, may clamp)
+    budget = get_job_budget()
+    with timer.phase("jobs_wait"):
+        jobs = budget.acquire(jobs, cancel_event)
+    if not jobs:
+        return {"ok": False, "error": "Build cancelled", "cancelled": True}
+    try:
+        with timer.phase("container"):
+            result = runner.run_build(
+                workspace=str(ws),
+                project_subdir=project_subdir,
+                clean=clean,
+                jobs=jobs,
+                make_target=make_target,
+                timeout_sec=timeout_sec,
+                use_pool=use_pool,
+                incremental=incremental,
+                ccache=ccache,
+                profile=profile,
+                ignore=ignore,
+                work_mode=work_mode,
+                work_tmpfs_mb=work_tmpfs_mb,
+                diagnostics_format=diagnostics_format,
+                cancel_event=cancel_event,
+                on_line=monitor.feed if monitor is not None else None,
+                abort_event=monitor.abort_event if monitor is not None else None,
+            )
+    finally:
+        budget.release(jobs)
+
+    with timer.phase("artifacts"):
+        artifacts = _collect_artifacts(ws)
+        log_tail = _read_log_tail(build_log, max_log_tail_kb)
+
+    # ── parse errors (streamed from disk, never loaded whole) ──
+    with timer.phase("parse"):
+        log_files = [build_log]
+        if (not _file_size(build_log) or result.get("exit_code", -1) != 0) and result.get("stderr_log"):
+            log_files.append(Path(result["stderr_log"]))
+        # build.sh only creates the file when JSON diagnostics were active
+        diag_file = outdir / ".stm32mcp" / "diagnostics.jsonl"
+        structured = diagnostics_format == "json" and diag_file.exists()
+
+        errors: List[Dict[str, Any]] = []
+        error_summary = None
+        if any(_file_size(path) for path in log_files + [diag_file]):
+            # with JSON diagnostics the log is only scanned for linker/make errors
+            mapper = DockerRunner.path_mapper(str(ws), project_subdir)
+            parsed = parse_log_lines(
+                _iter_log_lines(log_files), str(ws), compiler=not structured, mapper=mapper
+            )
+            if structured:
+                parsed = parse_json_diagnostics(_iter_log_lines([diag_file]), str(ws), mapper) + parsed
+            errors = group_errors(parsed)
+            error_summary = get_error_summary(parsed)
+
+    # ── store successful builds (unless sources changed meanwhile) ──
+    if result.get("ok") and use_cache:
+        with timer.phase("cache_store"):
+            image_digest = runner.image_digest()
+            key_after = (
+                compute_build_key(
+                    ws, project_subdir, make_target, image_digest, ignore, diagnostics_format
+                )
+                if image_digest else ""
+            )
+            if key_after and (not cache_key or key_after == cache_key):
+                cache.store(key_after, outdir, {
+                    "errors": errors,
+                    "error_summary": error_summary,
+                    "diagnostics_format": "json" if structured else "text",
+                })
+    duration = (datetime.now() - start).total_seconds()
+
+    response = {
+        "ok": result.get("ok", False),
+        "exit_code": result.get("exit_code", -1),
+        "workspace": str(ws),
+        "outdir": str(outdir),
+        "artifacts": artifacts,
+        **capped(errors),
+        "error_summary": error_summary,
+        "diagnostics_format": "json" if structured else "text",
+        "log_tail": log_tail,
+        "duration_sec": duration,
+        "phases": {"host": timer.phases, "container": result.get("phases") or {}},
+        "profile": result.get("profile"),
+        "sync": result.get("sync"),
+        "jobs": jobs,
+        "pool": result.get("pool"),
+        "incremental": incremental,
+        "ccache": result.get("ccache"),
+        "cache_hit": False,
+        "cancelled": result.get("cancelled", False),
+        "aborted_on_error": result.get("aborted", False),
+    }
+    if result.get("aborted"):
+        response["error"] = "Build aborted on first error (fail_fast)"
+    elif result.get("error"):
+        response["error"] = result["error"]
+    return response
+
+
+def _submit_build(
+    params: Dict[str, Any],
+    listener: Optional[Listener] = None,
+) -> Dict[str, Any]:
+    """Validate *params* and queue the build; return ``{ok, build_id}``.
+
+    The build output is watched by a :class:`BuildMonitor`, which feeds
+    ``get_build_status`` and, if given, *listener*.
+    """
+    try:
+        ws = _check_build_request(params)
+    except ValueError as exc:
+        return {"ok": False, "error": str(exc)}
+    project_subdir = params["project_subdir"]
+    monitor = BuildMonitor(
+        total_units=count_translation_units(ws / project_subdir if project_subdir else ws),
+        workspace=str(ws),
+        fail_fast=params["fail_fast"],
+        listener=listener,
+        mapper=DockerRunner.path_mapper(str(ws), project_subdir),
+    )
+    job = get_job_manager().submit(
+        lambda cancel_event: _run_build(ws, params, cancel_event, monitor),
+        params,
+        monitor=monitor,
+    )
+    return {"ok": True, "build_id": job.build_id, "status": job.status}
+
+
+def _progress_listener(ctx: Context, loop: asyncio.AbstractEventLoop) -> Listener:
+    """Forward build progress and new errors to the MCP client.
+
+    Called from the build's reader threads, so notifications are scheduled
+    onto the server's event loop.
+    """
+    sent_errors: Set[Tuple[str, int, int, str]] = set()
+
+    def listener(snapshot: Dict[str, Any], new_errors: List[ParsedError]) -> None:
+        message = f"Compiled {snapshot['compiled']}/{snapshot['total']} files"
+        if snapshot["current_file"]:
+            message += f" – {snapshot['current_file']}"
+        if snapshot["errors"]:
+            message += f" ({snapshot['errors']} error(s))"
+        asyncio.run_coroutine_threadsafe(
+            ctx.report_progress(snapshot["compiled"], snapshot["total"] or None, message),
+            loop,
+        )
+        for error in new_errors:
+            if error.severity != ErrorSeverity.ERROR:
+                continue
+            # the same header error arrives once per including file
+            key = (error.file, error.line, error.col, error.message)
+            if key in sent_errors:
+                continue
+            if len(sent_errors) >= _MAX_ERROR_NOTIFICATIONS:
+                break
+            sent_errors.add(key)
+            asyncio.run_coroutine_threadsafe(
+                ctx.error(format_error_for_display(error)), loop
+            )
+
+    return listener
+
+
 @mcp.tool()
-def build_firmware(
+async def build_firmware(
     workspace: str,
     project_subdir: str = "",
-    clean: bool = True,
+    clean: Optional[bool] = None,
     jobs: int = 4,
     make_target: str = "all",
     timeout_sec: int = 600,
     max_log_tail_kb: int = 96,
     docker_image: str = "",
+    use_pool: bool = True,
+    incremental: bool = False,
+    ccache: bool = False,
+    use_cache: bool = True,
+    fail_fast: bool = False,
+    profile: bool = False,
+    ignore: Optional[List[str]] = None,
+    work_mode: str = "copy",
+    work_tmpfs_mb: int = 0,
+    max_errors: int = 100,
+    max_errors_per_file: int = 20,
+    max_errors_kb: int = 32,
+    diagnostics_format: str = "text",
+    ctx: Optional[Context] = None,
 ) -> Dict[str, Any]:
     """Compile STM32 firmware inside a Docker container.
 
     Source code is mounted **read-only**; build artifacts are written to
-    ``workspace/out/``.
+    ``workspace/out/``.  The build runs as a job (see ``start_build``), so
+    it can be cancelled with ``cancel_build`` while this call waits.
+
+    Build output is streamed while make runs: progress notifications carry
+    the compiled file count and percentage, and each new error is sent as
+    a log message as soon as GCC prints it.
 
     Args:
         workspace:       Project root directory (must contain a Makefile).
         project_subdir:  Sub-directory where the Makefile lives.
-        clean:           Run ``make clean`` first.
-        jobs:            Parallel make jobs (1-32).
+        clean:           Run ``make clean`` first (default: only when not
+                         incremental).
+        jobs:            Parallel make jobs (1-32), capped by the host-wide
+                         budget shared with concurrent builds.
         make_target:     Make target (default ``all``).
         timeout_sec:     Build timeout in seconds (10-3600).
         max_log_tail_kb: Max log tail to return (KB).
         docker_image:    Override default Docker image.
+        use_pool:        Run in a warm pooled container via ``docker exec``.
+        incremental:     Keep a persistent per-workspace work tree and only
+                         sync changed files, so make rebuilds what changed.
+        ccache:          Compile through the shared, size-capped ccache volume.
+        use_cache:       Reuse the stored result of an identical earlier
+                         build (same sources, target, subdir and image).
+        fail_fast:       Kill the build as soon as the first error appears.
+        profile:         Time every compiler call and return the slowest
+                         translation units (bypasses the result cache).
+        ignore:          Extra ignore patterns (gitignore syntax) for the
+                         files copied into the container, on top of the
+                         built-in defaults (``out/``, ``.git/``, ``Debug/``,
+                         ``*.o`` …) and the workspace's ``.stm32mcpignore``.
+        work_mode:       ``copy`` (default) copies the sources into the work
+                         tree; ``overlay`` mounts an overlayfs over the
+                         read-only sources instead, so nothing is copied
+                         (needs ``CAP_SYS_ADMIN``; falls back to ``copy``).
+        work_tmpfs_mb:   Put the work tree on a RAM-backed tmpfs of this
+                         size (MB) instead of the work volume (0 = off).
+        max_errors:      Max diagnostics returned in ``errors`` (0 = no limit).
+        max_errors_per_file: Max diagnostics returned per file (0 = no limit).
+        max_errors_kb:   Size budget for ``errors`` as JSON, in KB
+                         (0 = no limit).
+        diagnostics_format: ``text`` (default) scrapes GCC's text output;
+                         ``json`` has GCC emit JSON diagnostics and reads
+                         them directly (option name in ``code``, fix-its in
+                         ``suggestion``, ``end_line``/``end_col`` ranges).
+                         Falls back to ``text`` if the toolchain can't.
 
     Returns:
-        ``{ok, exit_code, workspace, outdir, artifacts, errors, error_summary,
-        log_tail, duration_sec}``
+        ``{ok, exit_code, workspace, outdir, artifacts, errors, errors_omitted,
+        error_summary, diagnostics_format, log_tail, duration_sec, phases,
+        profile, sync, pool, incremental, ccache, cache_hit, cancelled,
+        aborted_on_error, jobs, build_id}``  – ``jobs`` is the ``-j`` actually used after the
+        host-wide jobs budget was applied; ``errors`` lists each distinct
+        diagnostic once, in log order, with ``count`` and the number of
+        ``translation_units`` it came from; ``note:`` lines are nested in
+        their parent's ``notes``, with ``include_chain`` and the function
+        ``context`` when GCC printed them; the list is cut to the limits
+        above, errors first (``errors_omitted`` says how many were left
+        out; ``error_summary`` counts all of them); ``phases`` has the seconds spent per step on the host
+        (``cache_lookup``, ``image_check``, ``jobs_wait``, ``container``,
+        ``artifacts``, ``parse``, ``cache_store``) and inside the container
+        (``sync``, ``makefile_fix``, ``clean``, ``toolchain_setup``,
+        ``make``, ``collect``); ``profile`` (with *profile*) has
+        ``units``, ``compile_cpu_sec``, ``compile_wall_sec``, ``link_sec``
+        and the ``slowest`` files; ``sync`` has the number of input files
+        and bytes after the ignore rules, how many were copied and the
+        ``work_mode`` actually used.
     """
-    start = datetime.now()
+    submitted = _submit_build({
+        "workspace": workspace,
+        "project_subdir": project_subdir,
+        "clean": clean,
+        "jobs": jobs,
+        "make_target": make_target,
+        "timeout_sec": timeout_sec,
+        "max_log_tail_kb": max_log_tail_kb,
+        "docker_image": docker_image,
+        "use_pool": use_pool,
+        "incremental": incremental,
+        "ccache": ccache,
+        "use_cache": use_cache,
+        "fail_fast": fail_fast,
+        "profile": profile,
+        "ignore": ignore,
+        "work_mode": work_mode,
+        "work_tmpfs_mb": work_tmpfs_mb,
+        "max_errors": max_errors,
+        "max_errors_per_file": max_errors_per_file,
+        "max_errors_kb": max_errors_kb,
+        "diagnostics_format": diagnostics_format,
+    }, _progress_listener(ctx, asyncio.get_running_loop()) if ctx is not None else None)
+    if not submitted["ok"]:
+        return submitted
+    manager = get_job_manager()
+    try:
+        job = await asyncio.to_thread(manager.wait, submitted["build_id"])
+    except asyncio.CancelledError:
+        manager.cancel(submitted["build_id"])
+        raise
+    return job.result
 
-    # ── parameter checks ──
-    if not 1 <= jobs <= 32:
-        return {"ok": False, "error": "jobs must be 1-32"}
-    if not 10 <= timeout_sec <= _MAX_TIMEOUT:
-        return {"ok": False, "error": f"timeout_sec must be 10-{_MAX_TIMEOUT}"}
 
-    try:
-        ws = _validate_workspace(workspace)
-    except ValueError as exc:
-        return {"ok": False, "error": str(exc)}
+@mcp.tool()
+def start_build(
+    workspace: str,
+    project_subdir: str = "",
+    clean: Optional[bool] = None,
+    jobs: int = 4,
+    make_target: str = "all",
+    timeout_sec: int = 600,
+    max_log_tail_kb: int = 96,
+    docker_image: str = "",
+    use_pool: bool = True,
+    incremental: bool = False,
+    ccache: bool = False,
+    use_cache: bool = True,
+    fail_fast: bool = False,
+    profile: bool = False,
+    ignore: Optional[List[str]] = None,
+    work_mode: str = "copy",
+    work_tmpfs_mb: int = 0,
+    max_errors: int = 100,
+    max_errors_per_file: int = 20,
+    max_errors_kb: int = 32,
+    diagnostics_format: str = "text",
+) -> Dict[str, Any]:
+    """Start a firmware build in the background and return its ID at once.
 
-    project_path = ws / project_subdir if project_subdir else ws
-    if not (project_path / "Makefile").exists():
-        return {"ok": False, "error": f"Makefile not found in {project_path}"}
+    Takes the same arguments as ``build_firmware``.  Use
+    ``get_build_status``, ``wait_build`` and ``cancel_build`` with the
+    returned ``build_id``.  Builds run on a bounded worker pool
+    (``STM32_MCP_BUILD_WORKERS``, default 2).  While it runs,
+    ``get_build_status`` reports live progress and the first error.
 
-    # ── run build via Docker ──
-    image = docker_image or _DEFAULT_IMAGE
-    runner = DockerRunner(image=image)
+    Returns:
+        ``{ok, build_id, status}``
+    """
+    return _submit_build({
+        "workspace": workspace,
+        "project_subdir": project_subdir,
+        "clean": clean,
+        "jobs": jobs,
+        "make_target": make_target,
+        "timeout_sec": timeout_sec,
+        "max_log_tail_kb": max_log_tail_kb,
+        "docker_image": docker_image,
+        "use_pool": use_pool,
+        "incremental": incremental,
+        "ccache": ccache,
+        "use_cache": use_cache,
+        "fail_fast": fail_fast,
+        "profile": profile,
+        "ignore": ignore,
+        "work_mode": work_mode,
+        "work_tmpfs_mb": work_tmpfs_mb,
+        "max_errors": max_errors,
+        "max_errors_per_file": max_errors_per_file,
+        "max_errors_kb": max_errors_kb,
+        "diagnostics_format": diagnostics_format,
+    })
 
-    # Ensure Docker image is available
-    img_status = runner.ensure_image()
-    if not img_status["ok"]:
-        return {"ok": False, "error": img_status["message"]}
 
-    result = runner.run_build(
-        workspace=str(ws),
-        project_subdir=project_subdir,
-        clean=clean,
-        jobs=jobs,
-        make_target=make_target,
-        timeout_sec=timeout_sec,
-    )
+@mcp.tool()
+def get_build_status(build_id: str) -> Dict[str, Any]:
+    """Return the state of a build started with ``start_build``.
 
-    duration = (datetime.now() - start).total_seconds()
-    outdir = ws / "out"
+    Returns:
+        ``{ok, build_id, status, params, queued_sec, elapsed_sec, progress,
+        result}`` where ``status`` is ``queued``, ``running``,
+        ``succeeded``, ``failed`` or ``cancelled``; ``progress`` holds the
+        compiled file count, percentage and first error seen so far; and
+        ``result`` (the ``build_firmware`` response) is present once the
+        build has finished.
+    """
+    job = get_job_manager().get(build_id)
+    if job is None:
+        return {"ok": False, "error": f"Unknown build_id: {build_id}"}
+    return {"ok": True, **job.to_dict()}
 
-    # ── collect artifacts ──
-    artifacts: List[str] = []
-    artifacts_dir = outdir / "artifacts"
-    if artifacts_dir.exists():
-        for ext in (".elf", ".hex", ".bin", ".map"):
-            for f in artifacts_dir.glob(f"*{ext}"):
-                artifacts.append(str(f.relative_to(ws)))
 
-    # ── read log tail ──
-    log_tail = ""
-    build_log = outdir / "build.log"
-    if build_log.exists():
-        content = build_log.read_text(errors="replace")
-        max_bytes = max_log_tail_kb * 1024
-        log_tail = content[-max_bytes:] if len(content) > max_bytes else content
-
-    # ── parse errors ──
-    log_for_parse = ""
-    if build_log.exists():
-        log_for_parse = build_log.read_text(errors="replace")
-    if not log_for_parse or result.get("exit_code", -1) != 0:
-        log_for_parse += "\n" + result.get("stderr", "")
-
-    errors: List[Dict[str, Any]] = []
-    error_summary = None
-    if log_for_parse.strip():
-        parsed = parse_build_log(log_for_parse, str(ws))
-        errors = errors_to_dict(parsed)
-        error_summary = get_error_summary(parsed)
+@mcp.tool()
+async def wait_build(build_id: str, timeout_sec: int = 600) -> Dict[str, Any]:
+    """Wait up to *timeout_sec* for a build to finish.
+
+    Does not block other tool calls while waiting.
+
+    Returns:
+        Same as ``get_build_status``; ``status`` is still ``queued`` or
+        ``running`` if the timeout expired first.
+    """
+    manager = get_job_manager()
+    job = manager.get(build_id)
+    if job is None:
+        return {"ok": False, "error": f"Unknown build_id: {build_id}"}
+    await asyncio.to_thread(manager.wait, build_id, max(0, timeout_sec))
+    return {"ok": True, **job.to_dict()}
+
+
+@mcp.tool()
+def cancel_build(build_id: str) -> Dict[str, Any]:
+    """Cancel a queued or running build; its container is killed.
+
+    Returns:
+        ``{ok, build_id, status}``
+    """
+    job = get_job_manager().cancel(build_id)
+    if job is None:
+        return {"ok": False, "error": f"Unknown build_id: {build_id}"}
+    return {"ok": True, "build_id": job.build_id, "status": job.status}
+
+
+# Per-variant keys accepted by build_matrix, with build_firmware's defaults
+_MATRIX_DEFAULTS: Dict[str, Any] = {
+    "workspace": "",
+    "project_subdir": "",
+    "clean": None,
+    "make_target": "all",
+    "max_log_tail_kb": 0,
+    "docker_image": "",
+    "use_pool": True,
+    "incremental": False,
+    "ccache": False,
+    "use_cache": True,
+    "fail_fast": False,
+    "profile": False,
+    "ignore": None,
+    "work_mode": "copy",
+    "work_tmpfs_mb": 0,
+    "max_errors": 100,
+    "max_errors_per_file": 20,
+    "max_errors_kb": 32,
+    "diagnostics_format": "text",
+}
+
+
+@mcp.tool()
+async def build_matrix(
+    builds: List[Dict[str, Any]],
+    max_parallel: int = 0,
+    timeout_sec: int = 600,
+) -> Dict[str, Any]:
+    """Build several firmware variants concurrently.
+
+    The host-wide jobs budget (usable CPUs after affinity and cgroup quota,
+    or ``STM32_MCP_JOBS_BUDGET``) is split evenly across the builds that
+    run at the same time, instead of each build guessing its own ``-j``.
+    Variants that share a workspace still run one after another, because
+    they share ``out/``.
+
+    Args:
+        builds:       Build specs.  Each is a dict with ``workspace`` and
+                      optionally ``label``, ``project_subdir``, ``clean``,
+                      ``make_target``, ``docker_image``, ``use_pool``,
+                      ``incremental``, ``ccache``, ``use_cache``,
+                      ``fail_fast``, ``profile``, ``ignore``,
+                      ``work_mode``, ``work_tmpfs_mb``, ``max_errors``,
+                      ``max_errors_per_file``, ``max_errors_kb``,
+                      ``diagnostics_format``.
+        max_parallel: Max builds at once (0 = as many as the budget allows).
+        timeout_sec:  Per-build timeout in seconds (10-3600).
+
+    Returns:
+        ``{ok, results, summary}`` – ``results`` has one entry per spec
+        (``label, ok, exit_code, jobs, duration_sec, artifacts,
+        error_summary, errors, cache_hit, phases`` and ``profile`` when
+        requested); ``summary`` has ``wall_sec``,
+        ``serial_sum_sec``, ``speedup``, ``succeeded``, ``failed``,
+        ``concurrency``, ``jobs_per_build`` and ``jobs_budget``.
+    """
+    if not builds:
+        return {"ok": False, "error": "builds must not be empty"}
+
+    budget = get_job_budget()
+    concurrency, jobs_per_build = budget.plan(len(builds), max_parallel)
+
+    prepared = []
+    for i, spec in enumerate(builds):
+        unknown = set(spec) - set(_MATRIX_DEFAULTS) - {"label"}
+        if unknown:
+            return {"ok": False, "error": f"builds[{i}]: unknown keys {sorted(unknown)}"}
+        params = {key: spec.get(key, default) for key, default in _MATRIX_DEFAULTS.items()}
+        params.update(jobs=jobs_per_build, timeout_sec=timeout_sec)
+        try:
+            ws = _check_build_request(params)
+        except ValueError as exc:
+            return {"ok": False, "error": f"builds[{i}]: {exc}"}
+        label = spec.get("label") or f"{ws.name}:{params['project_subdir'] or '.'}:{params['make_target']}"
+        prepared.append((label, ws, params))
 
+    def run_one(item: Any) -> Dict[str, Any]:
+        label, ws, params = item
+        try:
+            result = _run_build(ws, params)
+        except Exception as exc:
+            # one broken variant must not discard the other results
+            return {"label": label, "ok": False, "exit_code": -1, "duration_sec": 0.0, "error": str(exc)}
+        return {
+            "label": label,
+            "ok": result.get("ok", False),
+            "exit_code": result.get("exit_code", -1),
+            "jobs": result.get("jobs"),
+            "duration_sec": result.get("duration_sec", 0.0),
+            "artifacts": result.get("artifacts", []),
+            "error_summary": result.get("error_summary"),
+            "errors": result.get("errors", []),
+            "errors_omitted": result.get("errors_omitted", 0),
+            "cache_hit": result.get("cache_hit", False),
+            "phases": result.get("phases"),
+            **({"profile": result["profile"]} if result.get("profile") else {}),
+            **({"error": result["error"]} if result.get("error") else {}),
+        }
+
+    start = datetime.now()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="stm32-matrix") as pool:
+        results = await asyncio.to_thread(lambda: list(pool.map(run_one, prepared)))
+    wall = (datetime.now() - start).total_seconds()
+
+    serial = sum(r["duration_sec"] for r in results)
+    succeeded = sum(1 for r in results if r["ok"])
     return {
-        "ok": result.get("ok", False),
-        "exit_code": result.get("exit_code", -1),
-        "workspace": str(ws),
-        "outdir": str(outdir),
-        "artifacts": artifacts,
-        "errors": errors,
-        "error_summary": error_summary,
-        "log_tail": log_tail,
-        "duration_sec": duration,
+        "ok": succeeded == len(results),
+        "results": results,
+        "summary": {
+            "wall_sec": round(wall, 3),
+            "serial_sum_sec": round(serial, 3),
+            "speedup": round(serial / wall, 2) if wall > 0 else None,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "concurrency": concurrency,
+            "jobs_per_build": jobs_per_build,
+            "jobs_budget": budget.total,
+        },
     }
 
 
@@ -185,23 +834,29 @@ def build_firmware(
 def check_environment() -> Dict[str, Any]:
     """Check whether Docker and the toolchain image are available.
 
+    Results come from the process-wide readiness cache; on a cold cache the
+    daemon, version and image probes run concurrently.
+
     Returns:
-        ``{ready, docker_available, docker_version, image_exists, image}``
+        ``{ready, docker_available, docker_version, image_exists, image,
+        cached}``
     """
-    runner = DockerRunner()
-    docker_ok = runner.is_docker_available()
-    image_ok = runner.is_image_available() if docker_ok else False
+    image = DockerRunner.DEFAULT_IMAGE
+    status = get_readiness().check(image)
+    docker_ok = status["docker_available"]
+    image_ok = docker_ok and bool(status["image_digest"])
 
     return {
         "ready": docker_ok and image_ok,
         "docker_available": docker_ok,
-        "docker_version": runner.docker_version(),
+        "docker_version": status["docker_version"],
         "image_exists": image_ok,
-        "image": runner.image,
+        "image": image,
+        "cached": status["cached"],
         "hint": (
             None if (docker_ok and image_ok)
             else "Docker not found" if not docker_ok
-            else f"Run: docker pull {runner.image}"
+            else f"Run: docker pull {image}"
         ),
     }
 
@@ -210,18 +865,25 @@ def check_environment() -> Dict[str, Any]:
 def parse_gcc_errors(
     log_content: str,
     workspace: str = "",
+    project_subdir: str = "",
 ) -> Dict[str, Any]:
     """Parse a raw GCC / LD build log into structured error records.
 
+    Container paths (``/work/project/...``, ``/src/...``) and paths relative
+    to the Makefile directory are mapped to workspace-relative paths.
+
     Args:
-        log_content: Raw build log text.
-        workspace:   Project root (used to normalise file paths).
+        log_content:    Raw build log text.
+        workspace:      Project root (used to normalise file paths).
+        project_subdir: Sub-directory where the Makefile lives.
 
     Returns:
         ``{ok, errors, summary, formatted, total}``
     """
     try:
-        parsed = parse_build_log(log_content, workspace)
+        parsed = parse_build_log(
+            log_content, workspace, DockerRunner.path_mapper(workspace, project_subdir)
+        )
         return {
             "ok": True,
             "errors": errors_to_dict(parsed),
@@ -233,10 +895,119 @@ def parse_gcc_errors(
         return {"ok": False, "error": f"Parse failed: {exc}"}
 
 
+@mcp.tool()
+def analyze_memory(
+    workspace: str,
+    map_file: str = "",
+    project_subdir: str = "",
+    top: int = 20,
+) -> Dict[str, Any]:
+    """Report FLASH/RAM usage from the linker map file of the last build.
+
+    Results are cached by the map file's hash, so asking again about the
+    same build is instant.
+
+    Args:
+        workspace:      Project root (looks for ``out/artifacts/*.map``).
+        map_file:       Explicit map file path (relative to workspace).
+        project_subdir: Sub-directory where the Makefile lives (used to
+                        make object paths workspace-relative).
+        top:            Number of object files and libraries to list
+                        (0 = all).
+
+    Returns:
+        ``{ok, map_file, sha256, cached, regions, sections, modules,
+        modules_total, libraries, fill}`` – ``regions`` has ``used``,
+        ``free`` and ``percent`` per memory region; ``sections`` the
+        allocated output sections with their region (and ``load_region``
+        for initialised data); ``modules`` / ``libraries`` the largest
+        object files and archives with their bytes per region.
+    """
+    try:
+        ws = _validate_workspace(workspace)
+        map_path = _find_artifact(ws, map_file, ".map")
+    except ValueError as exc:
+        return {"ok": False, "error": str(exc)}
+
+    try:
+        report, cached = analyze_map_file(map_path, DockerRunner.path_mapper(str(ws), project_subdir))
+    except OSError as exc:
+        return {"ok": False, "error": f"Cannot read map file: {exc}"}
+    if not report["regions"]:
+        return {"ok": False, "error": f"No memory regions in {map_path.name} (not a GNU ld map file?)"}
+
+    limit = top if top > 0 else None
+    return {
+        "ok": True,
+        "map_file": str(map_path.relative_to(ws)) if map_path.is_relative_to(ws) else str(map_path),
+        "sha256": report["sha256"],
+        "cached": cached,
+        "regions": report["regions"],
+        "sections": report["sections"],
+        "modules": report["modules"][:limit],
+        "modules_total": len(report["modules"]),
+        "libraries": report["libraries"][:limit],
+        "fill": report["fill"],
+    }
+
+
+@mcp.tool()
+def inspect_elf(
+    workspace: str,
+    elf_file: str = "",
+    symbols: Optional[List[str]] = None,
+    top: int = 20,
+    kind: str = "",
+    section: str = "",
+) -> Dict[str, Any]:
+    """Section sizes and symbol lookups from the built ELF, without binutils.
+
+    The ELF is indexed once per file hash; later queries about the same
+    build are answered from memory.
+
+    Args:
+        workspace: Project root (looks for ``out/artifacts/*.elf``).
+        elf_file:  Explicit ELF path (relative to workspace).
+        symbols:   Symbol names to look up (e.g. ``["main", "SystemCoreClock"]``).
+        top:       Number of largest symbols to list (0 = none).
+        kind:      Only list symbols of this type (``func``, ``object``).
+        section:   Only list symbols in sections starting with this name
+                   (e.g. ``.bss``).
+
+    Returns:
+        ``{ok, elf_file, sha256, cached, entry, text, data, bss, sections,
+        top_symbols, symbols}`` – ``text`` / ``data`` / ``bss`` are the
+        Berkeley ``size`` totals; ``symbols`` maps each requested name to
+        ``{name, address, size, type, bind, section}`` or ``None``.
+    """
+    try:
+        ws = _validate_workspace(workspace)
+        elf_path = _find_artifact(ws, elf_file, ".elf")
+        image, digest, cached = load_elf(elf_path)
+    except (ValueError, OSError, struct.error) as exc:
+        return {"ok": False, "error": str(exc)}
+
+    return {
+        "ok": True,
+        "elf_file": str(elf_path.relative_to(ws)) if elf_path.is_relative_to(ws) else str(elf_path),
+        "sha256": digest,
+        "cached": cached,
+        "entry": f"0x{image.entry:08x}",
+        **image.section_sizes(),
+        "top_symbols": image.top_symbols_by_size(top, kind, section) if top > 0 else [],
+        "symbols": {name: image.get_symbol(name) for name in symbols or []},
+    }
+
+
 # ═══════════════════════════════════════════════════════════
 #  FLASH TOOLS
 # ═══════════════════════════════════════════════════════════
 
+_MAX_FLASH_PARALLEL = 16
+_VERIFY_METHODS = ("crc", "readback")
+_READBACK_MARK = "stm32-mcp: CRC mismatch, reading back"
+
+
 @mcp.tool()
 def flash_firmware(
     workspace: str,
@@ -247,30 +1018,188 @@ def flash_firmware(
     verify: bool = True,
     reset: bool = True,
     timeout_sec: int = 120,
+    delta: bool = False,
+    address: int = DEFAULT_FLASH_BASE,
+    probe_serial: str = "",
+    verify_method: str = "crc",
 ) -> Dict[str, Any]:
     """Flash firmware to an STM32 MCU via local OpenOCD / ST-Link.
 
     Args:
-        workspace:   Project root (will look for hex in ``out/artifacts/``).
-        hex_file:    Explicit hex/bin file path (relative to workspace).
-        programmer:  ``stlink`` (default) or ``cmsis-dap``.
-        interface:   ``swd`` (default) or ``jtag``.
-        target_cfg:  OpenOCD target config (e.g. ``stm32f4x.cfg``).
-        verify:      Verify after programming.
-        reset:       Reset MCU after programming.
-        timeout_sec: Timeout in seconds.
+        workspace:    Project root (will look for hex in ``out/artifacts/``).
+        hex_file:     Explicit hex/bin/elf file path (relative to workspace).
+        programmer:   ``stlink`` (default) or ``cmsis-dap``.
+        interface:    ``swd`` (default) or ``jtag``.
+        target_cfg:   OpenOCD target config (e.g. ``stm32f4x.cfg``).
+        verify:       Verify after programming.
+        reset:        Reset MCU after programming.
+        timeout_sec:  Timeout in seconds.
+        delta:        Rewrite only the flash sectors that changed since the
+                      last flash of this board (needs persistent OpenOCD
+                      sessions; see ``delta_flash``).
+        address:      Load address of a raw binary image.
+        probe_serial: USB serial of the probe to use (see ``list_probes``);
+                      empty uses the first probe found.
+        verify_method: ``crc`` (default): the target computes a CRC32 of
+                      each image section and the image is read back only
+                      on a mismatch; ``readback`` always compares every
+                      byte.
 
     Returns:
-        ``{ok, exit_code, hex_file, stdout, stderr, device_id}``
+        ``{ok, exit_code, hex_file, image, stdout, stderr, device_id,
+        duration_sec, session, verify}`` – *image* is ``{format, start, end,
+        size, segments}`` of the parsed image; *session* is ``hit``
+        when a warm OpenOCD daemon was reused, ``miss`` / ``restart`` when
+        one was (re)started, and ``oneshot`` with
+        ``STM32_MCP_OPENOCD_IDLE_SEC=0``; *verify* is ``{method,
+        duration_sec}`` with the check that decided (``crc`` or
+        ``readback``, plus ``crc_mismatch`` when the CRC fell back).  With
+        *delta*, ``delta`` reports ``{mode, baseline, sectors,
+        sectors_written, bytes_written}``.
     """
-    start = datetime.now()
+    if verify_method not in _VERIFY_METHODS:
+        return {"ok": False, "error": "verify_method must be 'crc' or 'readback'"}
+    try:
+        ws = _validate_workspace(workspace)
+        hex_path = _find_image(ws, hex_file)
+    except ValueError as exc:
+        return {"ok": False, "error": str(exc)}
+    try:
+        image, _, _ = load_image(hex_path, address)
+    except (OSError, ValueError) as exc:
+        return {"ok": False, "error": str(exc), "hex_file": _ws_path(ws, hex_path)}
 
+    probe = ProbeConfig(_interface_cfg(programmer), f"target/{target_cfg}", probe_serial)
+    result = _flash_probe(hex_path, image, probe, verify, verify_method, reset, timeout_sec, delta)
+    result.update(hex_file=_ws_path(ws, hex_path), image=image.summary())
+    return result
+
+
+@mcp.tool()
+def list_probes() -> Dict[str, Any]:
+    """List the connected ST-Link / CMSIS-DAP probes by USB serial.
+
+    Returns:
+        ``{ok, probes, count}`` – each probe is ``{serial, programmer,
+        model, vid, pid, manufacturer, port}``; pass *serial* as
+        ``probe_serial`` to ``flash_firmware`` / ``detect_mcu`` or in
+        ``flash_many``'s ``probes``.
+    """
+    found = enumerate_probes()
+    return {"ok": True, "probes": found, "count": len(found)}
+
+
+@mcp.tool()
+async def flash_many(
+    workspace: str,
+    probes: Optional[List[str]] = None,
+    hex_file: str = "",
+    programmer: str = "stlink",
+    target_cfg: str = "stm32f1x.cfg",
+    verify: bool = True,
+    reset: bool = True,
+    timeout_sec: int = 120,
+    delta: bool = False,
+    address: int = DEFAULT_FLASH_BASE,
+    max_parallel: int = 8,
+    verify_method: str = "crc",
+) -> Dict[str, Any]:
+    """Flash one image to several boards at once (gang programming).
+
+    Each probe gets its own OpenOCD daemon; up to *max_parallel* boards
+    are programmed at the same time.
+
+    Args:
+        workspace:    Project root (will look for hex in ``out/artifacts/``).
+        probes:       USB serials of the probes to use (see ``list_probes``);
+                      default: every connected probe of type *programmer*.
+        hex_file:     Explicit hex/bin/elf file path (relative to workspace).
+        programmer:   ``stlink`` (default) or ``cmsis-dap``.
+        target_cfg:   OpenOCD target config (e.g. ``stm32f4x.cfg``).
+        verify:       Verify after programming.
+        reset:        Reset MCU after programming.
+        timeout_sec:  Per-board timeout in seconds.
+        delta:        Differential flashing per board (see ``flash_firmware``).
+        address:      Load address of a raw binary image.
+        max_parallel: Max boards programmed at once (1-16).
+        verify_method: ``crc`` or ``readback`` (see ``flash_firmware``).
+
+    Returns:
+        ``{ok, hex_file, image, results, summary}`` – ``results`` has one
+        entry per probe (``serial, ok, device_id, duration_sec, session``,
+        ``verify`` / ``delta`` / ``error`` when set); ``summary`` has
+        ``wall_sec``, ``serial_sum_sec``, ``boards_per_min``,
+        ``succeeded``, ``failed`` and ``concurrency``.
+    """
+    if not 1 <= max_parallel <= _MAX_FLASH_PARALLEL:
+        return {"ok": False, "error": f"max_parallel must be 1-{_MAX_FLASH_PARALLEL}"}
+    if verify_method not in _VERIFY_METHODS:
+        return {"ok": False, "error": "verify_method must be 'crc' or 'readback'"}
     try:
         ws = _validate_workspace(workspace)
+        hex_path = _find_image(ws, hex_file)
     except ValueError as exc:
         return {"ok": False, "error": str(exc)}
+    try:
+        image, _, _ = load_image(hex_path, address)
+    except (OSError, ValueError) as exc:
+        return {"ok": False, "error": str(exc), "hex_file": _ws_path(ws, hex_path)}
+
+    if probes is None:
+        probes = [p["serial"] for p in enumerate_probes() if p["programmer"] == programmer]
+    if not probes:
+        return {"ok": False, "error": f"No {programmer} probes found"}
+    if len(set(probes)) != len(probes):
+        return {"ok": False, "error": "probes must not contain duplicates"}
+    if not all(probes):
+        return {"ok": False, "error": "probes must be USB serials (see list_probes)"}
+
+    interface_cfg = _interface_cfg(programmer)
+
+    def run_one(serial: str) -> Dict[str, Any]:
+        probe = ProbeConfig(interface_cfg, f"target/{target_cfg}", serial)
+        result = _flash_probe(hex_path, image, probe, verify, verify_method, reset, timeout_sec, delta)
+        return {
+            "serial": serial,
+            "ok": result.get("ok", False),
+            "device_id": result.get("device_id", ""),
+            "duration_sec": result.get("duration_sec", 0.0),
+            "session": result.get("session", ""),
+            **({"verify": result["verify"]} if result.get("verify") else {}),
+            **({"delta": result["delta"]} if result.get("delta") else {}),
+            **({"error": result["error"], "stderr": result.get("stderr", "")}
+               if not result.get("ok") else {}),
+        }
+
+    concurrency = min(max_parallel, len(probes))
+    start = datetime.now()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="stm32-flash") as pool:
+        results = await asyncio.to_thread(lambda: list(pool.map(run_one, probes)))
+    wall = (datetime.now() - start).total_seconds()
 
-    # ── locate hex file ──
+    succeeded = sum(1 for r in results if r["ok"])
+    return {
+        "ok": succeeded == len(results),
+        "hex_file": _ws_path(ws, hex_path),
+        "image": image.summary(),
+        "results": results,
+        "summary": {
+            "wall_sec": round(wall, 3),
+            "serial_sum_sec": round(sum(r["duration_sec"] for r in results), 3),
+            "boards_per_min": round(60.0 * succeeded / wall, 1) if wall > 0 else None,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "concurrency": concurrency,
+        },
+    }
+
+
+def _find_image(ws: Path, hex_file: str) -> Path:
+    """Return *hex_file* (relative to *ws*) or the image in ``out/artifacts``.
+
+    HEX is preferred over ELF (both carry their load addresses) and ELF over
+    a raw binary; among several files of one format the newest wins.
+    """
     if hex_file:
         hex_path = ws / hex_file
     else:
@@ -278,42 +1207,120 @@ def flash_firmware(
         hex_path = None
         artifacts_dir = ws / "out" / "artifacts"
         if artifacts_dir.exists():
-            for ext in (".hex", ".bin"):
-                candidates = list(artifacts_dir.glob(f"*{ext}"))
+            for ext in (".hex", ".elf", ".bin"):
+                candidates = sorted(
+                    artifacts_dir.glob(f"*{ext}"), key=lambda f: (f.stat().st_mtime, f.name), reverse=True
+                )
                 if candidates:
                     hex_path = candidates[0]
                     break
         if hex_path is None:
-            return {"ok": False, "error": "No hex/bin file found in out/artifacts/"}
+            raise ValueError("No hex/elf/bin file found in out/artifacts/")
 
-    if not hex_path.exists():
-        return {"ok": False, "error": f"File not found: {hex_path}"}
+    if not hex_path.is_file():
+        raise ValueError(f"File not found: {hex_path}")
+    return hex_path
 
-    # ── determine interface config ──
+
+def _ws_path(ws: Path, path: Path) -> str:
+    """*path* relative to *ws* when it lies inside, else as given."""
+    return str(path.relative_to(ws)) if path.is_relative_to(ws) else str(path)
+
+
+def _flash_probe(
+    hex_path: Path,
+    image: SparseImage,
+    probe: ProbeConfig,
+    verify: bool,
+    verify_method: str,
+    reset: bool,
+    timeout_sec: int,
+    delta: bool,
+) -> Dict[str, Any]:
+    """Flash *image* through *probe*'s persistent daemon, or one-shot."""
+    start = datetime.now()
+    # OpenOCD needs the load address only for raw binaries
+    bin_address = image.start if image.format == "bin" else None
+
+    sessions = get_openocd_sessions()
+    if not sessions.enabled:
+        return _flash_oneshot(hex_path, bin_address, probe, verify, verify_method, reset, timeout_sec)
+
+    def program(session: OpenOcdSession) -> Tuple[int, List[str], str, Any, Any]:
+        mark = session.log_mark
+        idcode = session.read_idcode()
+        if delta:
+            report = flash_delta(session, hex_path, image, verify, reset, timeout_sec, verify_method)
+            output, checked = report.pop("output"), report.pop("verify")
+            return idcode, output, session.log_since(mark), checked, report
+        output, checked = session.program(
+            str(hex_path), bin_address, verify, reset, timeout_sec, verify_method
+        )
+        return idcode, output, session.log_since(mark), checked, None
+
+    try:
+        (idcode, output, log, checked, report), status = sessions.run(probe, program)
+    except OpenOcdError as exc:
+        return {
+            "ok": False,
+            "error": str(exc),
+            "stderr": exc.log,
+            "duration_sec": (datetime.now() - start).total_seconds(),
+        }
+    return {
+        "ok": True,
+        "exit_code": 0,
+        "stdout": "".join(output),
+        "stderr": log,
+        "device_id": f"0x{idcode:08x}",
+        "duration_sec": (datetime.now() - start).total_seconds(),
+        "session": status,
+        **({"verify": checked} if checked is not None else {}),
+        **({"delta": report} if report is not None else {}),
+    }
+
+
+def _interface_cfg(programmer: str) -> str:
     if programmer == "stlink":
-        interface_cfg = "interface/stlink.cfg"
-    elif programmer == "cmsis-dap":
-        interface_cfg = "interface/cmsis-dap.cfg"
-    else:
-        interface_cfg = f"interface/{programmer}.cfg"
+        return "interface/stlink.cfg"
+    if programmer == "cmsis-dap":
+        return "interface/cmsis-dap.cfg"
+    return f"interface/{programmer}.cfg"
+
+
+def _flash_oneshot(
+    hex_path: Path,
+    bin_address: Optional[int],
+    probe: ProbeConfig,
+    verify: bool,
+    verify_method: str,
+    reset: bool,
+    timeout_sec: int,
+) -> Dict[str, Any]:
+    """Flash with a one-off ``openocd`` run (persistent sessions disabled)."""
+    start = datetime.now()
 
     # ── build OpenOCD command ──
     ocd_cmd = [
-        "openocd",
-        "-f", interface_cfg,
-        "-f", f"target/{target_cfg}",
+        get_openocd_sessions().executable,
+        *probe.args(),
         "-c", "init",
         "-c", "reset halt",
     ]
 
     # program command
     file_str = str(hex_path)
-    if file_str.endswith(".hex"):
-        ocd_cmd += ["-c", f"flash write_image erase {file_str}"]
-    else:
-        ocd_cmd += ["-c", f"flash write_image erase {file_str} 0x08000000"]
+    if bin_address is not None:
+        file_str += f" 0x{bin_address:08x}"
+    ocd_cmd += ["-c", f"flash write_image erase {file_str}"]
 
-    if verify:
+    if verify and verify_method == "crc":
+        # read back only if the target-side CRC differs
+        ocd_cmd += ["-c", (
+            f"if {{[catch {{verify_image_checksum {file_str}}}]}} "
+            f"{{echo {{{_READBACK_MARK}}}; verify_image {file_str}}}"
+        )]
+    elif verify:
         ocd_cmd += ["-c", f"verify_image {file_str}"]
     if reset:
         ocd_cmd += ["-c", "reset run"]
@@ -336,15 +1343,22 @@ def flash_firmware(
                 device_id = line.strip()
                 break
 
-        return {
+        result = {
             "ok": r.returncode == 0,
             "exit_code": r.returncode,
-            "hex_file": str(hex_path.relative_to(ws)),
             "stdout": r.stdout,
             "stderr": r.stderr,
             "device_id": device_id,
             "duration_sec": duration,
+            "session": "oneshot",
         }
+        if verify:
+            fell_back = _READBACK_MARK in r.stdout or _READBACK_MARK in r.stderr
+            # the one-shot run is not timed per step
+            result["verify"] = {"method": "readback" if fell_back or verify_method != "crc" else "crc"}
+            if fell_back:
+                result["verify"]["crc_mismatch"] = True
+        return result
     except FileNotFoundError:
         return {"ok": False, "error": "openocd not found. Install OpenOCD first."}
     except subprocess.TimeoutExpired:
@@ -354,16 +1368,53 @@ def flash_firmware(
 
 
 @mcp.tool()
-def detect_mcu() -> Dict[str, Any]:
+def detect_mcu(
+    programmer: str = "stlink",
+    target_cfg: str = "stm32f1x.cfg",
+    probe_serial: str = "",
+) -> Dict[str, Any]:
     """Detect connected STM32 MCU via OpenOCD / ST-Link.
 
+    Reads ``DBGMCU_IDCODE`` through the probe's persistent OpenOCD daemon,
+    so repeated calls skip adapter init and target examination.
+
+    Args:
+        programmer:   ``stlink`` (default) or ``cmsis-dap``.
+        target_cfg:   OpenOCD target config (e.g. ``stm32f4x.cfg``).
+        probe_serial: USB serial of the probe to use (see ``list_probes``).
+
     Returns:
-        ``{ok, device_id, stdout, stderr}``
+        ``{ok, device_id, dev_id, rev_id, stdout, stderr, session}``
     """
+    probe = ProbeConfig(_interface_cfg(programmer), f"target/{target_cfg}", probe_serial)
+    sessions = get_openocd_sessions()
+    if not sessions.enabled:
+        return _detect_oneshot(probe)
+
+    def read_idcode(session: OpenOcdSession) -> Tuple[int, str]:
+        mark = session.log_mark
+        return session.read_idcode(), session.log_since(mark)
+
+    try:
+        (idcode, log), status = sessions.run(probe, read_idcode)
+    except OpenOcdError as exc:
+        return {"ok": False, "error": str(exc), "stderr": exc.log}
+    return {
+        "ok": True,
+        "device_id": f"0x{idcode:08x}",
+        "dev_id": f"0x{idcode & 0xFFF:03x}",
+        "rev_id": f"0x{idcode >> 16:04x}",
+        "stdout": "",
+        "stderr": log,
+        "session": status,
+    }
+
+
+def _detect_oneshot(probe: ProbeConfig) -> Dict[str, Any]:
+    """Detect with a one-off ``openocd`` run (persistent sessions disabled)."""
     ocd_cmd = [
-        "openocd",
-        "-f", "interface/stlink.cfg",
-        "-f", "target/stm32f1x.cfg",
+        get_openocd_sessions().executable,
+        *probe.args(),
         "-c", "init",
         "-c", "shutdown",
     ]
@@ -381,6 +1432,7 @@ def detect_mcu() -> Dict[str, Any]:
             "device_id": device_id,
             "stdout": r.stdout,
             "stderr": r.stderr,
+            "session": "oneshot",
         }
     except FileNotFoundError:
         return {"ok": False, "error": "openocd not found. Install OpenOCD first."}
@@ -397,17 +1449,25 @@ def detect_mcu() -> Dict[str, Any]:
 @mcp.tool()
 def get_server_info() -> Dict[str, Any]:
     """Return server version and capability summary."""
-    runner = DockerRunner()
     return {
         "name": "stm32-mcp",
         "version": _VERSION,
-        "docker_image": runner.image,
+        "docker_image": DockerRunner.DEFAULT_IMAGE,
         "tools": [
             "build_firmware",
+            "start_build",
+            "get_build_status",
+            "wait_build",
+            "cancel_build",
+            "build_matrix",
             "flash_firmware",
+            "flash_many",
+            "list_probes",
             "detect_mcu",
             "check_environment",
             "parse_gcc_errors",
+            "analyze_memory",
+            "inspect_elf",
             "get_server_info",
         ],
         "supported_families": ["STM32F1", "STM32F4", "STM32L4", "STM32F7", "STM32H7"],
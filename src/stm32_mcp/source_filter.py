@@ -0,0 +1,133 @@
+"""Ignore rules deciding which workspace files are build inputs.
+
+Only the files that pass these rules are synced into the container's work
+tree and hashed into the result-cache key.  Rules come from, in order:
+
+1. :data:`DEFAULT_IGNORE` – VCS metadata, IDE build trees and build outputs,
+2. the project's ``.stm32mcpignore`` file (workspace root),
+3. the ``ignore`` tool argument.
+
+Patterns use a gitignore subset: ``#`` comments, ``!`` to re-include,
+a trailing ``/`` to match directories only, and a ``/`` anywhere else to
+anchor the pattern to the workspace root (otherwise it matches a name at
+any depth).  The last matching pattern wins.
+
+Two paths are exempt: the workspace's own ``out/`` directory is always
+excluded, and the directories leading to ``project_subdir`` are never
+pruned (CubeIDE keeps its generated Makefile in ``Debug/``).
+"""
+
+import fnmatch
+import os
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Set, Tuple
+
+IGNORE_FILE = ".stm32mcpignore"
+
+DEFAULT_IGNORE = [
+    ".git/", ".svn/", ".hg/", "__pycache__/",
+    "Debug/", "Release/",
+    "*.bak", "*.orig", "*~",
+    "*.o", "*.d", "*.su", "*.cyclo", "*.lst", "*.list",
+    "*.elf", "*.hex", "*.bin", "*.map",
+]
+
+
+class IgnoreRules:
+    """Compiled ignore patterns for one workspace."""
+
+    def __init__(self, patterns: Sequence[str], keep_dirs: Sequence[str] = ()) -> None:
+        self.patterns = [p for p in (line.strip() for line in patterns) if p and not p.startswith("#")]
+        # (negate, dir_only, anchored, glob)
+        self._rules: List[Tuple[bool, bool, bool, str]] = []
+        for pattern in self.patterns:
+            negate = pattern.startswith("!")
+            pattern = pattern[1:] if negate else pattern
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            self._rules.append((negate, dir_only, anchored, pattern.lstrip("/")))
+        self._keep: Set[str] = set()
+        for keep in keep_dirs:
+            parts = Path(keep).as_posix().strip("/").split("/")
+            for i in range(1, len(parts) + 1):
+                if parts[i - 1] not in ("", "."):
+                    self._keep.add("/".join(parts[:i]))
+
+    @classmethod
+    def for_workspace(
+        cls,
+        workspace: Path,
+        project_subdir: str = "",
+        extra: Optional[Sequence[str]] = None,
+    ) -> "IgnoreRules":
+        """Defaults + ``.stm32mcpignore`` + *extra*, keeping *project_subdir*."""
+        patterns = list(DEFAULT_IGNORE)
+        try:
+            patterns += (workspace / IGNORE_FILE).read_text(errors="replace").splitlines()
+        except OSError:
+            pass
+        patterns += list(extra or [])
+        return cls(patterns, keep_dirs=[project_subdir] if project_subdir else [])
+
+    def ignored(self, rel: str, is_dir: bool) -> bool:
+        """Return True if the workspace-relative POSIX path *rel* is excluded."""
+        if rel == "out" or rel.startswith("out/"):
+            return True
+        if is_dir and rel in self._keep:
+            return False
+        name = rel.rsplit("/", 1)[-1]
+        result = False
+        for negate, dir_only, anchored, glob in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if fnmatch.fnmatchcase(rel if anchored else name, glob):
+                result = not negate
+        return result
+
+
+def iter_input_files(workspace: Path, rules: IgnoreRules) -> Iterator[Tuple[str, Path]]:
+    """Yield ``(relative_posix_path, path)`` for every non-ignored file.
+
+    Ignored directories are pruned, not walked.  Symlinks (to files or
+    directories) are yielded as entries and not followed.
+    """
+    for dirpath, dirnames, filenames in os.walk(workspace):
+        here = Path(dirpath)
+        base = here.relative_to(workspace).as_posix()
+        prefix = "" if base == "." else base + "/"
+        kept = []
+        for d in sorted(dirnames):
+            rel = prefix + d
+            if rules.ignored(rel, is_dir=True):
+                continue
+            if (here / d).is_symlink():
+                yield rel, here / d
+            else:
+                kept.append(d)
+        dirnames[:] = kept
+        for name in sorted(filenames):
+            rel = prefix + name
+            if not rules.ignored(rel, is_dir=False):
+                yield rel, here / name
+
+
+def write_sync_list(workspace: Path, rules: IgnoreRules, dest: Path) -> Tuple[int, int]:
+    """Write the NUL-separated input file list for ``build.sh`` to *dest*.
+
+    Returns ``(files, bytes)`` of the listed inputs.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    files = 0
+    size = 0
+    tmp = dest.with_name(dest.name + ".tmp")
+    with open(tmp, "wb") as f:
+        for rel, path in iter_input_files(workspace, rules):
+            f.write(rel.encode() + b"\0")
+            files += 1
+            try:
+                size += path.lstat().st_size
+            except OSError:
+                pass
+    os.replace(tmp, dest)
+    return files, size
@@ -0,0 +1,82 @@
+"""
+Unit tests for the sector mapping of differential flashing
+
+Uses the STM32F4 bank 0 layout (4 x 16 KiB, 64 KiB, 128 KiB sectors), so
+no target or OpenOCD is needed.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from stm32_mcp.delta_flash import _runs, sector_contents  # noqa: E402
+
+BASE = 0x08000000
+F4_SECTORS = (
+    [(BASE + i * 0x4000, 0x4000) for i in range(4)]
+    + [(BASE + 0x10000, 0x10000)]
+    + [(BASE + 0x20000 * i, 0x20000) for i in range(1, 4)]
+)
+
+
+class TestSectorContents(unittest.TestCase):
+    """Map image segments onto flash sectors"""
+
+    def test_single_sector_padded_with_erased_bytes(self):
+        contents = sector_contents([(BASE + 0x10, b"\x01\x02")], F4_SECTORS)
+        self.assertEqual(list(contents), [0])
+        self.assertEqual(len(contents[0]), 0x4000)
+        self.assertEqual(contents[0][0x10:0x12], b"\x01\x02")
+        self.assertEqual(contents[0][:0x10], b"\xff" * 0x10)
+
+    def test_segment_across_sector_boundary(self):
+        data = bytes(range(256)) * 2
+        contents = sector_contents([(BASE + 0x4000 - 256, data)], F4_SECTORS)
+        self.assertEqual(sorted(contents), [0, 1])
+        self.assertEqual(contents[0][-256:], data[:256])
+        self.assertEqual(contents[1][:256], data[256:])
+
+    def test_segment_across_64k_boundary(self):
+        # 0x0800FFF0..0x08010010 spans sector 3 (16 KiB) and sector 4 (64 KiB)
+        data = b"\xaa" * 0x20
+        contents = sector_contents([(BASE + 0xFFF0, data)], F4_SECTORS)
+        self.assertEqual(sorted(contents), [3, 4])
+        self.assertEqual(len(contents[4]), 0x10000)
+        self.assertEqual(contents[3][-0x10:], b"\xaa" * 0x10)
+        self.assertEqual(contents[4][:0x10], b"\xaa" * 0x10)
+
+    def test_several_segments_share_a_sector(self):
+        contents = sector_contents(
+            [(BASE + 0x100, b"\x02"), (BASE, b"\x01"), (BASE + 0x8000, b"\x03")], F4_SECTORS
+        )
+        self.assertEqual(sorted(contents), [0, 2])
+        self.assertEqual(contents[0][0], 1)
+        self.assertEqual(contents[0][0x100], 2)
+        self.assertEqual(contents[2][0], 3)
+
+    def test_image_before_flash_returns_none(self):
+        self.assertIsNone(sector_contents([(0x20000000, b"\x00")], F4_SECTORS))
+
+    def test_image_past_flash_end_returns_none(self):
+        end = F4_SECTORS[-1][0] + F4_SECTORS[-1][1]
+        self.assertIsNone(sector_contents([(end - 4, b"\x00" * 8)], F4_SECTORS))
+
+    def test_image_in_gap_between_banks_returns_none(self):
+        sectors = [(BASE, 0x4000), (BASE + 0x100000, 0x4000)]
+        self.assertIsNone(sector_contents([(BASE + 0x8000, b"\x00")], sectors))
+
+
+class TestRuns(unittest.TestCase):
+    """Group dirty sectors into contiguous runs"""
+
+    def test_runs(self):
+        self.assertEqual(_runs([0, 1, 2, 5, 7, 8]), [(0, 2), (5, 5), (7, 8)])
+
+    def test_no_runs(self):
+        self.assertEqual(_runs([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Unit tests for the sparse firmware image reader
+
+Covers Intel HEX round trips, segment coalescing and overlap rejection,
+and format detection by file contents.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from stm32_mcp.image import SparseImage, parse_hex, read_image, write_hex  # noqa: E402
+
+
+class TestHexRoundTrip(unittest.TestCase):
+    """write_hex output parses back to the same segments"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "image.hex"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def roundtrip(self, segments):
+        write_hex(segments, self.path)
+        return read_image(self.path).segments
+
+    def test_single_segment(self):
+        segments = [(0x08000000, bytes(range(256)) * 3)]
+        self.assertEqual(self.roundtrip(segments), segments)
+
+    def test_segment_across_64k_boundary(self):
+        segments = [(0x0800FFF5, bytes(range(40)))]
+        self.assertEqual(self.roundtrip(segments), segments)
+        # no data record may wrap past a 64 KiB boundary
+        for line in self.path.read_text().splitlines():
+            record = bytes.fromhex(line[1:])
+            if record[3] == 0:
+                self.assertLessEqual((record[1] << 8 | record[2]) + record[0], 0x10000)
+
+    def test_gaps_are_kept(self):
+        segments = [(0x08000000, b"\x01" * 20), (0x08004000, b"\x02" * 5), (0x08020000, b"\x03")]
+        self.assertEqual(self.roundtrip(segments), segments)
+
+    def test_bad_checksum_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_hex(b":0100000001FF\n")
+
+
+class TestSparseImage(unittest.TestCase):
+    """Segment normalisation"""
+
+    def test_adjacent_segments_are_merged(self):
+        image = SparseImage([(0x100, b"\x02"), (0xFF, b"\x01"), (0x200, b"\x03")])
+        self.assertEqual(image.segments, [(0xFF, b"\x01\x02"), (0x200, b"\x03")])
+        self.assertEqual((image.start, image.end, image.size), (0xFF, 0x201, 3))
+
+    def test_overlap_rejected(self):
+        with self.assertRaises(ValueError):
+            SparseImage([(0x100, b"\x00" * 16), (0x10F, b"\x00")])
+
+    def test_to_bin_fills_gaps(self):
+        image = SparseImage([(0x10, b"\x01"), (0x13, b"\x02")])
+        self.assertEqual(image.to_bin(), b"\x01\xff\xff\x02")
+
+
+class TestReadImage(unittest.TestCase):
+    """Format detection"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bin_placed_at_address(self):
+        path = self.dir / "image.bin"
+        path.write_bytes(b":\x01\x02")  # starts like HEX, but the extension says bin
+        image = read_image(path, 0x08004000)
+        self.assertEqual(image.format, "bin")
+        self.assertEqual(image.segments, [(0x08004000, b":\x01\x02")])
+
+    def test_invalid_hex_rejected(self):
+        path = self.dir / "image.hex"
+        path.write_bytes(b"\x00\x01\x02")
+        with self.assertRaises(ValueError):
+            read_image(path)
+
+
+if __name__ == '__main__':
+    unittest.main()